@@ -1,35 +1,510 @@
 import sqlite3
+import atexit
+import base64
+import collections
+import cProfile
+import copy
+import hashlib
+import json
+import logging
+import logging.handlers
+import multiprocessing
 import os
-import traceback
-import os
-from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory, g, render_template, redirect, url_for, session, flash
+import queue
+import random
+import re
+import secrets
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Literal
+from flask import Flask, request, jsonify, send_from_directory, g, render_template, redirect, url_for, session, flash, has_request_context, stream_with_context
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_session import Session
 import functools
+import itertools
+import msgspec
+from flask.json.provider import JSONProvider
 from werkzeug.utils import secure_filename
+import click
+
+try:
+    from PIL import Image, ImageOps
+except ImportError: # Pillow es opcional: sin él no se generan miniaturas y se sirve la foto original
+    Image = ImageOps = None
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError: # prometheus_client es opcional: sin él no se recogen métricas y /metrics responde 404
+    prometheus_client = multiprocess = None
 
-print("--- APP.PY CARGADO Y EJECUTÁNDOSE - VERSIÓN: 2025-07-18_FINAL ---") # <<-- AÑADE ESTO
 
 # --- Configuración de la Aplicación Flask ---
 app = Flask(__name__, static_folder='static', template_folder='templates') 
 
-# Configuración de Flask-Session
+# Configuración de sesiones
+# SESSION_BACKEND: 'cookie' (cookie firmada con SECRET_KEY: la sesión solo guarda user_id, username,
+# email, is_admin y player_id), 'sqlite' (tabla Sessions en tournament.db con barrido periódico de
+# expiradas) o 'filesystem' (Flask-Session, un archivo por sesión). Por defecto 'cookie' si se ha
+# definido FLASK_SECRET_KEY y 'sqlite' si no: con la clave de desarrollo las cookies serían falsificables.
+app.config['SESSION_BACKEND'] = os.environ.get(
+    'SESSION_BACKEND', 'cookie' if os.environ.get('FLASK_SECRET_KEY') else 'sqlite'
+).lower()
 app.config["SESSION_PERMANENT"] = False
-app.config["SESSION_TYPE"] = "filesystem"
-Session(app)
+app.config["SESSION_TYPE"] = "filesystem" # Solo para SESSION_BACKEND=filesystem
+app.config['SESSION_FILE_DIR'] = os.environ.get('SESSION_FILE_DIR', os.path.join(app.root_path, 'flask_session'))
+# Cada cuántos segundos se borran las filas expiradas de Sessions e IdempotencyKeys (0 desactiva el hilo).
+# SESSION_SWEEP_INTERVAL es el nombre anterior de la variable y se sigue aceptando.
+app.config['EXPIRED_ROWS_SWEEP_INTERVAL'] = float(
+    os.environ.get('EXPIRED_ROWS_SWEEP_INTERVAL', os.environ.get('SESSION_SWEEP_INTERVAL', '600'))
+)
 
 # Configuración para la subida de archivos
 UPLOAD_FOLDER = os.path.join(app.root_path, 'static', 'uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
+app.config['MAX_UPLOAD_BYTES'] = int(os.environ.get('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+# Miniaturas cuadradas de las fotos de jugador (lado en px): 'sm' para el ranking, 'md' para el panel
+app.config['THUMBNAIL_SIZES'] = {'sm': 96, 'md': 320}
+app.config['THUMBNAIL_FORMAT'] = os.environ.get('THUMBNAIL_FORMAT', 'webp').lower() # 'webp' o 'jpeg'
+app.config['THUMBNAIL_WORKERS'] = int(os.environ.get('THUMBNAIL_WORKERS', '1')) # Procesos por worker
+
+# Recursos estáticos: url_for('static', ...) emite nombres con huella del contenido
+# (style.<hash>.css) que se sirven con Cache-Control inmutable. '0' lo desactiva (desarrollo).
+app.config['STATIC_FINGERPRINTS'] = os.environ.get('STATIC_FINGERPRINTS', '1') == '1'
+app.config['STATIC_IMMUTABLE_MAX_AGE'] = 365 * 24 * 3600
+
+# Listados de partidos: ?limit=&cursor= (paginación por cursor) y salida JSON o NDJSON en streaming
+app.config['MATCH_PAGE_MAX_LIMIT'] = int(os.environ.get('MATCH_PAGE_MAX_LIMIT', '500'))
+app.config['STREAM_CHUNK_BYTES'] = 64 * 1024 # Tamaño de cada trozo enviado al cliente
+
+# Envío de resultados: una respuesta guardada por Idempotency-Key se reutiliza durante este tiempo
+app.config['IDEMPOTENCY_TTL_HOURS'] = float(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24'))
+# Plazo de la reserva mientras la petición original se procesa: si el worker muere antes de guardar
+# la respuesta, pasado este tiempo un reintento con la misma clave puede volver a reservarla.
+app.config['IDEMPOTENCY_CLAIM_LEASE_SECONDS'] = float(os.environ.get('IDEMPOTENCY_CLAIM_LEASE_SECONDS', '60'))
 
 # Configuración de la base de datos y clave secreta
 app.config['DATABASE'] = os.path.join(app.instance_path, 'tournament.db')
-app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY', 'dev_default_secret_key_if_env_not_set')
+DEV_SECRET_KEY = 'dev_default_secret_key_if_env_not_set'
+app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY', DEV_SECRET_KEY)
+
+# Hash de contraseñas: método de werkzeug con su factor de trabajo (p. ej. 'scrypt:32768:8:1' o
+# 'pbkdf2:sha256:600000'). Si cambia, los hashes antiguos se regeneran en el siguiente login.
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+# Hashes simultáneos por worker y cuántos pueden esperar turno; scrypt usa ~32 MB por hash
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '16'))
+app.config['PASSWORD_HASH_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_TIMEOUT', '5')) # Segundos esperando turno
 os.makedirs(app.instance_path, exist_ok=True)
 
+# --- Registro Estructurado (logging) ---
+# LOG_LEVEL fija el nivel global; LOG_LEVELS permite niveles por módulo, p. ej.
+# "torneo.db=DEBUG,torneo.auth=WARNING,werkzeug=WARNING". Con DEBUG desactivado las llamadas
+# logger.debug(...) no formatean nada: los argumentos se interpolan solo si el nivel está habilitado.
+app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO').upper()
+app.config['LOG_LEVELS'] = os.environ.get('LOG_LEVELS', '')
+app.config['LOG_FORMAT'] = os.environ.get('LOG_FORMAT', 'json') # 'json' o 'text'
+# Fracción de registros DEBUG que se emiten (1.0 = todos) para poder activar DEBUG en producción
+app.config['LOG_DEBUG_SAMPLE_RATE'] = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', '1.0'))
+
+logger = logging.getLogger('torneo')
+db_logger = logging.getLogger('torneo.db')
+auth_logger = logging.getLogger('torneo.auth')
+
+
+class RequestContextFilter(logging.Filter):
+    """Añade request_id, path y user_id de la petición en curso a cada registro."""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.path = request.path
+            record.user_id = session.get('user_id')
+        else:
+            record.request_id = record.path = record.user_id = None
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Deja pasar solo una fracción de los registros DEBUG; el resto de niveles pasa siempre."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or self.rate >= 1.0 or random.random() < self.rate
+
+
+class JSONLogFormatter(logging.Formatter):
+    """Una línea JSON por registro. Se ejecuta en el hilo del QueueListener, no en el de la petición."""
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'func': record.funcName,
+            'pid': record.process,
+        }
+        for key in ('request_id', 'path', 'user_id'):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """Encola el registro; el formateo y la escritura en stderr ocurren en el hilo del listener."""
+
+    def prepare(self, record):
+        # En el hilo de la petición solo se resuelve el mensaje (los args pueden mutar después)
+        # y el traceback, que deja de existir al salir del except.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _parse_log_levels(spec):
+    levels = {}
+    for item in spec.split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+_log_queue = queue.SimpleQueue()
+_log_output_handler = logging.StreamHandler(sys.stderr)
+if app.config['LOG_FORMAT'] == 'json':
+    _log_output_handler.setFormatter(JSONLogFormatter())
+else:
+    _log_output_handler.setFormatter(logging.Formatter(
+        '%(asctime)s %(levelname)s %(name)s [%(request_id)s %(path)s user=%(user_id)s] %(message)s'))
+_log_listener = None
+
+def _start_log_listener():
+    # Cada proceso necesita su propio hilo listener (los hilos no sobreviven al fork de gunicorn)
+    global _log_listener
+    _log_listener = logging.handlers.QueueListener(_log_queue, _log_output_handler)
+    _log_listener.start()
+
+def configure_logging():
+    queue_handler = AsyncQueueHandler(_log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    queue_handler.addFilter(DebugSamplingFilter(app.config['LOG_DEBUG_SAMPLE_RATE']))
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(app.config['LOG_LEVEL'])
+    for name, level in _parse_log_levels(app.config['LOG_LEVELS']).items():
+        logging.getLogger(name).setLevel(level)
+    _start_log_listener()
+    os.register_at_fork(after_in_child=_start_log_listener)
+    atexit.register(lambda: _log_listener.stop())
+
+configure_logging()
+
+@app.before_request
+def assign_request_id():
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+
+@app.after_request
+def add_request_id_header(response):
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+# --- Métricas (formato de exposición de Prometheus) ---
+# GET /metrics. Con gunicorn, PROMETHEUS_MULTIPROC_DIR debe apuntar a un directorio que se vacía
+# antes de arrancar el master: cada worker escribe ahí sus valores y /metrics suma los de todos.
+# El hook child_exit de gunicorn.conf.py marca como terminado a cada worker que sale.
+# Sin esa variable (servidor de desarrollo, un solo proceso) se usa el registro en memoria.
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN') # Si se define, /metrics exige 'Authorization: Bearer <token>'
+
+REQUEST_LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+SQL_LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0)
+WAIT_BUCKETS = (.001, .005, .01, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+
+class AppMetrics:
+    """Métricas de la aplicación: una instancia por proceso, creada al importar app.py.
+
+    En modo multiproceso cada worker escribe sus valores en su propio archivo de
+    PROMETHEUS_MULTIPROC_DIR; los gauges usan 'livesum' para ignorar los workers ya terminados
+    (el master los marca en child_exit, ver gunicorn.conf.py).
+    """
+
+    def __init__(self):
+        self.multiprocess_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+        if self.multiprocess_dir:
+            os.makedirs(self.multiprocess_dir, exist_ok=True)
+        Counter, Gauge, Histogram = prometheus_client.Counter, prometheus_client.Gauge, prometheus_client.Histogram
+
+        self.request_seconds = Histogram(
+            'torneo_http_request_duration_seconds', 'Latencia de las peticiones por endpoint.',
+            ['endpoint', 'method'], buckets=REQUEST_LATENCY_BUCKETS)
+        self.requests = Counter(
+            'torneo_http_requests_total', 'Peticiones atendidas por endpoint y código de estado.',
+            ['endpoint', 'method', 'status'])
+        self.sql_seconds = Histogram(
+            'torneo_sql_duration_seconds', 'Tiempo en SQLite por petición.',
+            ['endpoint'], buckets=SQL_LATENCY_BUCKETS)
+        self.sql_statements = Histogram(
+            'torneo_sql_statements', 'Sentencias SQL ejecutadas por petición.',
+            ['endpoint'], buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89))
+        self.sql_n_plus_one = Counter(
+            'torneo_sql_n_plus_one_total', 'Peticiones con una sentencia repetida SQL_N_PLUS_ONE_THRESHOLD veces o más.',
+            ['endpoint'])
+        self.db_pool_connections = Gauge(
+            'torneo_db_pool_connections', 'Conexiones del pool SQLite por estado (open, in_use).',
+            ['state'], multiprocess_mode='livesum')
+        self.db_pool_wait_seconds = Histogram(
+            'torneo_db_pool_wait_seconds', 'Espera por una conexión libre con el pool agotado.',
+            buckets=WAIT_BUCKETS)
+        self.db_pool_timeouts = Counter(
+            'torneo_db_pool_timeouts_total', 'Peticiones que agotaron DB_POOL_TIMEOUT esperando una conexión.')
+        self.cache_requests = Counter(
+            'torneo_cache_requests_total', 'Consultas a las cachés (active_tournament, ladder, etag) por resultado.',
+            ['cache', 'result'])
+        self.session_seconds = Histogram(
+            'torneo_session_store_duration_seconds', 'Latencia del almacén de sesiones.',
+            ['backend', 'operation'], buckets=SQL_LATENCY_BUCKETS)
+        self.write_lock_wait_seconds = Histogram(
+            'torneo_write_lock_wait_seconds', 'Espera por el lock de escritura (BEGIN IMMEDIATE).',
+            ['operation'], buckets=WAIT_BUCKETS)
+        self.write_lock_retries = Counter(
+            'torneo_write_lock_retries_total', 'Reintentos de BEGIN IMMEDIATE por SQLITE_BUSY.', ['operation'])
+        self.write_lock_timeouts = Counter(
+            'torneo_write_lock_timeouts_total', 'Escrituras rechazadas con 503 tras agotar WRITE_LOCK_ATTEMPTS.',
+            ['operation'])
+
+    def cache_result(self, cache, hit):
+        self.cache_requests.labels(cache, 'hit' if hit else 'miss').inc()
+
+    def render(self):
+        if self.multiprocess_dir:
+            registry = prometheus_client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = prometheus_client.REGISTRY
+        return prometheus_client.generate_latest(registry)
+
+
+metrics = AppMetrics() if prometheus_client is not None and app.config['METRICS_ENABLED'] else None
+
+@app.before_request
+def start_request_timer():
+    if metrics is not None:
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_started' in g:
+        # Las rutas inexistentes comparten etiqueta para no crear una serie por URL
+        endpoint = request.endpoint or 'sin_ruta'
+        metrics.request_seconds.labels(endpoint, request.method).observe(time.perf_counter() - g.request_started)
+        metrics.requests.labels(endpoint, request.method, str(response.status_code)).inc()
+    return response
+
+# --- Serialización JSON (msgspec) ---
+def _msgspec_enc_hook(obj):
+    # Tipos que msgspec no conoce de forma nativa
+    if isinstance(obj, sqlite3.Row):
+        return dict(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Objeto de tipo {type(obj).__name__} no es serializable a JSON")
+
+
+class MsgspecJSONProvider(JSONProvider):
+    """Proveedor JSON de Flask respaldado por msgspec: jsonify() y request.get_json() lo usan.
+
+    Codifica dicts, listas y Structs directamente a bytes UTF-8 sin pasar por un str intermedio.
+    """
+
+    def __init__(self, app):
+        super().__init__(app)
+        self._encoder = msgspec.json.Encoder(enc_hook=_msgspec_enc_hook)
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, obj, **kwargs):
+        return self._encoder.encode(obj).decode('utf-8')
+
+    def dumps_bytes(self, obj):
+        return self._encoder.encode(obj)
+
+    def loads(self, s, **kwargs):
+        try:
+            return self._decoder.decode(s)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e # Flask/Werkzeug esperan ValueError para JSON inválido
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._encoder.encode(obj), mimetype='application/json')
+
+app.json = MsgspecJSONProvider(app)
+
+# --- Modelos de Respuesta (msgspec) ---
+# Los campos que vienen de la DB van primero y en el mismo orden que el SELECT (que se genera a
+# partir de ellos), para poder construir cada Struct posicionalmente con Model(*row, ...).
+# Los campos calculados en Python van al final, con valor por defecto.
+
+class PlayerOut(msgspec.Struct):
+    id: int
+    first_name: str
+    last_name: str
+    email: str
+    phone: str | None
+    gender: str | None
+    birth_date: str | None
+    location: str | None
+    dominant_hand: str | None
+    backhand_type: str | None
+    racquet: str | None
+    photo_url: str | None
+    initial_position: int
+    current_position: int
+    points: int | None
+    activity_index_single: int | None
+    challenges_emitted_single: int | None
+    challenges_accepted_single: int | None
+    challenges_won_single: int | None
+    defenses_successful_single: int | None
+    activity_status_single: str | None
+    activity_index_doubles: int | None
+    challenges_emitted_doubles: int | None
+    challenges_accepted_doubles: int | None
+    challenges_won_doubles: int | None
+    defenses_successful_doubles: int | None
+    activity_status_doubles: str | None
+    rejections_current_cycle: int | None
+    rejections_total: int | None
+    activity_status: str | None
+    last_activity_update: str | None
+    last_challenge_received_date: str | None
+    # Calculados
+    name: str = ''
+    last_activity_update_formatted: str = 'Nunca'
+
+
+class SinglesMatchOut(msgspec.Struct):
+    id: int
+    date: str | None
+    score_text: str | None
+    challenger_first_name: str
+    challenger_last_name: str
+    challenged_first_name: str
+    challenged_last_name: str
+    winner_first_name: str
+    winner_last_name: str
+    loser_first_name: str
+    loser_last_name: str
+    tournament_name: str
+    match_type: str
+    # Calculados
+    challenger_name: str = ''
+    challenged_name: str = ''
+    winner_name: str = ''
+    loser_name: str = ''
+
+
+class DoublesMatchOut(msgspec.Struct):
+    id: int
+    date: str | None
+    score_text: str | None
+    team_a_name: str
+    team_b_name: str
+    winner_team_name: str
+    loser_team_name: str
+    tournament_name: str
+    # Calculados (alias de los nombres de equipo, para consistencia con individuales en el frontend)
+    challenger_name: str = ''
+    challenged_name: str = ''
+    winner_name: str = ''
+    loser_name: str = ''
+
+
+class PlayerHistorySingleOut(msgspec.Struct):
+    id: int
+    date: str | None
+    score_text: str | None
+    winner_id: int
+    loser_id: int
+    challenger_id: int
+    challenged_id: int
+    challenger_first_name: str
+    challenger_last_name: str
+    challenged_first_name: str
+    challenged_last_name: str
+    winner_first_name: str
+    winner_last_name: str
+    loser_first_name: str
+    loser_last_name: str
+    match_type: str
+    # Calculados
+    challenger_name: str = ''
+    challenged_name: str = ''
+    winner_name: str = ''
+    loser_name: str = ''
+
+
+class PlayerHistoryDoublesOut(msgspec.Struct):
+    id: int
+    date: str | None
+    score_text: str | None
+    winner_team_id: int | None
+    loser_team_id: int | None
+    team_a_name: str
+    team_b_name: str
+    winner_team_name: str
+    loser_team_name: str
+    match_type: str
+    # Calculados
+    challenger_name: str = ''
+    challenged_name: str = ''
+    winner_name: str = ''
+    loser_name: str = ''
+
+
+class ChallengeEligibilityOut(msgspec.Struct):
+    id: int
+    position: int
+    targets: list[int]
+
+
+def _struct_db_columns(model):
+    # Campos de un modelo que vienen de la DB (los que no tienen valor por defecto)
+    return model.__struct_fields__[:len(model.__struct_fields__) - len(model.__struct_defaults__)]
+
+# photo_url apunta a la miniatura del tamaño pedido (parámetro ?) si ya existe, si no a la foto
+# original. Requiere `FROM Players p LEFT JOIN Uploads u ON u.filename = p.photo_url`.
+PHOTO_URL_SQL = (
+    "COALESCE(substr(u.sha256, 1, 2) || '/' || u.sha256 || '_' || ? || '.' || u.thumbnail_format, "
+    "p.photo_url) AS photo_url"
+)
+PLAYER_OUT_COLUMNS = ', '.join(
+    PHOTO_URL_SQL if column == 'photo_url' else f'p.{column}' for column in _struct_db_columns(PlayerOut)
+)
+
+# Perfil de jugador vinculado a la cuenta de la sesión
+USER_PLAYER_LINK_SQL = 'SELECT player_id FROM UserPlayersLink WHERE user_id = ?'
+
 # --- Decorador para Proteger Rutas ---
 def login_required(view):
     @functools.wraps(view)
@@ -40,18 +515,667 @@ def login_required(view):
         return view(**kwargs)
     return wrapped_view
 
+def idempotent(view):
+    """Hace que los reintentos con la misma cabecera Idempotency-Key reciban la respuesta original.
+
+    La primera petición reserva la clave (fila sin respuesta, válida IDEMPOTENCY_CLAIM_LEASE_SECONDS)
+    antes de ejecutar la vista y guarda su respuesta al terminar, ya con el TTL completo; una
+    repetición con el mismo cuerpo la recibe tal cual, sin tocar la pirámide. Misma clave con otro
+    cuerpo: 422; original aún en curso: 409. Si la vista falla (5xx o excepción) la reserva se libera
+    para que el cliente pueda reintentar; si el worker muere, la reserva caduca con su plazo.
+    Sin cabecera, la vista se ejecuta como siempre. Va debajo de @login_required.
+
+    Las vistas que escriben llaman a store_idempotent_response justo antes de su commit, así la
+    respuesta queda guardada en la misma transacción que el resultado: un worker que muere después
+    del commit ya dejó la respuesta para el reintento, y una vista que se pasa del plazo de su reserva
+    (y pierde la clave ante un reintento) deshace su escritura en vez de aplicarla dos veces. Para las
+    vistas que no lo llaman, la respuesta se guarda después, en otra transacción: si el worker muere
+    entre ambas o la vista supera el plazo, un reintento puede volver a ejecutarla.
+    """
+    @functools.wraps(view)
+    def wrapped_view(**kwargs):
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key is None:
+            return view(**kwargs)
+        if not 1 <= len(idempotency_key) <= 255:
+            return jsonify({"error": "Idempotency-Key debe tener entre 1 y 255 caracteres."}), 400
+
+        db = get_db()
+        scope = f"{session.get('user_id')}:{request.endpoint}"
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+        now = time.time()
+        try:
+            # Reservar la clave; se puede reutilizar una fila caducada que el barrido aún no borró: una
+            # respuesta guardada pasado el TTL o una reserva cuya petición no terminó dentro del plazo
+            claimed = db.execute(
+                """INSERT INTO IdempotencyKeys (scope, idempotency_key, request_hash, created_at, expires_at)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(scope, idempotency_key) DO UPDATE SET
+                       request_hash = excluded.request_hash, status_code = NULL, response_body = NULL,
+                       content_type = NULL, created_at = excluded.created_at, expires_at = excluded.expires_at
+                   WHERE IdempotencyKeys.expires_at <= excluded.created_at""",
+                (scope, idempotency_key, request_hash, now, now + app.config['IDEMPOTENCY_CLAIM_LEASE_SECONDS'])
+            ).rowcount
+            db.commit()
+            if not claimed:
+                stored = db.execute(
+                    """SELECT request_hash, status_code, response_body, content_type FROM IdempotencyKeys
+                       WHERE scope = ? AND idempotency_key = ?""",
+                    (scope, idempotency_key)
+                ).fetchone()
+                if stored is None or stored['status_code'] is None:
+                    response = jsonify({"error": "Ya hay una petición en curso con esta Idempotency-Key."})
+                    response.headers['Retry-After'] = '1'
+                    return response, 409
+                if stored['request_hash'] != request_hash:
+                    return jsonify({"error": "Esta Idempotency-Key ya se usó con otros datos."}), 422
+                response = app.response_class(stored['response_body'], status=stored['status_code'],
+                                              content_type=stored['content_type'])
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+        except sqlite3.Error as e:
+            db.rollback()
+            if _is_busy_error(e):
+                return write_busy_response()
+            logger.error("DB: [idempotent] Error de SQLite: %s", e)
+            return jsonify({"error": "Error de base de datos al verificar la Idempotency-Key."}), 500
+
+        # created_at identifica la reserva propia: si caducó y otro reintento la tomó, no se toca la suya
+        def release_claim():
+            db.rollback()
+            db.execute(
+                "DELETE FROM IdempotencyKeys WHERE scope = ? AND idempotency_key = ? AND created_at = ? AND status_code IS NULL",
+                (scope, idempotency_key, now)
+            )
+            db.commit()
+
+        g.idempotency_claim = (scope, idempotency_key, now)
+        try:
+            response = app.make_response(view(**kwargs))
+        except Exception:
+            release_claim()
+            raise
+        try:
+            if response.status_code >= 500:
+                release_claim()
+            elif g.pop('idempotency_stored', False):
+                pass # La vista ya la guardó junto con su escritura
+            else:
+                if db.in_transaction:
+                    db.rollback() # Lo que la vista no confirmó (p. ej. un 4xx a mitad de camino) no se confirma aquí
+                db.execute(
+                    """UPDATE IdempotencyKeys SET status_code = ?, response_body = ?, content_type = ?, expires_at = ?
+                       WHERE scope = ? AND idempotency_key = ? AND created_at = ?""",
+                    (response.status_code, response.get_data(), response.content_type,
+                     time.time() + app.config['IDEMPOTENCY_TTL_HOURS'] * 3600, scope, idempotency_key, now)
+                )
+                db.commit()
+        except sqlite3.Error as e:
+            # El resultado ya quedó confirmado: devolverlo igual; la reserva caduca con su plazo
+            db.rollback()
+            logger.error("DB: [idempotent] No se pudo guardar la respuesta de %s: %s", scope, e)
+        return response
+    return wrapped_view
+
+def store_idempotent_response(response):
+    """Guarda la respuesta de una vista @idempotent dentro de la transacción abierta de la vista.
+
+    Se llama justo antes del commit de la vista. Sin Idempotency-Key no hace nada. Lanza
+    IdempotencyClaimLost si la reserva ya no es de esta petición (caducó y la tomó un reintento):
+    la vista debe deshacer su transacción para no aplicar el resultado dos veces.
+    """
+    claim = g.get('idempotency_claim')
+    if claim is None:
+        return
+    scope, idempotency_key, created_at = claim
+    updated = get_db().execute(
+        """UPDATE IdempotencyKeys SET status_code = ?, response_body = ?, content_type = ?, expires_at = ?
+           WHERE scope = ? AND idempotency_key = ? AND created_at = ? AND status_code IS NULL""",
+        (response.status_code, response.get_data(), response.content_type,
+         time.time() + app.config['IDEMPOTENCY_TTL_HOURS'] * 3600, scope, idempotency_key, created_at)
+    ).rowcount
+    if not updated:
+        raise IdempotencyClaimLost(scope)
+    g.idempotency_stored = True
+
+# Configuración del pool de conexiones SQLite (uno por proceso/worker de gunicorn)
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', '8'))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+app.config['DB_STATEMENT_CACHE_SIZE'] = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', '256'))
+# Perfil de PRAGMAs que se aplica UNA sola vez al abrir cada conexión del pool.
+# WAL permite que los lectores (/api/players, etc.) no se bloqueen mientras se
+# confirma un resultado. busy_timeout va primero: cambiar a WAL requiere un lock.
+app.config['SQLITE_PRAGMAS'] = {
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'), # NORMAL es seguro en WAL
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', '-16000')), # Negativo = KiB (~16 MB)
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', str(128 * 1024 * 1024))),
+    'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+    'wal_autocheckpoint': int(os.environ.get('SQLITE_WAL_AUTOCHECKPOINT', '1000')), # En páginas
+}
+# Checkpoint periódico del WAL (además del autocheckpoint) para que el archivo -wal no crezca
+# sin límite cuando siempre hay lectores activos. 0 desactiva el hilo de checkpoint.
+app.config['SQLITE_CHECKPOINT_INTERVAL'] = float(os.environ.get('SQLITE_CHECKPOINT_INTERVAL', '300'))
+app.config['SQLITE_CHECKPOINT_MODE'] = os.environ.get('SQLITE_CHECKPOINT_MODE', 'PASSIVE')
+# Escrituras de la pirámide: BEGIN IMMEDIATE espera el lock de escritura hasta busy_timeout; si aun
+# así está ocupado se reintenta con espera exponencial (base .. tope, con jitter) y al agotar los
+# intentos el endpoint responde 503 en vez de 500.
+app.config['WRITE_LOCK_ATTEMPTS'] = int(os.environ.get('WRITE_LOCK_ATTEMPTS', '3'))
+app.config['WRITE_LOCK_BACKOFF_MS'] = float(os.environ.get('WRITE_LOCK_BACKOFF_MS', '50'))
+app.config['WRITE_LOCK_BACKOFF_MAX_MS'] = float(os.environ.get('WRITE_LOCK_BACKOFF_MAX_MS', '1000'))
+# Instrumentación SQL por petición: cuántas sentencias, cuánto tiempo en SQLite y qué sentencia se
+# repite. Con app.debug (o SQL_DEBUG_HEADERS=1) se devuelve en cabeceras X-SQL-*; siempre va al log.
+# Una misma sentencia ejecutada SQL_N_PLUS_ONE_THRESHOLD veces o más se registra como posible N+1.
+app.config['SQL_INSTRUMENTATION'] = os.environ.get('SQL_INSTRUMENTATION', '1') == '1'
+app.config['SQL_DEBUG_HEADERS'] = os.environ.get('SQL_DEBUG_HEADERS', '0') == '1'
+app.config['SQL_N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', '5'))
+
+# --- Pool de Conexiones SQLite ---
+class DBPoolTimeout(sqlite3.OperationalError):
+    """No se liberó ninguna conexión del pool dentro de DB_POOL_TIMEOUT."""
+
+
+class WriteLockTimeout(RuntimeError):
+    """BEGIN IMMEDIATE no consiguió el lock de escritura en WRITE_LOCK_ATTEMPTS intentos (503)."""
+
+
+class IdempotencyClaimLost(RuntimeError):
+    """La reserva de la Idempotency-Key caducó y la tomó otra petición antes del commit de la vista (409)."""
+
+
+class WriteLockStats:
+    """Métricas por proceso de la espera por el lock de escritura, agrupadas por operación."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_name = {}
+
+    def record(self, name, wait_seconds, retries, timed_out):
+        with self._lock:
+            entry = self._by_name.setdefault(name, {
+                'transactions': 0, 'retries': 0, 'timeouts': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0,
+            })
+            entry['transactions'] += 1
+            entry['retries'] += retries
+            entry['timeouts'] += int(timed_out)
+            entry['wait_ms_total'] += wait_seconds * 1000
+            entry['wait_ms_max'] = max(entry['wait_ms_max'], wait_seconds * 1000)
+        if metrics is not None:
+            metrics.write_lock_wait_seconds.labels(name).observe(wait_seconds)
+            if retries:
+                metrics.write_lock_retries.labels(name).inc(retries)
+            if timed_out:
+                metrics.write_lock_timeouts.labels(name).inc()
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {**entry, 'wait_ms_total': round(entry['wait_ms_total'], 3),
+                       'wait_ms_max': round(entry['wait_ms_max'], 3)}
+                for name, entry in self._by_name.items()
+            }
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """Forma de una sentencia sin espacios extra ni literales: dos consultas con la misma forma son la misma."""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\?(?:\s*,\s*\?)+', '?, ...', sql) # IN (?, ?, ?) con cualquier número de elementos
+    return ' '.join(sql.split())
+
+
+class SQLRequestStats:
+    """Sentencias ejecutadas durante una petición, agrupadas por su forma normalizada.
+
+    El tiempo es el de execute(), que incluye el primer paso de SQLite (el orden, los agregados
+    y la primera fila) pero no el resto de los fetch.
+    """
+
+    __slots__ = ('statements', 'seconds', 'patterns')
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.patterns = collections.Counter()
+
+    def record(self, sql, seconds):
+        self.statements += 1
+        self.seconds += seconds
+        self.patterns[normalize_sql(sql)] += 1
+
+    def max_repeats(self):
+        return max(self.patterns.values(), default=0)
+
+    def repeated(self, threshold):
+        """(sentencia, veces) de las que se ejecutaron al menos `threshold` veces, la más repetida primero."""
+        return [(sql, count) for sql, count in self.patterns.most_common() if count >= threshold]
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor que anota cada sentencia en el SQLRequestStats de su conexión (si la petición tiene uno)."""
+
+    def execute(self, sql, parameters=()):
+        stats = self.connection.sql_stats
+        if stats is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            stats.record(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        stats = self.connection.sql_stats
+        if stats is None:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            stats.record(sql, time.perf_counter() - started)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Conexión del pool que mide sus sentencias mientras `sql_stats` apunte al de la petición en curso.
+
+    Connection.execute no pasa por Cursor.execute, así que los atajos también se miden aquí.
+    """
+
+    sql_stats = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        stats = self.sql_stats
+        if stats is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            stats.record(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        stats = self.sql_stats
+        if stats is None:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            stats.record(sql, time.perf_counter() - started)
+
+    def executescript(self, sql_script):
+        stats = self.sql_stats
+        if stats is None:
+            return super().executescript(sql_script)
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            stats.record(sql_script, time.perf_counter() - started)
+
+
+class SQLiteConnectionPool:
+    """Pool de conexiones SQLite reutilizables dentro de un proceso.
+
+    Las conexiones se crean bajo demanda hasta `size`, se configuran una sola vez
+    (row_factory y PRAGMAs) y se devuelven al pool al terminar cada petición, de
+    modo que conservan el esquema ya parseado y su caché de sentencias.
+    """
+
+    def __init__(self, database, size, timeout, statement_cache_size=256):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.statement_cache_size = statement_cache_size
+        self.pid = os.getpid()
+        # LIFO: reutilizar primero la conexión más "caliente"
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._counters = {
+            'acquired': 0,
+            'reused': 0,
+            'opened': 0,
+            'discarded': 0,
+            'waits': 0,
+            'timeouts': 0,
+        }
+        self._wait_seconds = 0.0
+        self.checkpointer = None
+        self.expired_rows_sweeper = None
+        self.write_locks = WriteLockStats()
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.database,
+            check_same_thread=False, # La conexión puede pasar de un hilo a otro entre peticiones
+            cached_statements=self.statement_cache_size,
+            factory=InstrumentedConnection if app.config['SQL_INSTRUMENTATION'] else sqlite3.Connection,
+        )
+        _configure_connection(conn)
+        return conn
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+            reused = True
+        except queue.Empty:
+            conn = None
+            reused = False
+            with self._lock:
+                can_open = self._created < self.size
+                if can_open:
+                    self._created += 1
+            if can_open:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+                with self._lock:
+                    self._counters['opened'] += 1
+                if metrics is not None:
+                    metrics.db_pool_connections.labels('open').inc()
+            else:
+                # Pool agotado: esperar a que otra petición libere una conexión
+                started = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._counters['timeouts'] += 1
+                    if metrics is not None:
+                        metrics.db_pool_timeouts.inc()
+                    raise DBPoolTimeout("Tiempo de espera agotado esperando una conexión del pool.")
+                finally:
+                    waited = time.perf_counter() - started
+                    with self._lock:
+                        self._counters['waits'] += 1
+                        self._wait_seconds += waited
+                    if metrics is not None:
+                        metrics.db_pool_wait_seconds.observe(waited)
+                reused = True
+
+        with self._lock:
+            self._in_use += 1
+            self._counters['acquired'] += 1
+            if reused:
+                self._counters['reused'] += 1
+        if metrics is not None:
+            metrics.db_pool_connections.labels('in_use').inc()
+        return conn
+
+    def release(self, conn):
+        with self._lock:
+            self._in_use -= 1
+        if metrics is not None:
+            metrics.db_pool_connections.labels('in_use').dec()
+        try:
+            # Nunca devolver al pool una transacción a medias
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+            self._counters['discarded'] += 1
+        if metrics is not None:
+            metrics.db_pool_connections.labels('open').dec()
+
+    def close_all(self):
+        for worker in (self.checkpointer, self.expired_rows_sweeper):
+            if worker is not None:
+                worker.stop()
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'pid': self.pid,
+                'size': self.size,
+                'open': self._created,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'wait_ms_total': round(self._wait_seconds * 1000, 3),
+                **self._counters,
+            }
+        if self.checkpointer is not None:
+            stats['checkpoint'] = self.checkpointer.stats()
+        if self.expired_rows_sweeper is not None:
+            stats['expired_rows_sweeper'] = self.expired_rows_sweeper.stats()
+        stats['write_locks'] = self.write_locks.stats()
+        return stats
+
+
+class WALCheckpointer(threading.Thread):
+    """Hilo que ejecuta `PRAGMA wal_checkpoint` cada `interval` segundos.
+
+    Usa su propia conexión para no competir con las del pool. En modo PASSIVE nunca
+    espera a lectores ni escritores: copia lo que puede y lo reintenta en el siguiente ciclo.
+    """
+
+    def __init__(self, database, interval, mode='PASSIVE'):
+        super().__init__(name='wal-checkpointer', daemon=True)
+        self.database = database
+        self.interval = interval
+        self.mode = mode.upper()
+        self._stop_event = threading.Event()
+        self._runs = 0
+        self._busy = 0
+        self._last = None
+
+    def run(self):
+        conn = sqlite3.connect(self.database, check_same_thread=False)
+        try:
+            _configure_connection(conn)
+            while not self._stop_event.wait(self.interval):
+                self.checkpoint(conn)
+        finally:
+            conn.close()
+
+    def checkpoint(self, conn):
+        try:
+            busy, log_frames, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({self.mode})").fetchone()
+        except sqlite3.Error as e:
+            db_logger.error("DB: [WALCheckpointer] Falló el checkpoint del WAL: %s", e)
+            return
+        self._runs += 1
+        if busy:
+            self._busy += 1
+        self._last = {
+            'at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'log_frames': log_frames,
+            'checkpointed_frames': checkpointed,
+        }
+
+    def stop(self):
+        self._stop_event.set()
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'interval_seconds': self.interval,
+            'runs': self._runs,
+            'busy': self._busy,
+            'last': self._last,
+        }
+
+
+class ExpiredRowsSweeper(threading.Thread):
+    """Hilo que borra cada `interval` segundos las filas expiradas de las tablas con TTL.
+
+    `tables` es una lista de (tabla, clave primaria); todas tienen una columna expires_at (epoch)
+    indexada. Borra por lotes pequeños para no retener el lock de escritura mientras atiende peticiones.
+    """
+
+    def __init__(self, database, interval, tables, batch_size=500):
+        super().__init__(name='expired-rows-sweeper', daemon=True)
+        self.database = database
+        self.interval = interval
+        self.tables = tables
+        self.batch_size = batch_size
+        self._stop_event = threading.Event()
+        self._runs = 0
+        self._deleted = 0
+        self._last = None
+
+    def run(self):
+        conn = sqlite3.connect(self.database, check_same_thread=False)
+        try:
+            _configure_connection(conn)
+            while not self._stop_event.wait(self.interval):
+                self.sweep(conn)
+        finally:
+            conn.close()
+
+    def sweep(self, conn):
+        deleted = {}
+        for table, key_columns in self.tables:
+            deleted[table] = 0
+            try:
+                while True:
+                    cursor = conn.execute(
+                        f"""DELETE FROM {table} WHERE ({key_columns}) IN (
+                               SELECT {key_columns} FROM {table} WHERE expires_at <= ? LIMIT ?)""",
+                        (time.time(), self.batch_size)
+                    )
+                    conn.commit()
+                    deleted[table] += cursor.rowcount
+                    if cursor.rowcount < self.batch_size:
+                        break
+            except sqlite3.Error as e:
+                conn.rollback()
+                db_logger.error("DB: [ExpiredRowsSweeper] Falló el borrado de filas expiradas de %s: %s", table, e)
+        self._runs += 1
+        self._deleted += sum(deleted.values())
+        self._last = {'at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'deleted': deleted}
+
+    def stop(self):
+        self._stop_event.set()
+
+    def stats(self):
+        return {
+            'interval_seconds': self.interval,
+            'runs': self._runs,
+            'deleted': self._deleted,
+            'last': self._last,
+        }
+
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+def _configure_connection(conn):
+    conn.row_factory = sqlite3.Row
+    for pragma, value in app.config['SQLITE_PRAGMAS'].items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+
+def get_db_pool():
+    global _db_pool
+    pool = _db_pool
+    # Crear el pool perezosamente; recrearlo si cambió la ruta de la DB o si el proceso
+    # fue bifurcado (gunicorn --preload) para no compartir conexiones entre workers.
+    if pool is None or pool.pid != os.getpid() or pool.database != app.config['DATABASE']:
+        with _db_pool_lock:
+            pool = _db_pool
+            if pool is None or pool.pid != os.getpid() or pool.database != app.config['DATABASE']:
+                if pool is not None and pool.pid == os.getpid():
+                    pool.close_all()
+                pool = SQLiteConnectionPool(
+                    app.config['DATABASE'],
+                    app.config['DB_POOL_SIZE'],
+                    app.config['DB_POOL_TIMEOUT'],
+                    app.config['DB_STATEMENT_CACHE_SIZE'],
+                )
+                journal_mode = str(app.config['SQLITE_PRAGMAS'].get('journal_mode', '')).upper()
+                if journal_mode == 'WAL' and app.config['SQLITE_CHECKPOINT_INTERVAL'] > 0:
+                    pool.checkpointer = WALCheckpointer(
+                        app.config['DATABASE'],
+                        app.config['SQLITE_CHECKPOINT_INTERVAL'],
+                        app.config['SQLITE_CHECKPOINT_MODE'],
+                    )
+                    pool.checkpointer.start()
+                if app.config['EXPIRED_ROWS_SWEEP_INTERVAL'] > 0:
+                    tables = [('IdempotencyKeys', 'scope, idempotency_key')]
+                    if app.config['SESSION_BACKEND'] == 'sqlite':
+                        tables.append(('Sessions', 'id'))
+                    pool.expired_rows_sweeper = ExpiredRowsSweeper(
+                        app.config['DATABASE'],
+                        app.config['EXPIRED_ROWS_SWEEP_INTERVAL'],
+                        tables,
+                    )
+                    pool.expired_rows_sweeper.start()
+                # Aplicar migraciones pendientes una vez por worker, antes de servir peticiones
+                conn = pool.acquire()
+                try:
+                    apply_migrations(conn)
+                finally:
+                    pool.release(conn)
+                _db_pool = pool
+    return pool
+
 # --- Funciones de Ayuda para DB ---
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(app.config['DATABASE'])
-        g.db.row_factory = sqlite3.Row
+        g.db_pool = get_db_pool()
+        g.db = g.db_pool.acquire()
+        if isinstance(g.db, InstrumentedConnection):
+            g.db.sql_stats = g.sql_stats = SQLRequestStats()
     return g.db
 
 @app.teardown_appcontext
 def close_db(e=None):
     db = g.pop('db', None)
+    pool = g.pop('db_pool', None)
     if db is not None:
-        db.close()
+        if isinstance(db, InstrumentedConnection):
+            db.sql_stats = None # La conexión vuelve al pool: lo que ejecute otro ya no es de esta petición
+        pool.release(db)
+
+# --- Instrumentación SQL por Petición (detector de N+1) ---
+@app.after_request
+def report_sql_stats(response):
+    stats = g.get('sql_stats')
+    if stats is None:
+        return response
+    elapsed_ms = stats.seconds * 1000
+    if app.debug or app.config['SQL_DEBUG_HEADERS']:
+        response.headers['X-SQL-Queries'] = str(stats.statements)
+        response.headers['X-SQL-Time-Ms'] = f"{elapsed_ms:.3f}"
+        response.headers['X-SQL-Max-Repeats'] = str(stats.max_repeats())
+        response.headers.add('Server-Timing', f'db;dur={elapsed_ms:.3f};desc="{stats.statements} sentencias"')
+    db_logger.debug("SQL: %s %s -> %s sentencias en %.3f ms", request.method, request.path, stats.statements, elapsed_ms)
+    repeated = stats.repeated(app.config['SQL_N_PLUS_ONE_THRESHOLD'])
+    for sql, count in repeated:
+        db_logger.warning("SQL: posible N+1 en %s %s (%s): %s ejecuciones de %s",
+                          request.method, request.path, request.endpoint, count, sql[:300])
+    if metrics is not None:
+        endpoint = request.endpoint or 'sin_ruta'
+        metrics.sql_seconds.labels(endpoint).observe(stats.seconds)
+        metrics.sql_statements.labels(endpoint).observe(stats.statements)
+        if repeated:
+            metrics.sql_n_plus_one.labels(endpoint).inc()
+    return response
 
 def init_db():
     db = get_db()
@@ -61,61 +1185,907 @@ def init_db():
         # print(script_content[:500]) # Imprime los primeros 500 caracteres para verificar (temporal)
         db.cursor().executescript(script_content)
     db.commit()
-    print("Base de datos inicializada o actualizada con schema.sql")
+    db_logger.info("Base de datos inicializada o actualizada con schema.sql")
+    apply_migrations(db)
+    clear_local_caches()
+
+# --- Escrituras Serializadas (BEGIN IMMEDIATE) ---
+def _is_busy_error(e):
+    return getattr(e, 'sqlite_errorcode', None) in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+def begin_immediate(db, name):
+    """Abre una transacción de escritura con BEGIN IMMEDIATE antes de leer lo que se va a modificar.
+
+    Así dos envíos simultáneos no leen las mismas posiciones y las intercambian dos veces: el
+    segundo espera a que el primero confirme. La espera dentro de cada intento la hace SQLite
+    (busy_timeout); si vuelve SQLITE_BUSY se reintenta con espera exponencial y, agotados los
+    intentos, se lanza WriteLockTimeout. El tiempo de espera queda en pool.write_locks[name].
+    El commit / rollback sigue siendo del endpoint.
+    """
+    if db.in_transaction:
+        db.rollback() # Nada escrito todavía; empezar limpio para que el BEGIN no falle
+    attempts = max(1, app.config['WRITE_LOCK_ATTEMPTS'])
+    started = time.perf_counter()
+    for attempt in range(attempts):
+        try:
+            db.execute('BEGIN IMMEDIATE')
+        except sqlite3.OperationalError as e:
+            if not _is_busy_error(e):
+                raise
+            if attempt == attempts - 1:
+                g.db_pool.write_locks.record(name, time.perf_counter() - started, attempt, timed_out=True)
+                db_logger.warning("DB: [begin_immediate] %s sin lock de escritura tras %s intentos", name, attempts)
+                raise WriteLockTimeout(f"Base de datos ocupada ({name}).") from e
+            backoff_ms = min(app.config['WRITE_LOCK_BACKOFF_MAX_MS'], app.config['WRITE_LOCK_BACKOFF_MS'] * 2 ** attempt)
+            time.sleep(backoff_ms * random.uniform(0.5, 1.0) / 1000)
+        else:
+            g.db_pool.write_locks.record(name, time.perf_counter() - started, attempt, timed_out=False)
+            return
+
+def write_busy_response():
+    response = jsonify({"error": "La base de datos está ocupada con otras escrituras. Intenta de nuevo en unos segundos."})
+    response.headers['Retry-After'] = '2'
+    return response, 503
+
+
+def claim_lost_response():
+    return jsonify({"error": "Otro reintento con la misma Idempotency-Key tomó la petición; este no se registró."}), 409
+
+
+# --- Migraciones Idempotentes ---
+MIGRATIONS_FOLDER = os.path.join(app.root_path, 'migrations')
+
+def _split_sql_statements(script):
+    # Separa un script en sentencias completas (respeta los ';' dentro de BEGIN...END de triggers)
+    statements = []
+    buffer = ''
+    for line in script.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            statements.append(buffer.strip())
+            buffer = ''
+    return statements
+
+def apply_migrations(db):
+    """Aplica en orden los scripts de migrations/ que aún no constan en SchemaMigrations.
+
+    Cada script se ejecuta dentro de BEGIN IMMEDIATE para que dos workers arrancando a la
+    vez no lo apliquen dos veces. Devuelve la lista de migraciones aplicadas ahora.
+    """
+    base_schema = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Players'"
+    ).fetchone()
+    if base_schema is None:
+        return [] # DB vacía: init_db() aplicará las migraciones después de schema.sql
+
+    db.execute(
+        '''CREATE TABLE IF NOT EXISTS SchemaMigrations (
+               name TEXT PRIMARY KEY,
+               applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+           )'''
+    )
+    db.commit()
+
+    applied = []
+    for filename in sorted(f for f in os.listdir(MIGRATIONS_FOLDER) if f.endswith('.sql')):
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            if db.execute('SELECT 1 FROM SchemaMigrations WHERE name = ?', (filename,)).fetchone():
+                db.rollback()
+                continue
+            with open(os.path.join(MIGRATIONS_FOLDER, filename), encoding='utf-8') as f:
+                for statement in _split_sql_statements(f.read()):
+                    db.execute(statement)
+            db.execute('INSERT INTO SchemaMigrations (name) VALUES (?)', (filename,))
+            db.commit()
+        except sqlite3.Error:
+            db.rollback()
+            raise
+        applied.append(filename)
+        db_logger.info("Migración aplicada: %s", filename)
+    return applied
 
 def create_initial_admin():
     db = get_db()
     cursor = db.cursor()
     admin_user = db.execute("SELECT id FROM Users WHERE username = 'admin'").fetchone()
     if not admin_user:
-        hashed_password = generate_password_hash('password')
+        hashed_password = get_password_hasher().hash('password')
         cursor.execute(
             "INSERT INTO Users (username, password_hash, is_admin) VALUES (?, ?, ?)",
             ('admin', hashed_password, 1)
         )
         db.commit()
-        print("Usuario 'admin' creado con contraseña 'password'. ¡Cámbiala en producción!")
+        db_logger.warning("Usuario 'admin' creado con contraseña 'password'. ¡Cámbiala en producción!")
     else:
-        print("El usuario 'admin' ya existe.")
+        db_logger.info("El usuario 'admin' ya existe.")
+
+# --- Hash de Contraseñas ---
+class PasswordHasherBusy(RuntimeError):
+    """Todos los hilos de hash están ocupados y la cola de espera está llena."""
+
+
+class PasswordHasher:
+    """Ejecuta los hashes de contraseña en un pool de hilos acotado por proceso.
+
+    hashlib libera el GIL durante scrypt/pbkdf2, así que los hilos del pool avanzan en paralelo,
+    pero nunca hay más de `workers` hashes a la vez: una ráfaga de logins espera su turno (o
+    recibe PasswordHasherBusy) en lugar de saturar CPU y memoria del worker.
+    """
+
+    def __init__(self, method, workers, max_pending, timeout):
+        self.method = method
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._dummy_hash = None
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordHasherBusy("No hay capacidad para calcular hashes de contraseña.")
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def _get_dummy_hash(self):
+        if self._dummy_hash is None:
+            self._dummy_hash = self.hash(secrets.token_hex(16))
+        return self._dummy_hash
+
+    def verify(self, pwhash, password):
+        """Un único check por intento. Sin usuario (pwhash None) se compara contra un hash
+        ficticio para que la respuesta tarde lo mismo exista o no el usuario."""
+        if not pwhash:
+            self._run(check_password_hash, self._get_dummy_hash(), password or '')
+            return False
+        return self._run(check_password_hash, pwhash, password or '')
+
+    def needs_rehash(self, pwhash):
+        # werkzeug guarda "método:parámetros$sal$hash"; el dummy da la forma canónica del método
+        return pwhash.split('$', 1)[0] != self._get_dummy_hash().split('$', 1)[0]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_password_hasher = None
+_password_hasher_lock = threading.Lock()
+
+def get_password_hasher():
+    global _password_hasher
+    hasher = _password_hasher
+    # Un pool por proceso (tras un fork los hilos no existen) y por método configurado
+    if hasher is None or hasher.pid != os.getpid() or hasher.method != app.config['PASSWORD_HASH_METHOD']:
+        with _password_hasher_lock:
+            hasher = _password_hasher
+            if hasher is None or hasher.pid != os.getpid() or hasher.method != app.config['PASSWORD_HASH_METHOD']:
+                if hasher is not None and hasher.pid == os.getpid():
+                    hasher.shutdown()
+                hasher = PasswordHasher(
+                    app.config['PASSWORD_HASH_METHOD'],
+                    app.config['PASSWORD_HASH_WORKERS'],
+                    app.config['PASSWORD_HASH_MAX_PENDING'],
+                    app.config['PASSWORD_HASH_TIMEOUT'],
+                )
+                _password_hasher = hasher
+    return hasher
+
+# --- Sesiones ---
+class SQLiteSession(CallbackDict, SessionMixin):
+    """Sesión guardada en la tabla Sessions; la cookie solo lleva el identificador aleatorio."""
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at # None = sesión nueva, aún sin fila
+        self.modified = False
+
+
+class SQLiteSessionInterface(SessionInterface):
+    """Sesiones en tournament.db, usando conexiones del pool.
+
+    Solo escribe cuando la sesión cambió o cuando ha consumido la mitad de su vida útil, así que
+    una petición normal cuesta una lectura por clave primaria. Las filas expiradas las borra
+    ExpiredRowsSweeper en segundo plano.
+    """
+
+    def _lifetime(self, app):
+        return app.permanent_session_lifetime.total_seconds()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            pool = get_db_pool()
+            conn = pool.acquire()
+            try:
+                row = conn.execute(
+                    'SELECT data, expires_at FROM Sessions WHERE id = ? AND expires_at > ?',
+                    (sid, time.time())
+                ).fetchone()
+            finally:
+                pool.release(conn)
+            if row is not None:
+                try:
+                    return SQLiteSession(msgspec.msgpack.decode(row['data']), sid=sid, expires_at=row['expires_at'])
+                except msgspec.DecodeError:
+                    logger.warning("Sesión %s con datos ilegibles; se descarta.", sid[:8])
+        return SQLiteSession(sid=secrets.token_urlsafe(32))
+
+    def regenerate(self, session):
+        """Da a la sesión un identificador nuevo y borra la fila del anterior (mismo nombre que en
+        Flask-Session). Se llama al autenticarse para que un sid conocido de antemano no sirva."""
+        if session.expires_at is not None:
+            self._execute('DELETE FROM Sessions WHERE id = ?', (session.sid,))
+        session.sid = secrets.token_urlsafe(32)
+        session.expires_at = None
+        session.modified = True
+
+    def save_session(self, app, session, response):
+        cookie_name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        now = time.time()
+
+        if not session:
+            # Sesión vaciada (logout): borrar la fila y la cookie
+            if session.modified and session.expires_at is not None:
+                self._execute('DELETE FROM Sessions WHERE id = ?', (session.sid,))
+                response.delete_cookie(cookie_name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        response.vary.add('Cookie')
+        lifetime = self._lifetime(app)
+        needs_refresh = session.expires_at is None or session.expires_at - now < lifetime / 2
+        if not (session.modified or needs_refresh):
+            return
+
+        self._execute(
+            """INSERT INTO Sessions (id, data, expires_at) VALUES (?, ?, ?)
+               ON CONFLICT(id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at""",
+            (session.sid, msgspec.msgpack.encode(dict(session)), now + lifetime)
+        )
+        response.set_cookie(
+            cookie_name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    def _execute(self, sql, params):
+        pool = get_db_pool()
+        conn = pool.acquire()
+        try:
+            conn.execute(sql, params)
+            conn.commit()
+        finally:
+            pool.release(conn)
+
+
+def configure_sessions():
+    backend = app.config['SESSION_BACKEND']
+    if backend == 'sqlite':
+        app.session_interface = SQLiteSessionInterface()
+    elif backend == 'filesystem':
+        from flask_session import Session
+        Session(app)
+    elif backend != 'cookie':
+        raise RuntimeError(f"SESSION_BACKEND desconocido: '{backend}' (use 'cookie', 'sqlite' o 'filesystem').")
+    elif app.config['SECRET_KEY'] == DEV_SECRET_KEY:
+        raise RuntimeError("SESSION_BACKEND='cookie' requiere FLASK_SECRET_KEY: con la clave de desarrollo "
+                           "cualquiera puede firmar una sesión de administrador.")
+    # 'cookie': SecureCookieSessionInterface de Flask, firmada con SECRET_KEY
+    if metrics is not None:
+        app.session_interface = TimedSessionInterface(app.session_interface, backend)
+
+
+class TimedSessionInterface(SessionInterface):
+    """Envuelve el backend de sesiones configurado para medir open_session / save_session."""
+
+    def __init__(self, inner, backend):
+        self.inner = inner
+        self.backend = backend
+
+    def open_session(self, app, request):
+        started = time.perf_counter()
+        try:
+            return self.inner.open_session(app, request)
+        finally:
+            metrics.session_seconds.labels(self.backend, 'open').observe(time.perf_counter() - started)
+
+    def save_session(self, app, session, response):
+        started = time.perf_counter()
+        try:
+            return self.inner.save_session(app, session, response)
+        finally:
+            metrics.session_seconds.labels(self.backend, 'save').observe(time.perf_counter() - started)
+
+    def make_null_session(self, app):
+        return self.inner.make_null_session(app)
+
+    def is_null_session(self, obj):
+        return self.inner.is_null_session(obj)
+
+    def regenerate(self, session):
+        regenerate = getattr(self.inner, 'regenerate', None)
+        if regenerate is not None:
+            regenerate(session)
+
+configure_sessions()
+
+
+def regenerate_session():
+    """Al autenticarse: sesión vacía con identificador nuevo (evita la fijación de sesión).
+
+    Los backends con estado en el servidor ('sqlite', 'filesystem') borran la sesión anterior; con
+    'cookie' basta con vaciarla, porque la cookie firmada nueva sustituye a la anterior.
+    """
+    regenerate = getattr(app.session_interface, 'regenerate', None)
+    if regenerate is not None:
+        regenerate(session._get_current_object())
+    session.clear()
+
+# --- Contadores de Versión de Datos (compartidos entre workers vía TournamentSettings) ---
+def _bump_data_version(cursor, name):
+    # Debe ejecutarse dentro de la misma transacción que modifica los datos versionados.
+    # Devuelve la nueva versión (válida una vez hecho el commit).
+    new_version = int(cursor.execute(
+        """INSERT INTO TournamentSettings (setting_name, setting_value) VALUES (?, '1')
+           ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1
+           RETURNING setting_value""",
+        (f'{name}_version',)
+    ).fetchone()[0])
+    if has_request_context():
+        g.setdefault('data_versions', {})[name] = new_version
+    return new_version
+
+def _get_data_versions(db, names):
+    # Cada contador se consulta como mucho una vez por petición (queda en g.data_versions) y los
+    # que faltan se leen juntos en una sola consulta
+    versions = g.setdefault('data_versions', {})
+    missing = [name for name in names if name not in versions]
+    if missing:
+        found = dict(db.execute(
+            f"SELECT setting_name, setting_value FROM TournamentSettings WHERE setting_name IN ({', '.join('?' * len(missing))})",
+            [f'{name}_version' for name in missing]
+        ).fetchall())
+        for name in missing:
+            value = found.get(f'{name}_version')
+            versions[name] = int(value) if value is not None else 0
+    return [versions[name] for name in names]
+
+def _get_data_version(db, name):
+    return _get_data_versions(db, (name,))[0]
+
+# --- GET Condicionales (ETag derivado de las versiones de datos) ---
+# Cambia con cada despliegue: un ETag no debe sobrevivir a un cambio en el formato de la respuesta
+with open(__file__, 'rb') as _app_source:
+    _ETAG_CODE_SALT = hashlib.sha256(_app_source.read()).hexdigest()[:8]
+
+def not_modified_response(db, version_names, private=False):
+    """Calcula el ETag de la petición a partir de los contadores de versión que la alimentan.
+
+    Devuelve una respuesta 304 si el cliente ya tiene esa versión (sin ejecutar la consulta del
+    endpoint) o None; en ese caso el ETag queda en g y add_data_version_etag lo añade a la respuesta.
+    """
+    versions = _get_data_versions(db, ('database', *version_names))
+    key = '|'.join([_ETAG_CODE_SALT, request.full_path, *map(str, versions)])
+    etag = hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+    g.data_version_etag = (etag, private)
+    not_modified = request.if_none_match.contains_weak(etag)
+    if metrics is not None:
+        metrics.cache_result('etag', not_modified)
+    if not_modified:
+        return app.response_class(status=304)
+    return None
+
+@app.after_request
+def add_data_version_etag(response):
+    if 'data_version_etag' in g and response.status_code in (200, 304):
+        etag, private = g.data_version_etag
+        response.set_etag(etag)
+        # no-cache: el navegador guarda la respuesta pero revalida siempre con If-None-Match
+        response.cache_control.no_cache = True
+        if private:
+            response.cache_control.private = True
+    return response
+
+
+# --- Paginación por Cursor (keyset) y Streaming de Listados ---
+class InvalidPageArgs(ValueError):
+    """?limit= o ?cursor= mal formados: el endpoint responde 400."""
+
+
+def encode_cursor(values):
+    # Opaco para el cliente: base64url del JSON de la clave de orden de la última fila enviada
+    return base64.urlsafe_b64encode(msgspec.json.encode(values)).rstrip(b'=').decode('ascii')
+
+def parse_page_args(cursor_type):
+    """Lee ?limit= y ?cursor= de la petición. Devuelve (limit, cursor); ambos None si no vienen.
+
+    Sin limit el listado es completo (como siempre), pero se envía en streaming.
+    """
+    limit = request.args.get('limit')
+    if limit is not None:
+        if not limit.isdigit() or not 1 <= int(limit) <= app.config['MATCH_PAGE_MAX_LIMIT']:
+            raise InvalidPageArgs(f"limit debe ser un entero entre 1 y {app.config['MATCH_PAGE_MAX_LIMIT']}.")
+        limit = int(limit)
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            cursor = msgspec.json.decode(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)), type=cursor_type)
+        except (ValueError, msgspec.DecodeError):
+            raise InvalidPageArgs("cursor inválido.") from None
+    return limit, cursor or None
+
+def keyset_before(date_column, id_column, cursor_date, id_bound):
+    """Condición SQL para las filas posteriores al cursor en el orden `date DESC, id DESC`.
+
+    Escrita como `date <= ? AND (...)` para que SQLite busque directamente en los índices
+    (tournament_id, date) / (challenger_id, date) en vez de recorrerlos desde el principio.
+    Matches.date y DoublesMatches.date nunca son NULL (DEFAULT CURRENT_TIMESTAMP).
+    """
+    return (f"({date_column} <= ? AND ({date_column} < ? OR {id_column} < ?))",
+            [cursor_date, cursor_date, id_bound])
+
+def take_page(rows, limit, cursor_of):
+    """Recorta una página de `rows` (iterador en orden de cursor, pedido con LIMIT limit + 1).
+
+    Devuelve (filas, next_cursor). Sin limit devuelve el iterador tal cual, sin materializarlo.
+    """
+    if limit is None:
+        return rows, None
+    page = list(itertools.islice(rows, limit + 1))
+    if len(page) <= limit:
+        return page, None
+    return page[:limit], encode_cursor(cursor_of(page[limit - 1]))
+
+def list_response(items, next_cursor=None):
+    """Respuesta en streaming para un iterable (posiblemente perezoso) de Structs.
+
+    JSON (un array, byte a byte igual que jsonify) o NDJSON (un objeto por línea) si el cliente lo
+    pide con ?format=ndjson o Accept: application/x-ndjson. La memoria no depende del total de filas:
+    se codifican de una en una y se envían en trozos de STREAM_CHUNK_BYTES.
+    """
+    ndjson = (request.args.get('format') == 'ndjson' or
+              request.accept_mimetypes.best_match(('application/json', 'application/x-ndjson')) == 'application/x-ndjson')
+    encode = app.json.dumps_bytes
+    chunk_bytes = app.config['STREAM_CHUNK_BYTES']
+
+    def generate():
+        buffer = bytearray() if ndjson else bytearray(b'[')
+        try:
+            for index, item in enumerate(items):
+                if ndjson:
+                    buffer += encode(item)
+                    buffer += b'\n'
+                else:
+                    if index:
+                        buffer += b','
+                    buffer += encode(item)
+                if len(buffer) >= chunk_bytes:
+                    yield bytes(buffer)
+                    buffer.clear()
+        except sqlite3.Error as e:
+            # Las cabeceras ya salieron: solo queda registrar y cortar la respuesta
+            logger.error("DB: [list_response] Error de SQLite durante el streaming: %s", e)
+            raise
+        if not ndjson:
+            buffer += b']'
+        yield bytes(buffer)
+
+    response = app.response_class(stream_with_context(generate()),
+                                  mimetype='application/x-ndjson' if ndjson else 'application/json')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+
+# --- Caché de Torneo Activo por Tipo ---
+_active_tournament_cache = {'version': None, 'ids': {}}
+_active_tournament_cache_lock = threading.Lock()
+
+def invalidate_active_tournament_cache(cursor):
+    """Marca la resolución tipo -> torneo como obsoleta en todos los workers (llamar antes del commit)."""
+    _bump_data_version(cursor, 'tournaments')
+    with _active_tournament_cache_lock:
+        _active_tournament_cache['version'] = None
+        _active_tournament_cache['ids'] = {}
+
+ACTIVE_TOURNAMENT_BY_TYPE_SQL = (
+    "SELECT id FROM Tournaments WHERE type = ? COLLATE NOCASE AND is_active = 1 ORDER BY start_date DESC LIMIT 1"
+)
 
 def get_active_tournament_id_by_type(tournament_type):
     db = get_db()
-    # Debug: Mostrar qué tipo de torneo se está buscando
-    print(f"DEBUG: get_active_tournament_id_by_type - Buscando torneo de tipo: '{tournament_type}'")
+    version = _get_data_version(db, 'tournaments')
+    key = tournament_type.lower()
+    with _active_tournament_cache_lock:
+        if _active_tournament_cache['version'] != version:
+            _active_tournament_cache['version'] = version
+            _active_tournament_cache['ids'] = {}
+        elif key in _active_tournament_cache['ids']:
+            if metrics is not None:
+                metrics.cache_result('active_tournament', True)
+            return _active_tournament_cache['ids'][key]
+    if metrics is not None:
+        metrics.cache_result('active_tournament', False)
 
     # Primero, intentar encontrar un torneo activo
-    tournament = db.execute(
-        "SELECT id, name, is_active, type FROM Tournaments WHERE type = ? COLLATE NOCASE AND is_active = 1 ORDER BY start_date DESC LIMIT 1",
-        (tournament_type,)
-    ).fetchone()
-
-    if tournament:
-        print(f"DEBUG: get_active_tournament_id_by_type - Encontrado torneo ACTIVO: {tournament['name']} (ID: {tournament['id']})")
-        return tournament['id']
-    else:
-        # Debug: Indicar que no se encontró activo, buscar el último
-        print(f"DEBUG: get_active_tournament_id_by_type - No se encontró torneo ACTIVO para '{tournament_type}'.")
+    tournament = db.execute(ACTIVE_TOURNAMENT_BY_TYPE_SQL, (tournament_type,)).fetchone()
+    if not tournament:
         # Si no hay un torneo activo, buscar el último torneo no activo del mismo tipo
-        last_tournament = db.execute(
-            """SELECT id, name, is_active, type FROM Tournaments
-               WHERE type = ?
+        tournament = db.execute(
+            """SELECT id FROM Tournaments
+               WHERE type = ? COLLATE NOCASE
                ORDER BY end_date DESC, start_date DESC, created_at DESC LIMIT 1""",
             (tournament_type,)
         ).fetchone()
-
-        if last_tournament:
-            print(f"DEBUG: get_active_tournament_id_by_type - Usando el ÚLTIMO torneo encontrado: {last_tournament['name']} (ID: {last_tournament['id']}, Activo: {last_tournament['is_active']}).")
-            return last_tournament['id']
+    tournament_id = tournament['id'] if tournament else None
+
+    with _active_tournament_cache_lock:
+        # Solo guardar si nadie invalidó la caché mientras consultábamos
+        if _active_tournament_cache['version'] == version:
+            _active_tournament_cache['ids'][key] = tournament_id
+    return tournament_id
+
+
+# --- Motor de Reglas de Desafío de la Pirámide ---
+def allowed_challenge_positions(challenger_pos, total):
+    """Puestos a los que puede desafiar quien ocupa challenger_pos en una pirámide de `total` participantes.
+
+    Devuelve un range o una tupla, así que `pos in allowed_challenge_positions(...)` es O(1).
+    Puede incluir puestos inexistentes (p. ej. el 6 en una pirámide de 4); quien recorra la
+    lista debe filtrarlos contra las posiciones reales.
+    """
+    if challenger_pos == 1:
+        return range(2, 7)
+    if challenger_pos == 2:
+        return (1, 3, 4)
+    if challenger_pos == 3:
+        return (1, 2, 4)
+    if challenger_pos == total: # Último: los 5 de arriba
+        return range(total - 5, total)
+    if challenger_pos >= 4: # Puesto 4 en adelante (no el último): los 3 de arriba
+        return range(challenger_pos - 3, challenger_pos)
+    return ()
+
+def challenge_rule_message(challenger_pos, total, is_valid, noun, nouns):
+    """Mensaje para el usuario; noun/nouns es 'jugador'/'jugadores' o 'equipo'/'equipos'."""
+    if challenger_pos == 1:
+        return "Desafío permitido: Puesto 1 puede desafiar a 2-6." if is_valid else f"Puesto 1 solo puede desafiar a {nouns} entre el puesto 2 y 6."
+    if challenger_pos == 2:
+        return "Desafío permitido: Puesto 2 puede desafiar a 1, 3 y 4." if is_valid else f"Puesto 2 solo puede desafiar a {nouns} en los puestos 1, 3 y 4."
+    if challenger_pos == 3:
+        return "Desafío permitido: Puesto 3 puede desafiar a 1, 2 y 4." if is_valid else f"Puesto 3 solo puede desafiar a {nouns} en los puestos 1, 2 y 4."
+    if challenger_pos == total:
+        return f"Desafío permitido: Último {noun} puede desafiar a los 5 de arriba." if is_valid else f"El último {noun} solo puede desafiar a los 5 {nouns} inmediatamente superiores."
+    if challenger_pos >= 4:
+        return f"Desafío permitido: Puede desafiar a los 3 {nouns} inmediatamente superiores." if is_valid else f"Solo puedes desafiar a los 3 {nouns} inmediatamente superiores."
+    return "Desafío no permitido."
+
+
+class LadderIndex:
+    """Posiciones de una pirámide en memoria.
+
+    `slots[pos]` lista quién ocupa el puesto `pos` (normalmente uno solo, pero los datos admiten
+    puestos repetidos) y `pos_of[id]` es el puesto de cada participante. Para individuales el participante es Players.id; para dobles es el Teams.id
+    global y `row_id_of` guarda el TournamentTeams.id correspondiente.
+    """
+
+    __slots__ = ('version', 'slots', 'pos_of', 'row_id_of')
+
+    def __init__(self, version, rows):
+        # rows: (participant_id, position, row_id)
+        self.version = version
+        self.pos_of = {}
+        self.row_id_of = {}
+        max_pos = 0
+        for participant_id, position, row_id in rows:
+            self.pos_of[participant_id] = position
+            self.row_id_of[participant_id] = row_id
+            max_pos = max(max_pos, position)
+        self.slots = [[] for _ in range(max_pos + 1)]
+        for participant_id, position in self.pos_of.items():
+            self.slots[position].append(participant_id)
+
+    @property
+    def total(self):
+        return len(self.pos_of)
+
+    def __contains__(self, participant_id):
+        return participant_id in self.pos_of
+
+    def can_challenge(self, challenger_id, challenged_id):
+        """¿Puede challenger_id desafiar a challenged_id? O(1). Ambos deben estar en la pirámide."""
+        return self.pos_of[challenged_id] in allowed_challenge_positions(self.pos_of[challenger_id], self.total)
+
+    def targets(self, challenger_id):
+        """Participantes a los que puede desafiar challenger_id, de mejor a peor puesto. O(k)."""
+        slots = self.slots
+        return [
+            participant_id
+            for pos in allowed_challenge_positions(self.pos_of[challenger_id], self.total)
+            if 0 < pos < len(slots)
+            for participant_id in slots[pos]
+        ]
+
+    def apply_moves(self, moves):
+        # moves: {participant_id: nueva_posición}
+        for participant_id, new_pos in moves.items():
+            old_pos = self.pos_of.get(participant_id)
+            if old_pos is not None:
+                self.slots[old_pos].remove(participant_id)
+            if new_pos >= len(self.slots):
+                self.slots.extend([] for _ in range(new_pos + 1 - len(self.slots)))
+            self.slots[new_pos].append(participant_id)
+            self.pos_of[participant_id] = new_pos
+
+
+# Índices por pirámide: ('single',) o ('doubles', tournament_id, gender_category).
+# Cada uno queda sellado con la versión de datos con la que se construyó.
+_ladder_indexes = {}
+_ladder_indexes_lock = threading.Lock()
+
+def _ladder_version_name(key):
+    return 'ladder_single' if key[0] == 'single' else f'ladder_doubles_{key[1]}'
+
+def _get_ladder(db, key, query, params):
+    version = _get_data_version(db, _ladder_version_name(key))
+    with _ladder_indexes_lock:
+        ladder = _ladder_indexes.get(key)
+        if ladder is not None and ladder.version == version:
+            if metrics is not None:
+                metrics.cache_result('ladder', True)
+            return ladder
+    if metrics is not None:
+        metrics.cache_result('ladder', False)
+    ladder = LadderIndex(version, db.execute(query, params).fetchall())
+    with _ladder_indexes_lock:
+        _ladder_indexes[key] = ladder
+    return ladder
+
+def get_singles_ladder(db):
+    """Pirámide individual (Ranking Maestro: Players.current_position)."""
+    return _get_ladder(db, ('single',), 'SELECT id, current_position, id FROM Players', ())
+
+def get_doubles_ladder(db, tournament_id, gender_category):
+    """Pirámide de dobles de un torneo (TournamentTeams.tournament_current_position), por género."""
+    return _get_ladder(
+        db, ('doubles', tournament_id, gender_category),
+        '''SELECT tt.team_id, tt.tournament_current_position, tt.id FROM TournamentTeams tt
+           JOIN Teams t ON tt.team_id = t.id
+           WHERE tt.tournament_id = ? AND t.gender_category = ?''',
+        (tournament_id, gender_category)
+    )
+
+def bump_ladder_version(cursor, key):
+    """Marca la pirámide como modificada (llamar dentro de la transacción que cambia posiciones)."""
+    return _bump_data_version(cursor, _ladder_version_name(key))
+
+def commit_ladder_moves(key, new_version, moves):
+    """Tras el commit: aplica el intercambio al índice en memoria sin reconstruirlo.
+
+    Solo es seguro si el índice estaba exactamente en la versión anterior; si otro worker escribió
+    en medio, se descarta y se reconstruirá en la próxima consulta.
+    """
+    with _ladder_indexes_lock:
+        ladder = _ladder_indexes.get(key)
+        if ladder is None:
+            return
+        if ladder.version == new_version - 1:
+            ladder.apply_moves(moves)
+            ladder.version = new_version
         else:
-            print(f"DEBUG: get_active_tournament_id_by_type - NO se encontró NINGÚN torneo de tipo '{tournament_type}', ni activo ni anterior.")
-            return None
-        
+            _ladder_indexes.pop(key, None)
+
+def clear_local_caches():
+    # Tras recrear el esquema los contadores de versión vuelven a empezar: vaciar todo lo cacheado
+    with _active_tournament_cache_lock:
+        _active_tournament_cache['version'] = None
+        _active_tournament_cache['ids'] = {}
+    with _ladder_indexes_lock:
+        _ladder_indexes.clear()
+
 
 # --- Funciones de Ayuda para Archivos ---
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+class UploadTooLarge(ValueError):
+    """El archivo supera MAX_UPLOAD_BYTES."""
+
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+def _store_stream(cursor, stream, extension):
+    """Copia `stream` por bloques a un temporal calculando su SHA-256 y lo mueve al almacén.
+
+    Si el contenido ya existe se descarta la copia. Registra el archivo en Uploads dentro de la
+    transacción de `cursor` y devuelve su ruta relativa a UPLOAD_FOLDER, que es lo que se guarda
+    en photo_url. Las referencias las cuentan los triggers de Players al asignar ese photo_url.
+    """
+    tmp_dir = os.path.join(app.config['UPLOAD_FOLDER'], '.tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > app.config['MAX_UPLOAD_BYTES']:
+                    raise UploadTooLarge(f"El archivo supera el máximo de {app.config['MAX_UPLOAD_BYTES']} bytes.")
+                digest.update(chunk)
+                out.write(chunk)
+        sha256 = digest.hexdigest()
+
+        existing = cursor.execute("SELECT filename FROM Uploads WHERE sha256 = ?", (sha256,)).fetchone()
+        relative_path = existing['filename'] if existing else f"{sha256[:2]}/{sha256}{extension}"
+        dest_path = os.path.join(app.config['UPLOAD_FOLDER'], *relative_path.split('/'))
+        if os.path.exists(dest_path):
+            os.remove(tmp_path) # Contenido ya almacenado: deduplicado
+            logger.debug("Upload %s deduplicado (%s bytes).", sha256[:12], size)
+        else:
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            os.replace(tmp_path, dest_path)
+        tmp_path = None
+
+        cursor.execute(
+            """INSERT INTO Uploads (sha256, filename, size_bytes) VALUES (?, ?, ?)
+               ON CONFLICT(sha256) DO NOTHING""",
+            (sha256, relative_path, size)
+        )
+        return relative_path
+    finally:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def store_upload(cursor, file_storage):
+    """Guarda un archivo subido (FileStorage) en el almacén por contenido; ver _store_stream."""
+    extension = os.path.splitext(secure_filename(file_storage.filename))[1].lower()
+    return _store_stream(cursor, file_storage.stream, extension)
+
+# --- Miniaturas de Fotos (pool de procesos) ---
+def thumbnail_paths(relative_path, fmt=None):
+    """Rutas relativas de las miniaturas de una foto del almacén, por nombre de tamaño."""
+    fmt = fmt or app.config['THUMBNAIL_FORMAT']
+    base = os.path.splitext(relative_path)[0]
+    return {name: f"{base}_{name}.{fmt}" for name in app.config['THUMBNAIL_SIZES']}
+
+def render_thumbnails(source_path, targets, fmt):
+    """Genera las miniaturas de `source_path`. Se ejecuta en el pool de procesos.
+
+    `targets` es una lista de (ruta_destino, lado_px). Cada archivo se escribe en un temporal
+    y se renombra, así que nunca se sirve una miniatura a medias.
+    """
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    for dest_path, side in targets:
+        thumbnail = ImageOps.fit(image, (side, side), Image.Resampling.LANCZOS)
+        tmp_path = f"{dest_path}.tmp"
+        thumbnail.save(tmp_path, format=fmt.upper(), quality=80)
+        os.replace(tmp_path, dest_path)
+    return fmt
+
+
+_thumbnail_executor = None
+_thumbnail_executor_pid = None
+_thumbnail_executor_lock = threading.Lock()
+
+def get_thumbnail_executor():
+    global _thumbnail_executor, _thumbnail_executor_pid
+    # Un pool por proceso; 'forkserver' evita bifurcar un worker que ya tiene hilos en marcha
+    if _thumbnail_executor is None or _thumbnail_executor_pid != os.getpid():
+        with _thumbnail_executor_lock:
+            if _thumbnail_executor is None or _thumbnail_executor_pid != os.getpid():
+                start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                _thumbnail_executor = ProcessPoolExecutor(
+                    max_workers=app.config['THUMBNAIL_WORKERS'],
+                    mp_context=multiprocessing.get_context(start_method),
+                )
+                _thumbnail_executor_pid = os.getpid()
+    return _thumbnail_executor
+
+def _thumbnail_targets(relative_path, fmt):
+    upload_folder = app.config['UPLOAD_FOLDER']
+    sizes = app.config['THUMBNAIL_SIZES']
+    return [
+        (os.path.join(upload_folder, *path.split('/')), sizes[name])
+        for name, path in thumbnail_paths(relative_path, fmt).items()
+    ]
+
+def _mark_thumbnails_ready(relative_path, fmt):
+    pool = get_db_pool()
+    conn = pool.acquire()
+    try:
+        conn.execute("UPDATE Uploads SET thumbnail_format = ? WHERE filename = ?", (fmt, relative_path))
+        conn.commit()
+    finally:
+        pool.release(conn)
+
+def enqueue_thumbnails(relative_path):
+    """Encola la generación de miniaturas de una foto ya registrada en Uploads (tras el commit).
+
+    No bloquea la petición: cuando el proceso termina, un callback marca la fila de Uploads y
+    a partir de ahí los endpoints sirven la miniatura en lugar del original.
+    """
+    if Image is None:
+        logger.debug("Pillow no está instalado; no se generan miniaturas para %s.", relative_path)
+        return None
+    fmt = app.config['THUMBNAIL_FORMAT']
+    source_path = os.path.join(app.config['UPLOAD_FOLDER'], *relative_path.split('/'))
+    future = get_thumbnail_executor().submit(render_thumbnails, source_path, _thumbnail_targets(relative_path, fmt), fmt)
+
+    def on_done(done):
+        try:
+            _mark_thumbnails_ready(relative_path, done.result())
+        except Exception as e:
+            logger.error("GENERICO: [enqueue_thumbnails] No se pudieron generar las miniaturas de %s: %s", relative_path, e)
+
+    future.add_done_callback(on_done)
+    return future
+
+
+# --- Recursos Estáticos con Huella (cache inmutable) ---
+# Fotos del almacén por contenido y sus miniaturas: el nombre ya es el hash, nunca cambian
+_IMMUTABLE_UPLOAD_RE = re.compile(r'^uploads/[0-9a-f]{2}/[0-9a-f]{64}(?:_\w+)?\.\w+$')
+
+def build_static_manifest(static_folder):
+    """Mapa 'ruta/original.ext' -> 'ruta/original.<hash12>.ext' de los archivos de static/.
+
+    Se omite static/uploads/: las fotos nuevas ya se guardan con su hash como nombre.
+    """
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(static_folder):
+        if os.path.samefile(dirpath, static_folder) and 'uploads' in dirnames:
+            dirnames.remove('uploads')
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            relative_path = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                digest = hashlib.file_digest(f, 'sha256').hexdigest()[:12]
+            base, extension = os.path.splitext(relative_path)
+            manifest[relative_path] = f"{base}.{digest}{extension}"
+    return manifest
+
+STATIC_MANIFEST = build_static_manifest(app.static_folder) if app.config['STATIC_FINGERPRINTS'] else {}
+_STATIC_BY_FINGERPRINT = {fingerprinted: original for original, fingerprinted in STATIC_MANIFEST.items()}
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    # Así todas las plantillas que usan url_for('static', filename=...) emiten la URL con huella
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = STATIC_MANIFEST.get(values['filename'], values['filename'])
+
+def send_static_asset(filename):
+    original = _STATIC_BY_FINGERPRINT.get(filename)
+    immutable = original is not None or _IMMUTABLE_UPLOAD_RE.match(filename) is not None
+    if not immutable:
+        return app.send_static_file(filename) # Revalidación condicional, como hasta ahora
+    response = send_from_directory(app.static_folder, original or filename,
+                                   max_age=app.config['STATIC_IMMUTABLE_MAX_AGE'])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+app.view_functions['static'] = send_static_asset
+
 
 # --- Rutas de Páginas Web (Vistas) ---
 @app.route('/')
@@ -129,12 +2099,12 @@ def organizer_page():
     if not session.get('is_admin'):
         flash('Acceso denegado. No tienes permisos de organizador.', 'warning')
         return redirect(url_for('player_dashboard_page')) # Redirige al dashboard del jugador
-    return send_from_directory(os.path.join(app.static_folder, 'organizer'), 'organizer.html')
+    return render_template('organizer.html')
 
 @app.route('/all_matches')
 @login_required
 def all_matches_page():
-    print("DEBUG: [all_matches_page] Accediendo a la página de todos los partidos.")
+    logger.debug("[all_matches_page] Accediendo a la página de todos los partidos.")
     return render_template('all_matches.html')
 
 @app.route('/tournaments')
@@ -147,6 +2117,17 @@ def tournaments_page():
 def proximos_partidos_page():
     return render_template('proximos_partidos.html')
 
+PLAYER_PROFILE_MATCHES_SQL = '''
+    SELECT m.id, m.date, m.score_text,
+           (p_chal.first_name || ' ' || p_chal.last_name) AS challenger_name,
+           (p_chd.first_name || ' ' || p_chd.last_name) AS challenged_name,
+           (SELECT p.first_name || ' ' || p.last_name FROM Players p WHERE p.id = m.winner_id) AS winner_name
+    FROM Matches m
+    JOIN Players p_chal ON m.challenger_id = p_chal.id
+    JOIN Players p_chd ON m.challenged_id = p_chd.id
+    WHERE m.challenger_id = ? OR m.challenged_id = ?
+    ORDER BY m.date DESC'''
+
 @app.route('/player/<int:player_id>')
 def player_profile_page(player_id):
     db = get_db()
@@ -163,17 +2144,7 @@ def player_profile_page(player_id):
         except (ValueError, TypeError):
             age = None
 
-    matches_db = db.execute(
-        '''SELECT m.id, m.date, m.score_text,
-                  (p_chal.first_name || ' ' || p_chal.last_name) AS challenger_name,
-                  (p_chd.first_name || ' ' || p_chd.last_name) AS challenged_name,
-                  (SELECT p.first_name || ' ' || p.last_name FROM Players p WHERE p.id = m.winner_id) AS winner_name
-           FROM Matches m
-           JOIN Players p_chal ON m.challenger_id = p_chal.id
-           JOIN Players p_chd ON m.challenged_id = p_chd.id
-           WHERE m.challenger_id = ? OR m.challenged_id = ?
-           ORDER BY m.date DESC''', (player_id, player_id)
-    ).fetchall()
+    matches_db = db.execute(PLAYER_PROFILE_MATCHES_SQL, (player_id, player_id)).fetchall()
     matches = [dict(m) for m in matches_db]
     return render_template('player_profile.html', player=player, age=age, matches=matches)
 
@@ -185,30 +2156,52 @@ def player_profile_page(player_id):
 @app.route('/api/obtener_todos_los_torneos_disponibles', methods=['GET']) # <<-- ¡NUEVA RUTA!
 @login_required
 def get_tournaments():
-    print("DEBUG: ¡¡¡GET_TOURNAMENTS - NUEVA RUTA - CARGADA Y EJECUTADA!!!") # <<-- MENSAJE DISTINTIVO
     db = get_db()
-    current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    # Obtener el tiempo actual como objeto datetime para comparaciones
-    current_datetime_obj = datetime.now()
-    # Y también como string para comparaciones con strings de la DB si es necesario, o para output
-    current_time_str = current_datetime_obj.strftime('%Y-%m-%d %H:%M:%S')
+    current_time_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    player_id = session.get('player_id')
 
     filter_status = request.args.get('status')
     filter_type = request.args.get('type')
 
     try:
+        # Una sola consulta: inscripción del jugador (LEFT JOIN sobre el UNIQUE player_id/tournament_id),
+        # estado de la ventana de registro y cupos ocupados (solo se cuentan si el registro está abierto
+        # y hay límite de cupos; CASE no evalúa la subconsulta en el resto de filas).
+        # Las fechas se guardan como 'YYYY-MM-DD HH:MM:SS', así que compararlas como texto es cronológico;
+        # datetime(x) = x descarta las que no tienen ese formato.
         query = """
             SELECT
                 t.id, t.name, t.description, t.start_date, t.end_date,
                 t.registration_start_date, t.registration_end_date, t.type, t.category,
                 t.max_slots, t.cost, t.requirements, t.location, t.status, t.is_published,
                 t.organizer_id, t.created_at, t.rules_url,
-                u.username AS organizer_username
+                u.username AS organizer_username,
+                my_reg.id IS NOT NULL AS is_registered,
+                w.registration_window,
+                strftime('%d/%m/%Y', t.registration_start_date) AS registration_opens_on,
+                CASE WHEN w.registration_window = 'open' AND t.max_slots > 0 THEN
+                    (SELECT COUNT(r.id) FROM TournamentRegistrations r
+                     WHERE r.tournament_id = t.id AND r.status = 'inscrito')
+                END AS current_registrations
             FROM Tournaments AS t
             JOIN Users AS u ON t.organizer_id = u.id
+            LEFT JOIN TournamentRegistrations AS my_reg
+                   ON my_reg.tournament_id = t.id AND my_reg.player_id = ?
+            JOIN (
+                SELECT id,
+                       CASE
+                           WHEN registration_start_date IS NULL OR registration_end_date IS NULL
+                             OR datetime(registration_start_date) IS NOT registration_start_date
+                             OR datetime(registration_end_date) IS NOT registration_end_date THEN 'undefined'
+                           WHEN ? < registration_start_date THEN 'not_open'
+                           WHEN ? > registration_end_date THEN 'closed'
+                           ELSE 'open'
+                       END AS registration_window
+                FROM Tournaments
+            ) AS w ON w.id = t.id
             WHERE 1=1
         """
-        params = []
+        params = [player_id, current_time_str, current_time_str]
 
         if request.args.get('include_unpublished') == 'true':
             pass
@@ -228,65 +2221,28 @@ def get_tournaments():
         tournaments_db = db.execute(query, params).fetchall()
 
         tournaments_list = []
-        player_id = session.get('player_id')
-
         for t in tournaments_db:
-            is_registered = False
-            if player_id:
-                registered_check = db.execute(
-                    "SELECT 1 FROM TournamentRegistrations WHERE player_id = ? AND tournament_id = ?",
-                    (player_id, t['id'])
-                ).fetchone()
-                is_registered = registered_check is not None
-
-            registration_status_text = ""
+            is_registered = bool(t['is_registered'])
+            registration_window = t['registration_window']
             can_register = False
 
-            # Convertir fechas de la DB a objetos datetime de Python y manejar NULLs
-            reg_start_obj = None
-            if t['registration_start_date']:
-                try:
-                    reg_start_obj = datetime.strptime(t['registration_start_date'], '%Y-%m-%d %H:%M:%S')
-                except ValueError:
-                    print(f"ADVERTENCIA: Formato de fecha de registro inicio inválido para torneo {t['id']}: {t['registration_start_date']}")
-                    pass # Dejar como None si hay error de formato
-
-            reg_end_obj = None
-            if t['registration_end_date']:
-                try:
-                    reg_end_obj = datetime.strptime(t['registration_end_date'], '%Y-%m-%d %H:%M:%S')
-                except ValueError:
-                    print(f"ADVERTENCIA: Formato de fecha de registro fin inválido para torneo {t['id']}: {t['registration_end_date']}")
-                    pass # Dejar como None si hay error de formato
-
-
             if t['is_published'] == 0:
                 registration_status_text = "No publicado"
-                can_register = False
-            elif reg_start_obj is None or reg_end_obj is None:
-                 registration_status_text = "Fechas de registro no definidas"
-                 can_register = False
-            elif current_datetime_obj < reg_start_obj: # Comparar objetos datetime
-                registration_status_text = "Registro abre " + reg_start_obj.strftime('%d/%m/%Y') # Formatear para el frontend
-                can_register = False
-            elif current_datetime_obj > reg_end_obj: # Comparar objetos datetime
+            elif registration_window == 'undefined':
+                registration_status_text = "Fechas de registro no definidas"
+            elif registration_window == 'not_open':
+                registration_status_text = "Registro abre " + t['registration_opens_on'] # Formateada en SQL
+            elif registration_window == 'closed':
                 registration_status_text = "Registro cerrado"
-                can_register = False
-            else: # Registro actualmente abierto
-                if t['max_slots'] is not None and t['max_slots'] > 0:
-                    current_registrations = db.execute(
-                        "SELECT COUNT(id) FROM TournamentRegistrations WHERE tournament_id = ? AND status = 'inscrito'",
-                        (t['id'],)
-                    ).fetchone()[0]
-                    if current_registrations >= t['max_slots']:
-                        registration_status_text = "Cupos llenos"
-                        can_register = False
-                    else:
-                        registration_status_text = f"Inscripciones abiertas ({current_registrations}/{t['max_slots']} cupos)"
-                        can_register = True
-                else: # Inscripciones abiertas y sin límite de cupo (o max_slots es 0 o NULL)
-                    registration_status_text = "Inscripciones abiertas"
+            elif t['current_registrations'] is not None: # Registro abierto y con límite de cupos
+                if t['current_registrations'] >= t['max_slots']:
+                    registration_status_text = "Cupos llenos"
+                else:
+                    registration_status_text = f"Inscripciones abiertas ({t['current_registrations']}/{t['max_slots']} cupos)"
                     can_register = True
+            else: # Inscripciones abiertas y sin límite de cupo (o max_slots es 0 o NULL)
+                registration_status_text = "Inscripciones abiertas"
+                can_register = True
 
             if is_registered:
                 registration_status_text = "Ya inscrito"
@@ -320,202 +2276,58 @@ def get_tournaments():
         return jsonify(tournaments_list), 200
 
     except sqlite3.Error as e:
-        print(f"ERROR DB en get_tournaments: {e}")
+        logger.error("DB en get_tournaments: %s", e)
         return jsonify({"error": "Error de base de datos al obtener torneos."}), 500
     except Exception as e:
-        print(f"ERROR GENERICO en get_tournaments: {e}")
+        logger.error("GENERICO en get_tournaments: %s", e)
         return jsonify({"error": "Error inesperado al obtener torneos."}), 500
 
-def _recalculate_player_activity_status(player_id):
-    db = get_db()
-    cursor = db.cursor()
-    try:
-        # Obtener TODOS los contadores separados por tipo de partido
-        player = db.execute(
-            '''SELECT 
-                activity_index_single, challenges_emitted_single, challenges_accepted_single, challenges_won_single, defenses_successful_single,
-                activity_index_doubles, challenges_emitted_doubles, challenges_accepted_doubles, challenges_won_doubles, defenses_successful_doubles,
-                rejections_current_cycle, registration_type
-            FROM Players WHERE id = ?''', 
-            (player_id,)
-        ).fetchone()
-
-        if not player:
-            print(f"ADVERTENCIA: Jugador con ID {player_id} no encontrado para recalcular estado de actividad.")
-            return
-
-        # --- Cálculo y Estado para INDIVIDUALES ---
-        D_s = player['challenges_emitted_single']
-        A_s = player['challenges_accepted_single']
-        G_s = player['challenges_won_single']
-        DF_s = player['defenses_successful_single']
-        
-        new_activity_index_single = D_s + (2 * A_s) + (3 * G_s) + DF_s
-        
-        new_status_single = 'rojo' # Default a rojo
-        if new_activity_index_single >= 12:
-            new_status_single = 'verde'
-        elif new_activity_index_single >= 6 and new_activity_index_single <= 11:
-            new_status_single = 'amarillo'
-        
-        # --- Cálculo y Estado para DOBLES ---
-        D_d = player['challenges_emitted_doubles']
-        A_d = player['challenges_accepted_doubles']
-        G_d = player['challenges_won_doubles']
-        DF_d = player['defenses_successful_doubles']
-        
-        new_activity_index_doubles = D_d + (2 * A_d) + (3 * G_d) + DF_d
-        
-        new_status_doubles = 'rojo' # Default a rojo
-        if new_activity_index_doubles >= 12:
-            new_status_doubles = 'verde'
-        elif new_activity_index_doubles >= 6 and new_activity_index_doubles <= 11:
-            new_status_doubles = 'amarillo'
-
-        # --- Lógica de Estado GENERAL (combinado) y Rechazos ---
-        # El estado general se basa en los estados individuales y de dobles, y los rechazos.
-        new_general_status = 'rojo' # Por defecto, si no cumple nada, es rojo.
-        
-        # Si al menos una modalidad es verde, el general es al menos amarillo.
-        if new_status_single == 'verde' or new_status_doubles == 'verde':
-            new_general_status = 'verde'
-        elif new_status_single == 'amarillo' or new_status_doubles == 'amarillo':
-            new_general_status = 'amarillo'
-        
-        # Si tiene 2 o más rechazos en el ciclo actual, el estado general es 'rojo'
-        if player['rejections_current_cycle'] >= 2:
-            new_general_status = 'rojo'
-
-        # Actualizar activity_index y activity_status en la base de datos
-        cursor.execute(
-            """UPDATE Players SET 
-               activity_index_single = ?, activity_status_single = ?,
-               activity_index_doubles = ?, activity_status_doubles = ?,
-               activity_status = ?
-               WHERE id = ?""", 
-            (new_activity_index_single, new_status_single,
-             new_activity_index_doubles, new_status_doubles,
-             new_general_status, player_id,)
-        )
-        # db.commit() # No hacer commit aquí, se hace en la función que llama.
-        print(f"DEBUG: Estado de actividad de Jugador {player_id} actualizado:")
-        print(f"  Individual: Índice={new_activity_index_single}, Estado='{new_status_single}'")
-        print(f"  Dobles: Índice={new_activity_index_doubles}, Estado='{new_status_doubles}'")
-        print(f"  General: Estado='{new_general_status}' (Rechazos ciclo: {player['rejections_current_cycle']})")
-
-    except sqlite3.Error as e:
-        # db.rollback() # No hacer rollback aquí, se hace en la función que llama.
-        print(f"ERROR DB: [_recalculate_player_activity_status] Error de SQLite: {str(e)}")
-    except Exception as e:
-        print(f"ERROR GENERICO: [_recalculate_player_activity_status] Error inesperado: {str(e)}")
-
-def _recalculate_team_doubles_activity_status(team_id):
-    db = get_db()
-    cursor = db.cursor()
-    try:
-        # Obtener los contadores de actividad del equipo de dobles
-        team = db.execute(
-            '''SELECT
-                activity_index_team_doubles,
-                challenges_emitted_team_doubles,
-                challenges_accepted_team_doubles,
-                challenges_won_team_doubles,
-                defenses_successful_team_doubles,
-                rejections_team_doubles_current_cycle
-            FROM Teams WHERE id = ?''',
-            (team_id,)
-        ).fetchone()
-
-        if not team:
-            print(f"ADVERTENCIA: Equipo de dobles con ID {team_id} no encontrado para recalcular estado de actividad.")
-            return
-
-        # Calcular el nuevo índice de actividad para el equipo
-        D_t = team['challenges_emitted_team_doubles']
-        A_t = team['challenges_accepted_team_doubles']
-        G_t = team['challenges_won_team_doubles']
-        DF_t = team['defenses_successful_team_doubles']
-        
-        new_activity_index_team_doubles = D_t + (2 * A_t) + (3 * G_t) + DF_t
-        
-        # Determinar el estado de actividad del equipo (verde, amarillo, rojo)
-        new_activity_status_team_doubles = 'rojo' # Default a rojo
-        if new_activity_index_team_doubles >= 12: # Mismos umbrales que individuales por defecto
-            new_activity_status_team_doubles = 'verde'
-        elif new_activity_index_team_doubles >= 6 and new_activity_index_team_doubles <= 11:
-            new_activity_status_team_doubles = 'amarillo'
-        
-        # Si tiene 2 o más rechazos en el ciclo actual, el estado del equipo es 'rojo'
-        if team['rejections_team_doubles_current_cycle'] >= 2:
-            new_activity_status_team_doubles = 'rojo'
-
-        # Actualizar activity_index y activity_status en la base de datos para el equipo
-        cursor.execute(
-            """UPDATE Teams SET
-               activity_index_team_doubles = ?,
-               activity_status_team_doubles = ?
-               WHERE id = ?""",
-            (new_activity_index_team_doubles, new_activity_status_team_doubles, team_id,)
-        )
-        # NO HACER commit() o rollback() aquí. La función que llama manejará la transacción.
-        print(f"DEBUG: Estado de actividad de Equipo {team_id} actualizado:")
-        print(f"  Índice: {new_activity_index_team_doubles}, Estado: '{new_activity_status_team_doubles}'")
-        print(f"  Rechazos ciclo: {team['rejections_team_doubles_current_cycle']}")
-
-    except sqlite3.Error as e:
-        print(f"ERROR DB: [_recalculate_team_doubles_activity_status] Error de SQLite: {str(e)}")
-    except Exception as e:
-        print(f"ERROR GENERICO: [_recalculate_team_doubles_activity_status] Error inesperado: {str(e)}")
-
-def _recalculate_all_players_activity_status():
-    db = get_db()
-    players = db.execute('SELECT id FROM Players').fetchall()
-    for player in players:
-        _recalculate_player_activity_status(player['id'])
-    # Importante: No hacer db.commit() aquí. El commit debe ser manejado por la función que llama
-    # (e.g., reset_cycle_activity_api o cualquier otra que inicie un conjunto de recálculos).
-    print("DEBUG: Recálculo de estado de actividad completado para todos los jugadores.")
-
 # --- API Endpoints ---
 
+PLAYERS_RANKING_SQL = f'''
+    SELECT {PLAYER_OUT_COLUMNS}
+    FROM Players p LEFT JOIN Uploads u ON u.filename = p.photo_url
+    ORDER BY p.current_position ASC'''
+
 @app.route('/api/players', methods=['GET'])
 def get_players_api():
     db = get_db()
-    players_db = db.execute(
-        '''SELECT id, first_name, last_name, email, phone, gender,
-                  birth_date, location, dominant_hand, backhand_type, racquet,
-                  photo_url,
-                  initial_position, current_position, points,
-                  activity_index_single, challenges_emitted_single, challenges_accepted_single,
-                  challenges_won_single, defenses_successful_single, activity_status_single,
-                  activity_index_doubles, challenges_emitted_doubles, challenges_accepted_doubles,
-                  challenges_won_doubles, defenses_successful_doubles, activity_status_doubles,
-                  rejections_current_cycle, rejections_total, activity_status, last_activity_update,
-                  last_challenge_received_date -- 'category' y 'registration_type' eliminados de aquí
-           FROM Players ORDER BY current_position ASC'''
-    ).fetchall()
-    
+    not_modified = not_modified_response(db, ('players', 'uploads'))
+    if not_modified:
+        return not_modified
+    players_db = db.execute(PLAYERS_RANKING_SQL, ('sm',)).fetchall()
+
     players = []
     for p in players_db:
-        player_dict = dict(p)
-        player_dict['name'] = f"{p['first_name']} {p['last_name']}"
-        
         # Formatear last_activity_update para una mejor visualización si no es NULL
-        if player_dict['last_activity_update']:
+        last_activity_update = p['last_activity_update']
+        if last_activity_update:
             try:
                 # Asumiendo que se guarda como YYYY-MM-DD HH:MM:SS
-                dt_object = datetime.strptime(player_dict['last_activity_update'], '%Y-%m-%d %H:%M:%S')
-                player_dict['last_activity_update_formatted'] = dt_object.strftime('%d/%m/%Y %H:%M')
+                dt_object = datetime.strptime(last_activity_update, '%Y-%m-%d %H:%M:%S')
+                last_activity_update_formatted = dt_object.strftime('%d/%m/%Y %H:%M')
             except ValueError:
-                player_dict['last_activity_update_formatted'] = 'N/A' # O manejar como prefieras
+                last_activity_update_formatted = 'N/A' # O manejar como prefieras
         else:
-            player_dict['last_activity_update_formatted'] = 'Nunca'
+            last_activity_update_formatted = 'Nunca'
 
-        players.append(player_dict)
+        players.append(PlayerOut(
+            *p,
+            name=f"{p['first_name']} {p['last_name']}",
+            last_activity_update_formatted=last_activity_update_formatted,
+        ))
 
     return jsonify(players)
 
 # NUEVOS ENDPOINTS PARA GESTIÓN DE EQUIPOS DE DOBLES
+TEAM_OF_PLAYERS_SQL = '''
+    SELECT t.team_name FROM Teams t
+    WHERE (t.player1_id = ? OR t.player2_id = ?) OR (t.player1_id = ? OR t.player2_id = ?)'''
+MAX_TEAM_POSITION_SQL = 'SELECT MAX(current_position) as max_pos FROM Teams WHERE gender_category = ?'
+TEAM_PAIR_SQL = '''
+    SELECT id, team_name FROM Teams
+    WHERE (player1_id = ? AND player2_id = ?) OR (player1_id = ? AND player2_id = ?)'''
+
 @app.route('/api/doubles_teams', methods=['POST'])
 @login_required
 def create_doubles_team_api():
@@ -534,6 +2346,9 @@ def create_doubles_team_api():
     cursor = db.cursor()
 
     try:
+        # Las comprobaciones de equipo y la última posición se leen ya con el lock de escritura tomado
+        begin_immediate(db, 'create_doubles_team')
+
         player1 = db.execute('SELECT id, gender FROM Players WHERE id = ?', (player1_id,)).fetchone()
         player2 = db.execute('SELECT id, gender FROM Players WHERE id = ?', (player2_id,)).fetchone()
 
@@ -547,8 +2362,7 @@ def create_doubles_team_api():
 
         # --- NUEVA VALIDACIÓN: Verificar si alguno de los jugadores ya está en otro equipo ---
         existing_player_in_team = db.execute(
-            '''SELECT t.team_name FROM Teams t
-               WHERE (t.player1_id = ? OR t.player2_id = ?) OR (t.player1_id = ? OR t.player2_id = ?)''',
+            TEAM_OF_PLAYERS_SQL,
             (player1_id, player1_id, player2_id, player2_id) # Busca si player1 o player2 ya están en cualquier columna
         ).fetchone()
 
@@ -558,19 +2372,14 @@ def create_doubles_team_api():
 
         # Verificar si la pareja ya existe (en cualquier orden)
         existing_team = db.execute(
-            '''SELECT id FROM Teams WHERE 
-               (player1_id = ? AND player2_id = ?) OR (player1_id = ? AND player2_id = ?)''',
-            (player1_id, player2_id, player2_id, player1_id)
+            TEAM_PAIR_SQL, (player1_id, player2_id, player2_id, player1_id)
         ).fetchone()
 
         if existing_team:
             return jsonify({"error": "Este equipo de dobles ya existe."}), 409
         
         # Obtener la última posición para esta categoría de género
-        last_pos_row = db.execute(
-            'SELECT MAX(current_position) as max_pos FROM Teams WHERE gender_category = ?',
-            (gender_category,)
-        ).fetchone()
+        last_pos_row = db.execute(MAX_TEAM_POSITION_SQL, (gender_category,)).fetchone()
         position = (last_pos_row['max_pos'] or 0) + 1
 
         cursor.execute(
@@ -581,19 +2390,27 @@ def create_doubles_team_api():
         db.commit()
         return jsonify({"message": "Equipo de dobles creado exitosamente.", "team_id": cursor.lastrowid}), 201
 
+    except WriteLockTimeout:
+        return write_busy_response()
     except sqlite3.Error as e:
         db.rollback()
-        print(f"ERROR DB: [create_doubles_team_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [create_doubles_team_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al crear equipo de dobles: {str(e)}"}), 500
     except Exception as e:
-        print(f"ERROR GENERICO: [create_doubles_team_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [create_doubles_team_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al crear equipo de dobles: {str(e)}"}), 500
 
+DUPLICATE_DOUBLES_CHALLENGE_SQL = '''
+    SELECT id FROM DoublesMatches
+    WHERE tournament_id = ?
+      AND ((team_a_id = ? AND team_b_id = ?) OR (team_a_id = ? AND team_b_id = ?))
+      AND status = 'pending' '''
+
 @app.route('/api/propose_doubles_challenge', methods=['POST'])
 @login_required 
 def propose_doubles_challenge_api():
     data = request.get_json()
-    print(f"DEBUG: [propose_doubles_challenge_api] Datos recibidos: {data}")
+    logger.debug("[propose_doubles_challenge_api] Datos recibidos: %s", data)
     
     # IMPORTANTE: Los IDs que vienen del frontend ahora son IDs de TEAMS GLOBALES
     # Necesitamos encontrar sus IDs de TournamentTeams para el torneo activo.
@@ -601,7 +2418,7 @@ def propose_doubles_challenge_api():
     challenged_team_id_global = data.get('challengedTeamId')
 
     if not all([challenger_team_id_global, challenged_team_id_global]):
-        print("DEBUG: [propose_doubles_challenge_api] Faltan IDs de equipos globales.")
+        logger.debug("[propose_doubles_challenge_api] Faltan IDs de equipos globales.")
         return jsonify({"error": "Faltan IDs de equipos para proponer el desafío."}), 400
     
     if int(challenger_team_id_global) == int(challenged_team_id_global):
@@ -622,6 +2439,8 @@ def propose_doubles_challenge_api():
         if challenger_team_global_info['gender_category'] != challenged_team_global_info['gender_category']:
             return jsonify({"error": "Los equipos deben ser del mismo género."}), 400
 
+        challenger_team_id_global = challenger_team_global_info['id']
+        challenged_team_id_global = challenged_team_global_info['id']
         gender_category = challenger_team_global_info['gender_category']
         # Corregir la construcción del tipo de torneo para que coincida con schema.sql
         if gender_category == 'Masculino':
@@ -638,86 +2457,30 @@ def propose_doubles_challenge_api():
             return jsonify({"error": f"No hay un torneo de pirámide de dobles {gender_category} activo para proponer desafíos."}), 400
         # --- FIN NUEVA LÓGICA ---
 
-        # Obtener los IDs de TournamentTeams para el torneo activo
-        challenger_tournament_team = db.execute(
-            'SELECT id, tournament_current_position FROM TournamentTeams WHERE tournament_id = ? AND team_id = ?',
-            (active_tournament_id, challenger_team_id_global)
-        ).fetchone()
-        challenged_tournament_team = db.execute(
-            'SELECT id, tournament_current_position FROM TournamentTeams WHERE tournament_id = ? AND team_id = ?',
-            (active_tournament_id, challenged_team_id_global)
-        ).fetchone()
-
-        if not challenger_tournament_team or not challenged_tournament_team:
+        ladder = get_doubles_ladder(db, active_tournament_id, gender_category)
+        if challenger_team_id_global not in ladder or challenged_team_id_global not in ladder:
             return jsonify({"error": "Uno o ambos equipos no están registrados en el torneo de dobles activo."}), 400
-        
+
         # Ahora trabajamos con los IDs de TournamentTeams
-        challenger_tournament_team_id = challenger_tournament_team['id']
-        challenged_tournament_team_id = challenged_tournament_team['id']
+        challenger_tournament_team_id = ladder.row_id_of[challenger_team_id_global]
+        challenged_tournament_team_id = ladder.row_id_of[challenged_team_id_global]
 
         # Reglas de desafío (aplicadas a posiciones de TournamentTeams)
-        challenger_pos = challenger_tournament_team['tournament_current_position']
-        challenged_pos = challenged_tournament_team['tournament_current_position']
-        
-        # Obtener el total de equipos en TournamentTeams para la categoría de género del desafiante y el torneo activo
-        total_teams_in_category = db.execute(
-            '''SELECT COUNT(tt.id) FROM TournamentTeams tt
-               JOIN Teams t ON tt.team_id = t.id
-               WHERE tt.tournament_id = ? AND t.gender_category = ?''',
-            (active_tournament_id, gender_category)
-        ).fetchone()[0]
-
-        is_valid_challenge_rule = False
-        validation_message = "Desafío de dobles no permitido."
-
-        if challenger_pos == 1: # Puesto 1
-            if challenged_pos >= 2 and challenged_pos <= 6:
-                is_valid_challenge_rule = True
-                validation_message = "Desafío permitido: Puesto 1 puede desafiar a 2-6."
-            else:
-                validation_message = "Puesto 1 solo puede desafiar a equipos entre el puesto 2 y 6."
-        elif challenger_pos == 2: # Puesto 2
-            if challenged_pos in [1, 3, 4]:
-                is_valid = True
-                validation_message = "Desafío permitido: Puesto 2 puede desafiar a 1, 3 y 4."
-            else:
-                validation_message = "Puesto 2 solo puede desafiar a equipos en los puestos 1, 3 y 4."
-        elif challenger_pos == 3: # Puesto 3
-            if challenged_pos in [1, 2, 4]:
-                is_valid = True
-                validation_message = "Desafío permitido: Puesto 3 puede desafiar a 1, 2 y 4."
-            else:
-                validation_message = "Puesto 3 solo puede desafiar a equipos en los puestos 1, 2 y 4."
-        elif challenger_pos == total_teams_in_category: # Último equipo en su categoría
-            if challenged_pos >= (total_teams_in_category - 5) and challenged_pos < total_teams_in_category: # Los 5 de arriba
-                is_valid_challenge_rule = True
-                validation_message = "Desafío permitido: Último equipo puede desafiar a los 5 de arriba."
-            else:
-                validation_message = "El último equipo solo puede desafiar a los 5 equipos inmediatamente superiores."
-        elif challenger_pos >= 4: # Puesto 4 en adelante (no el último)
-            # Puede desafiar a los 3 equipos inmediatamente por encima
-            if challenged_pos >= (challenger_pos - 3) and challenged_pos < challenger_pos:
-                is_valid_challenge_rule = True
-                validation_message = "Desafío permitido: Puede desafiar a los 3 equipos inmediatamente superiores."
-            else:
-                validation_message = "Solo puedes desafiar a los 3 equipos inmediatamente superiores."
-        
-        # Si la regla de desafío no es válida, devolver error.
-        if not is_valid_challenge_rule:
+        if not ladder.can_challenge(challenger_team_id_global, challenged_team_id_global):
+            validation_message = challenge_rule_message(
+                ladder.pos_of[challenger_team_id_global], ladder.total, False, 'equipo', 'equipos'
+            )
             return jsonify({"error": validation_message}), 400
 
         # Verificar si ya existe un desafío pendiente entre estos dos TournamentTeams para este torneo
         existing_challenge = db.execute(
-            '''SELECT id FROM DoublesMatches 
-               WHERE tournament_id = ? 
-                 AND ((team_a_id = ? AND team_b_id = ?) OR (team_a_id = ? AND team_b_id = ?))
-                 AND status = 'pending' ''',
+            DUPLICATE_DOUBLES_CHALLENGE_SQL,
             (active_tournament_id, challenger_tournament_team_id, challenged_tournament_team_id, 
              challenged_tournament_team_id, challenger_tournament_team_id)
         ).fetchone()
 
         if existing_challenge:
-            print(f"DEBUG: [propose_doubles_challenge_api] Desafío de dobles ya existe (ID: {existing_challenge['id']}).")
+            logger.debug("[propose_doubles_challenge_api] Desafío de dobles ya existe (ID: %s).", existing_challenge['id'])
             return jsonify({"error": "Ya existe un desafío de dobles pendiente entre estos equipos."}), 409
 
         # Si todas las validaciones pasan, insertar el desafío.
@@ -727,7 +2490,7 @@ def propose_doubles_challenge_api():
             (active_tournament_id, challenger_tournament_team_id, challenged_tournament_team_id, 'pending')
         )
         inserted_id = cursor.lastrowid
-        print(f"DEBUG: [propose_doubles_challenge_api] Intentando COMMIT para challenge_id: {inserted_id}")
+        logger.debug("[propose_doubles_challenge_api] Intentando COMMIT para challenge_id: %s", inserted_id)
         
         # --- LÓGICA DE ACTIVIDAD PARA EQUIPOS DE DOBLES (AHORA EN TournamentTeams) ---
         # Incrementar challenges_emitted_team_doubles para el TournamentTeam desafiante
@@ -738,24 +2501,51 @@ def propose_doubles_challenge_api():
                WHERE id = ?""",
             (challenger_tournament_team_id,)
         )
-        # Recalcular el estado de actividad del TournamentTeam desafiante
-        _recalculate_team_doubles_activity_status(challenger_tournament_team_id)
+        # El índice y el estado de actividad los recalcula el trigger de TournamentTeams
         # --- FIN NUEVA LÓGICA ---
 
         db.commit()
-        print(f"DEBUG: [propose_doubles_challenge_api] COMMIT EXITOSO para challenge_id: {inserted_id}")
+        logger.debug("[propose_doubles_challenge_api] COMMIT EXITOSO para challenge_id: %s", inserted_id)
         return jsonify({"message": "Desafío de dobles propuesto y registrado como pendiente.", "challenge_id": inserted_id}), 201
 
     except sqlite3.Error as e:
         db.rollback()
-        print(f"ERROR DB: [propose_doubles_challenge_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [propose_doubles_challenge_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al proponer desafío de dobles: {str(e)}"}), 500
     except Exception as e:
         db.rollback()
-        print(f"ERROR GENERICO: [propose_doubles_challenge_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [propose_doubles_challenge_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al proponer desafío de dobles: {str(e)}"}), 500
 
 
+# {gender_filter}: '' o ' AND t.gender_category = ?'
+TOURNAMENT_TEAMS_RANKING_SQL = '''
+    SELECT tt.tournament_current_position AS current_position,
+           tt.tournament_initial_position AS initial_position,
+           tt.tournament_points AS points,
+           tt.activity_index_team_doubles,
+           tt.challenges_emitted_team_doubles,
+           tt.challenges_accepted_team_doubles,
+           tt.challenges_won_team_doubles,
+           tt.defenses_successful_team_doubles,
+           tt.rejections_team_doubles_current_cycle,
+           tt.rejections_team_doubles_total,
+           tt.activity_status_team_doubles,
+           tt.last_activity_team_doubles_update,
+           t.id AS team_id,
+           t.team_name,
+           t.player1_id,
+           t.player2_id,
+           t.gender_category,
+           p1.first_name AS p1_first_name, p1.last_name AS p1_last_name,
+           p2.first_name AS p2_first_name, p2.last_name AS p2_last_name
+    FROM TournamentTeams tt
+    JOIN Teams t ON tt.team_id = t.id
+    JOIN Players p1 ON t.player1_id = p1.id
+    JOIN Players p2 ON t.player2_id = p2.id
+    WHERE tt.tournament_id = ?{gender_filter}
+    ORDER BY tt.tournament_current_position ASC'''
+
 @app.route('/api/doubles_teams', methods=['GET'])
 def get_doubles_teams_api():
     db = get_db()
@@ -770,61 +2560,22 @@ def get_doubles_teams_api():
         tournament_type_search = 'pyramid_doubles_female' # ESTA CADENA DEBE COINCIDIR CON SCHEMA.SQL
 
     if tournament_type_search: # Solo buscar si se especificó un tipo de torneo válido
-        # Usar COLLATE NOCASE para que la búsqueda de tipo sea insensible a mayúsculas/minúsculas
-        active_pyramid_tournament = db.execute(
-            "SELECT id FROM Tournaments WHERE is_active = 1 AND type = ? COLLATE NOCASE",
-            (tournament_type_search,) # Usar la variable de búsqueda
-        ).fetchone()
-        
-        # Si no hay activo, buscar el último jugado/creado
-        if not active_pyramid_tournament:
-            active_pyramid_tournament = db.execute(
-                """SELECT id FROM Tournaments
-                   WHERE type = ? COLLATE NOCASE
-                   ORDER BY end_date DESC, start_date DESC, created_at DESC LIMIT 1""",
-                (tournament_type_search,) # Usar la variable de búsqueda
-            ).fetchone()
+        active_pyramid_tournament = get_active_tournament_id_by_type(tournament_type_search)
 
     if not active_pyramid_tournament:
         # Este es el mensaje que está recibiendo el frontend si no se encuentra el torneo
         return jsonify({"message": f"No hay un torneo de dobles {gender_filter if gender_filter else 'Femenino'} disponible (ni activo ni anterior)."}), 404
     
-    tournament_id = active_pyramid_tournament['id']
-
-    # 2. Construir la consulta para obtener los equipos del TournamentTeams activo
-    query = '''
-        SELECT tt.tournament_current_position AS current_position,
-               tt.tournament_initial_position AS initial_position,
-               tt.tournament_points AS points,
-               tt.activity_index_team_doubles,
-               tt.challenges_emitted_team_doubles,
-               tt.challenges_accepted_team_doubles,
-               tt.challenges_won_team_doubles,
-               tt.defenses_successful_team_doubles,
-               tt.rejections_team_doubles_current_cycle,
-               tt.rejections_team_doubles_total,
-               tt.activity_status_team_doubles,
-               tt.last_activity_team_doubles_update,
-               t.id AS team_id,
-               t.team_name,
-               t.player1_id,
-               t.player2_id,
-               t.gender_category,
-               p1.first_name AS p1_first_name, p1.last_name AS p1_last_name,
-               p2.first_name AS p2_first_name, p2.last_name AS p2_last_name
-        FROM TournamentTeams tt
-        JOIN Teams t ON tt.team_id = t.id
-        JOIN Players p1 ON t.player1_id = p1.id
-        JOIN Players p2 ON t.player2_id = p2.id
-        WHERE tt.tournament_id = ?
-    '''
-    params = [tournament_id]
+    tournament_id = active_pyramid_tournament
+    not_modified = not_modified_response(db, ('players', 'teams', f'tournament_teams_{tournament_id}'))
+    if not_modified:
+        return not_modified
 
+    # 2. Consulta de los equipos del TournamentTeams activo, opcionalmente filtrada por género
+    params = [tournament_id]
     if gender_filter:
-        query += ' AND t.gender_category = ?'
         params.append(gender_filter)
-    
-    query += ' ORDER BY tt.tournament_current_position ASC'
+    query = TOURNAMENT_TEAMS_RANKING_SQL.format(gender_filter=' AND t.gender_category = ?' if gender_filter else '')
 
     try:
         teams_db = db.execute(query, params).fetchall()
@@ -846,10 +2597,10 @@ def get_doubles_teams_api():
             teams.append(team_dict)
         return jsonify(teams), 200
     except sqlite3.Error as e:
-        print(f"ERROR DB: [get_doubles_teams_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [get_doubles_teams_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al obtener equipos de dobles: {str(e)}"}), 500
     except Exception as e:
-        print(f"ERROR GENERICO: [get_doubles_teams_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [get_doubles_teams_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al obtener equipos de dobles: {str(e)}"}), 500
 
 # En app.py, dentro de la sección de "API Endpoints"
@@ -878,6 +2629,8 @@ def validate_doubles_challenge_api():
     if challenger_team_global_info['gender_category'] != challenged_team_global_info['gender_category']:
         return jsonify({"error": "Los equipos deben ser del mismo género."}), 400
 
+    challenger_team_id_global = challenger_team_global_info['id']
+    challenged_team_id_global = challenged_team_global_info['id']
     gender_category = challenger_team_global_info['gender_category']
     # Corregir la construcción del tipo de torneo para que coincida con schema.sql
     if gender_category == 'Masculino':
@@ -893,89 +2646,31 @@ def validate_doubles_challenge_api():
         return jsonify({"valid": False, "message": f"No hay un torneo de pirámide de dobles {gender_category} activo para validar desafíos."}), 400
     # --- FIN NUEVA LÓGICA ---
 
-    # Obtener las posiciones de los equipos de TournamentTeams para el torneo activo
-    challenger_tournament_team = db.execute(
-        'SELECT id, tournament_current_position FROM TournamentTeams WHERE tournament_id = ? AND team_id = ?',
-        (active_tournament_id, challenger_team_id_global)
-    ).fetchone()
-    challenged_tournament_team = db.execute(
-        'SELECT id, tournament_current_position FROM TournamentTeams WHERE tournament_id = ? AND team_id = ?',
-        (active_tournament_id, challenged_team_id_global)
-    ).fetchone()
-
-    if not challenger_tournament_team or not challenged_tournament_team:
+    ladder = get_doubles_ladder(db, active_tournament_id, gender_category)
+    if challenger_team_id_global not in ladder or challenged_team_id_global not in ladder:
         return jsonify({"valid": False, "message": "Uno o ambos equipos no están registrados en el torneo de dobles activo."}), 400
 
-    challenger_pos = challenger_tournament_team['tournament_current_position']
-    challenged_pos = challenged_tournament_team['tournament_current_position']
-    
-    # Obtener el total de equipos en TournamentTeams para la categoría de género y el torneo activo
-    total_teams_in_category = db.execute(
-        '''SELECT COUNT(tt.id) FROM TournamentTeams tt
-           JOIN Teams t ON tt.team_id = t.id
-           WHERE tt.tournament_id = ? AND t.gender_category = ?''', 
-        (active_tournament_id, gender_category)
-    ).fetchone()[0]
-
-    is_valid = False
-    message = "Desafío de dobles no permitido."
-
     # Reglas de desafío (aplicadas a posiciones de TournamentTeams)
-    if challenger_pos == 1: # Puesto 1
-        if challenged_pos >= 2 and challenged_pos <= 6:
-            is_valid = True
-            message = "Desafío permitido: Puesto 1 puede desafiar a 2-6."
-        else:
-            message = "Puesto 1 solo puede desafiar a equipos entre el puesto 2 y 6."
-    elif challenger_pos == 2: # Puesto 2
-        if challenged_pos in [1, 3, 4]:
-            is_valid = True
-            message = "Desafío permitido: Puesto 2 puede desafiar a 1, 3 y 4."
-        else:
-            message = "Puesto 2 solo puede desafiar a equipos en los puestos 1, 3 y 4."
-    elif challenger_pos == 3: # Puesto 3
-        if challenged_pos in [1, 2, 4]:
-            is_valid = True
-            message = "Desafío permitido: Puesto 3 puede desafiar a 1, 2 y 4."
-        else:
-            message = "Puesto 3 solo puede desafiar a equipos en los puestos 1, 2 y 4."
-    elif challenger_pos == total_teams_in_category: # Último equipo en su categoría
-        if challenged_pos >= (total_teams_in_category - 5) and challenged_pos < total_teams_in_category: # Los 5 de arriba
-            is_valid = True
-            message = "Desafío permitido: Último equipo puede desafiar a los 5 de arriba."
-        else:
-            message = "El último equipo solo puede desafiar a los 5 equipos inmediatamente superiores."
-    elif challenger_pos >= 4: # Puesto 4 en adelante (no el último)
-        # Puede desafiar a los 3 equipos inmediatamente por encima
-        if challenged_pos >= (challenger_pos - 3) and challenged_pos < challenger_pos:
-            is_valid = True
-            message = "Desafío permitido: Puede desafiar a los 3 equipos inmediatamente superiores."
-        else:
-            message = "Solo puedes desafiar a los 3 equipos inmediatamente superiores."
-    
-    if is_valid:
-        return jsonify({"valid": True, "message": message}), 200
-    else:
-        return jsonify({"valid": False, "message": message}), 200
+    is_valid = ladder.can_challenge(challenger_team_id_global, challenged_team_id_global)
+    message = challenge_rule_message(ladder.pos_of[challenger_team_id_global], ladder.total, is_valid, 'equipo', 'equipos')
+    return jsonify({"valid": is_valid, "message": message}), 200
 
 # NUEVO ENDPOINT: Obtiene los desafíos de dobles pendientes
+PENDING_DOUBLES_CHALLENGES_SQL = '''
+    SELECT dc.id, dc.date, dc.team_a_id, dc.team_b_id, dc.status, dc.created_at,
+           t_a.team_name AS challenger_team_name, t_b.team_name AS challenged_team_name
+    FROM DoublesMatches dc
+    JOIN Teams t_a ON dc.team_a_id = t_a.id
+    JOIN Teams t_b ON dc.team_b_id = t_b.id
+    WHERE dc.status = 'pending'
+    ORDER BY dc.created_at DESC'''
+
 @app.route('/api/pending_doubles_challenges', methods=['GET'])
 @login_required 
 def get_pending_doubles_challenges_api():
     db = get_db()
     try:
-        query = '''
-            SELECT dc.id, dc.date, dc.team_a_id, dc.team_b_id, dc.status, dc.created_at,
-                   t_a.team_name AS challenger_team_name, t_b.team_name AS challenged_team_name
-            FROM DoublesMatches dc
-            JOIN Teams t_a ON dc.team_a_id = t_a.id
-            JOIN Teams t_b ON dc.team_b_id = t_b.id
-            WHERE dc.status = 'pending'
-            ORDER BY dc.created_at DESC
-        '''
-        print(f"DEBUG: [get_pending_doubles_challenges_api] Consulta SQL: {query}") # NUEVO DEBUG
-        
-        pending_doubles_challenges_db = db.execute(query).fetchall()
+        pending_doubles_challenges_db = db.execute(PENDING_DOUBLES_CHALLENGES_SQL).fetchall()
 
         challenges = []
         for pc in pending_doubles_challenges_db:
@@ -986,20 +2681,23 @@ def get_pending_doubles_challenges_api():
             challenge_dict['challenged_team_name'] = pc['challenged_team_name']
             challenges.append(challenge_dict)
 
-        print(f"DEBUG: [get_pending_doubles_challenges_api] Desafíos encontrados en DB: {challenges}") # NUEVO DEBUG
+        logger.debug("[get_pending_doubles_challenges_api] Desafíos encontrados en DB: %s", len(challenges))
         return jsonify(challenges), 200
 
     except sqlite3.Error as e:
-        print(f"ERROR DB: [get_pending_doubles_challenges_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [get_pending_doubles_challenges_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al obtener desafíos de dobles pendientes: {str(e)}"}), 500
     except Exception as e:
-        print(f"ERROR GENERICO: [get_pending_doubles_challenges_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [get_pending_doubles_challenges_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al obtener desafíos de dobles pendientes: {str(e)}"}), 500
 
 # En app.py, dentro de la sección de "API Endpoints"
 
+TOURNAMENT_TEAM_LOOKUP_SQL = 'SELECT id, tournament_current_position, team_id FROM TournamentTeams WHERE tournament_id = ? AND team_id = ?'
+
 @app.route('/api/doubles_match_result', methods=['POST'])
 @login_required 
+@idempotent
 def post_doubles_match_result_api():
     data = request.get_json()
     # Los IDs que vienen del frontend ahora son IDs de TEAMS GLOBALES
@@ -1008,8 +2706,8 @@ def post_doubles_match_result_api():
     sets = data.get('sets')
     challenge_id = data.get('challengeId') # ID del desafío pendiente, si viene de uno
 
-    print(f"DEBUG: [post_doubles_match_result_api] Datos recibidos: {data}")
-    print(f"DEBUG: [post_doubles_match_result_api] Challenge ID recibido: {challenge_id}")
+    logger.debug("[post_doubles_match_result_api] Datos recibidos: %s", data)
+    logger.debug("[post_doubles_match_result_api] Challenge ID recibido: %s", challenge_id)
 
     if not all([challenger_team_id_global, challenged_team_id_global, sets]) or not (2 <= len(sets) <= 3):
         return jsonify({"error": "Datos de partido de dobles incompletos o número de sets incorrecto."}), 400
@@ -1039,13 +2737,16 @@ def post_doubles_match_result_api():
             return jsonify({"error": f"No hay un torneo de pirámide de dobles {gender_category} activo para registrar resultados."}), 400
         # --- FIN NUEVA LÓGICA ---
 
+        # Las posiciones se leen ya con el lock de escritura tomado
+        begin_immediate(db, 'doubles_match_result')
+
         # Obtener los IDs de TournamentTeams y sus posiciones para el torneo activo
         challenger_tournament_team = db.execute(
-            'SELECT id, tournament_current_position, team_id FROM TournamentTeams WHERE tournament_id = ? AND team_id = ?',
+            TOURNAMENT_TEAM_LOOKUP_SQL,
             (active_tournament_id, challenger_team_id_global)
         ).fetchone()
         challenged_tournament_team = db.execute(
-            'SELECT id, tournament_current_position, team_id FROM TournamentTeams WHERE tournament_id = ? AND team_id = ?',
+            TOURNAMENT_TEAM_LOOKUP_SQL,
             (active_tournament_id, challenged_team_id_global)
         ).fetchone()
 
@@ -1086,17 +2787,20 @@ def post_doubles_match_result_api():
                 new_challenger_team_pos = challenged_tournament_team['tournament_current_position']
                 new_challenged_team_pos = challenger_tournament_team['tournament_current_position']
                 positions_swapped = True
-                print(f"DEBUG: Standard swap (Doubles) - Challenger TournamentTeam {challenger_tournament_team_id} won against {challenged_tournament_team_id}. Positions swapped.")
+                logger.debug("Standard swap (Doubles) - Challenger TournamentTeam %s won against %s. Positions swapped.", challenger_tournament_team_id, challenged_tournament_team_id)
 
             elif not challenger_won_match and challenger_tournament_team['tournament_current_position'] == 1:
                 new_challenger_team_pos = challenged_tournament_team['tournament_current_position']
                 new_challenged_team_pos = challenger_tournament_team['tournament_current_position']
                 positions_swapped = True
-                print(f"DEBUG: Puesto 1 lost (Doubles) - Challenger TournamentTeam {challenger_tournament_team_id} (P1) lost to {challenged_tournament_team_id}. Positions swapped.")
+                logger.debug("Puesto 1 lost (Doubles) - Challenger TournamentTeam %s (P1) lost to %s. Positions swapped.", challenger_tournament_team_id, challenged_tournament_team_id)
             
             # Actualizar posiciones de los TournamentTeams
             cursor.execute("UPDATE TournamentTeams SET tournament_current_position = ? WHERE id = ?", (new_challenger_team_pos, challenger_tournament_team_id))
             cursor.execute("UPDATE TournamentTeams SET tournament_current_position = ? WHERE id = ?", (new_challenged_team_pos, challenged_tournament_team_id))
+            ladder_key = ('doubles', active_tournament_id, gender_category)
+            if positions_swapped:
+                ladder_version = bump_ladder_version(cursor, ladder_key)
             
             # --- LÓGICA DE ACTIVIDAD PARA JUGADORES INDIVIDUALES (RANKING MAESTRO) ---
             # OJO: Estos IDs son de la tabla Players global, no de TournamentPlayers.
@@ -1120,16 +2824,10 @@ def post_doubles_match_result_api():
             else: # Equipo desafiado ganó (defensa exitosa)
                 cursor.execute("UPDATE Players SET defenses_successful_doubles = defenses_successful_doubles + 1, last_activity_update = CURRENT_TIMESTAMP WHERE id = ?", (player1_challenged_id,))
                 cursor.execute("UPDATE Players SET defenses_successful_doubles = defenses_successful_doubles + 1, last_activity_update = CURRENT_TIMESTAMP WHERE id = ?", (player2_challenged_id,))
-            
-            # --- LLAMADA A LA FUNCIÓN DE RECÁLCULO DE ESTADO DE JUGADORES ---
-            _recalculate_player_activity_status(player1_challenger_id)
-            _recalculate_player_activity_status(player2_challenger_id)
-            _recalculate_player_activity_status(player1_challenged_id)
-            _recalculate_player_activity_status(player2_challenged_id)
-            # --- FIN LLAMADA ---
+            # El estado de actividad de los jugadores lo recalculan los triggers de Players
 
         else:
-            print(f"DEBUG: Partido de dobles en torneo tipo '{tournament_info['type']}' no afecta Ranking Maestro ni actividad de jugadores globales.")
+            logger.debug("Partido de dobles en torneo tipo '%s' no afecta Ranking Maestro ni actividad de jugadores globales.", tournament_info['type'])
             
         # --- LÓGICA DE ACTIVIDAD PARA EQUIPOS DE DOBLES (TournamentTeams) ---
         # Actualizar contadores de actividad para el TournamentTeam desafiante (siempre)
@@ -1166,11 +2864,7 @@ def post_doubles_match_result_api():
                    WHERE id = ?""", 
                 (challenged_tournament_team_id,)
             )
-        
-        # --- LLAMADA A LA FUNCIÓN DE RECÁLCULO DE ESTADO DE EQUIPOS ---
-        _recalculate_team_doubles_activity_status(challenger_tournament_team_id)
-        _recalculate_team_doubles_activity_status(challenged_tournament_team_id)
-        # --- FIN LLAMADA ---
+        # El estado de actividad de los equipos lo recalculan los triggers de TournamentTeams
 
         doubles_match_id = None 
 
@@ -1181,9 +2875,9 @@ def post_doubles_match_result_api():
                 (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), winner_tournament_team_id, loser_tournament_team_id, score_text, challenger_won_match, positions_swapped, challenge_id)
             )
             doubles_match_id = challenge_id
-            print(f"DEBUG: [post_doubles_match_result_api] Desafío pendiente {challenge_id} actualizado a 'played'. Filas afectadas: {cursor.rowcount}")
+            logger.debug("[post_doubles_match_result_api] Desafío pendiente %s actualizado a 'played'. Filas afectadas: %s", challenge_id, cursor.rowcount)
             if cursor.rowcount == 0:
-                print(f"ADVERTENCIA: [post_doubles_match_result_api] No se encontró el desafío de dobles con ID {challenge_id} para actualizar. Podría no existir o ya no estar pendiente.")
+                logger.warning("[post_doubles_match_result_api] No se encontró el desafío de dobles con ID %s para actualizar. Podría no existir o ya no estar pendiente.", challenge_id)
         else:
             cursor.execute(
                 """INSERT INTO DoublesMatches (tournament_id, date, team_a_id, team_b_id, winner_team_id, loser_team_id, score_text, is_team_a_winner, positions_swapped, status)
@@ -1191,7 +2885,7 @@ def post_doubles_match_result_api():
                 (active_tournament_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), challenger_tournament_team_id, challenged_tournament_team_id, winner_tournament_team_id, loser_tournament_team_id, score_text, challenger_won_match, positions_swapped, 'played')
             )
             doubles_match_id = cursor.lastrowid
-            print(f"DEBUG: [post_doubles_match_result_api] Nuevo partido de dobles insertado (sin desafío pendiente previo). ID: {doubles_match_id}")
+            logger.debug("[post_doubles_match_result_api] Nuevo partido de dobles insertado (sin desafío pendiente previo). ID: %s", doubles_match_id)
         
         # Registrar eventos en ActivityLog para los jugadores individuales (Ranking Maestro)
         if doubles_match_id:
@@ -1222,22 +2916,52 @@ def post_doubles_match_result_api():
                 (player2_challenged_id_global, 'doubles_match_played', doubles_match_id, active_tournament_id, f"Jugó dobles contra Equipo {challenger_team_id_global} en torneo {active_tournament_id}")
             )
         
+        response = jsonify({"message": "Resultado de dobles procesado exitosamente y posiciones actualizadas."})
+        store_idempotent_response(response)
         db.commit()
+        if positions_swapped:
+            commit_ladder_moves(ladder_key, ladder_version, {
+                challenger_team_id_global: new_challenger_team_pos,
+                challenged_team_id_global: new_challenged_team_pos,
+            })
         
-        g.pop('db', None)
-        db.close()
-        return jsonify({"message": "Resultado de dobles procesado exitosamente y posiciones actualizadas."}), 200
+        return response
 
+    except WriteLockTimeout:
+        return write_busy_response()
+    except IdempotencyClaimLost:
+        db.rollback()
+        return claim_lost_response()
     except sqlite3.Error as e:
         db.rollback()
-        print(f"ERROR DB: [post_doubles_match_result_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [post_doubles_match_result_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al procesar resultado de dobles: {str(e)}"}), 500
     except Exception as e:
         db.rollback()
-        print(f"ERROR GENERICO: [post_doubles_match_result_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [post_doubles_match_result_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al procesar resultado de dobles: {str(e)}"}), 500        
     
 
+# {keyset}: '1' (primera página) o la condición de keyset_before('m.date', 'm.id', ...)
+ALL_MATCHES_SQL = '''
+    SELECT m.id, m.date, m.score_text,
+           p_chal.first_name AS challenger_first_name, p_chal.last_name AS challenger_last_name,
+           p_chd.first_name AS challenged_first_name, p_chd.last_name AS challenged_last_name,
+           p_winner.first_name AS winner_first_name, p_winner.last_name AS winner_last_name,
+           p_loser.first_name AS loser_first_name, p_loser.last_name AS loser_last_name,
+           t.name AS tournament_name, -- AÑADIR: Nombre del torneo
+           'single' AS match_type
+    FROM Matches m
+    JOIN Players p_chal ON m.challenger_id = p_chal.id
+    JOIN Players p_chd ON m.challenged_id = p_chd.id
+    JOIN Players p_winner ON m.winner_id = p_winner.id
+    JOIN Players p_loser ON m.loser_id = p_loser.id
+    JOIN Tournaments t ON m.tournament_id = t.id -- NUEVO: Unir con Tournaments
+    WHERE m.tournament_id = ? -- NUEVO: Filtrar por el torneo activo
+      AND {keyset}
+    ORDER BY m.date DESC, m.id DESC
+    LIMIT ?'''
+
 @app.route('/api/all_matches', methods=['GET'])
 @login_required # Proteger este endpoint si solo el organizador debe ver todos los partidos
 def get_all_matches_api():
@@ -1248,45 +2972,66 @@ def get_all_matches_api():
         if not active_tournament_id:
             return jsonify({"message": "No hay un torneo de pirámide individual activo para listar partidos."}), 404
         # --- FIN NUEVA LÓGICA ---
+        not_modified = not_modified_response(
+            db, ('players', 'tournaments', f'matches_{active_tournament_id}'), private=True
+        )
+        if not_modified:
+            return not_modified
 
+        limit, cursor = parse_page_args(tuple[str, int])
+        keyset_sql, keyset_params = keyset_before('m.date', 'm.id', *cursor) if cursor else ('1', [])
         matches_db = db.execute(
-            '''SELECT m.id, m.date, m.score_text,
-                      p_chal.first_name AS challenger_first_name, p_chal.last_name AS challenger_last_name,
-                      p_chd.first_name AS challenged_first_name, p_chd.last_name AS challenged_last_name,
-                      p_winner.first_name AS winner_first_name, p_winner.last_name AS winner_last_name,
-                      p_loser.first_name AS loser_first_name, p_loser.last_name AS loser_last_name,
-                      t.name AS tournament_name, -- AÑADIR: Nombre del torneo
-                      'single' AS match_type
-               FROM Matches m
-               JOIN Players p_chal ON m.challenger_id = p_chal.id
-               JOIN Players p_chd ON m.challenged_id = p_chd.id
-               JOIN Players p_winner ON m.winner_id = p_winner.id
-               JOIN Players p_loser ON m.loser_id = p_loser.id
-               JOIN Tournaments t ON m.tournament_id = t.id -- NUEVO: Unir con Tournaments
-               WHERE m.tournament_id = ? -- NUEVO: Filtrar por el torneo activo
-               ORDER BY m.date DESC''',
-            (active_tournament_id,) # Pasar el ID del torneo activo
-        ).fetchall()
-
-        matches = []
-        for m in matches_db:
-            match_dict = dict(m)
-            match_dict['challenger_name'] = f"{m['challenger_first_name']} {m['challenger_last_name']}"
-            match_dict['challenged_name'] = f"{m['challenged_first_name']} {m['challenged_last_name']}"
-            match_dict['winner_name'] = f"{m['winner_first_name']} {m['winner_last_name']}"
-            match_dict['loser_name'] = f"{m['loser_first_name']} {m['loser_last_name']}"
-            # El nombre del torneo ya viene en match_dict['tournament_name']
-            matches.append(match_dict)
+            ALL_MATCHES_SQL.format(keyset=keyset_sql),
+            (active_tournament_id, *keyset_params, limit + 1 if limit else -1) # -1: sin límite
+        )
+        matches_db, next_cursor = take_page(matches_db, limit, lambda m: (m['date'], m['id']))
+
+        matches = (
+            SinglesMatchOut(
+                *m,
+                challenger_name=f"{m['challenger_first_name']} {m['challenger_last_name']}",
+                challenged_name=f"{m['challenged_first_name']} {m['challenged_last_name']}",
+                winner_name=f"{m['winner_first_name']} {m['winner_last_name']}",
+                loser_name=f"{m['loser_first_name']} {m['loser_last_name']}",
+            )
+            for m in matches_db
+        )
 
-        return jsonify(matches), 200
+        return list_response(matches, next_cursor)
 
+    except InvalidPageArgs as e:
+        return jsonify({"error": f"Parámetros de paginación inválidos: {e}"}), 400
     except sqlite3.Error as e:
-        print(f"ERROR DB: [get_all_matches_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [get_all_matches_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al obtener todos los partidos: {str(e)}"}), 500
     except Exception as e:
-        print(f"ERROR GENERICO: [get_all_matches_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [get_all_matches_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al obtener todos los partidos: {str(e)}"}), 500
 
+# {keyset}: '1' (primera página) o la condición de keyset_before('dm.date', 'dm.id', ...)
+ALL_DOUBLES_MATCHES_SQL = '''
+    SELECT dm.id, dm.date, dm.score_text,
+           t_a.team_name AS team_a_name,
+           t_b.team_name AS team_b_name,
+           t_winner.team_name AS winner_team_name,
+           t_loser.team_name AS loser_team_name,
+           tourn.name AS tournament_name
+    FROM DoublesMatches dm
+    JOIN TournamentTeams tt_a ON dm.team_a_id = tt_a.id
+    JOIN Teams t_a ON tt_a.team_id = t_a.id
+    JOIN TournamentTeams tt_b ON dm.team_b_id = tt_b.id
+    JOIN Teams t_b ON tt_b.team_id = t_b.id
+    JOIN TournamentTeams tt_winner ON dm.winner_team_id = tt_winner.id
+    JOIN Teams t_winner ON tt_winner.team_id = t_winner.id
+    JOIN TournamentTeams tt_loser ON dm.loser_team_id = tt_loser.id
+    JOIN Teams t_loser ON tt_loser.team_id = t_loser.id
+    JOIN Tournaments tourn ON dm.tournament_id = tourn.id
+    WHERE dm.tournament_id = ?
+      AND (t_a.gender_category = ? OR t_b.gender_category = ?)
+      AND {keyset}
+    ORDER BY dm.date DESC, dm.id DESC
+    LIMIT ?'''
+
 @app.route('/api/all_doubles_matches', methods=['GET'])
 @login_required # Proteger este endpoint si solo el organizador debe ver todos los partidos de dobles
 def get_all_doubles_matches_api():
@@ -1310,45 +3055,42 @@ def get_all_doubles_matches_api():
     # --- FIN NUEVA LÓGICA ---
 
     try:
-        doubles_matches_db = db.execute(
-            '''SELECT dm.id, dm.date, dm.score_text,
-                      t_a.team_name AS team_a_name,
-                      t_b.team_name AS team_b_name,
-                      t_winner.team_name AS winner_team_name,
-                      t_loser.team_name AS loser_team_name,
-                      tourn.name AS tournament_name
-               FROM DoublesMatches dm
-               JOIN TournamentTeams tt_a ON dm.team_a_id = tt_a.id
-               JOIN Teams t_a ON tt_a.team_id = t_a.id
-               JOIN TournamentTeams tt_b ON dm.team_b_id = tt_b.id
-               JOIN Teams t_b ON tt_b.team_id = t_b.id
-               JOIN TournamentTeams tt_winner ON dm.winner_team_id = tt_winner.id
-               JOIN Teams t_winner ON tt_winner.team_id = t_winner.id
-               JOIN TournamentTeams tt_loser ON dm.loser_team_id = tt_loser.id
-               JOIN Teams t_loser ON tt_loser.team_id = t_loser.id
-               JOIN Tournaments tourn ON dm.tournament_id = tourn.id
-               WHERE dm.tournament_id = ?
-                 AND (t_a.gender_category = ? OR t_b.gender_category = ?)
-               ORDER BY dm.date DESC''',
-            (active_tournament_id, gender_filter, gender_filter)
-        ).fetchall()
+        not_modified = not_modified_response(
+            db, ('teams', 'tournaments', f'tournament_teams_{active_tournament_id}',
+                 f'doubles_matches_{active_tournament_id}'),
+            private=True
+        )
+        if not_modified:
+            return not_modified
 
-        matches = []
-        for dm in doubles_matches_db:
-            match_dict = dict(dm)
-            match_dict['challenger_name'] = dm['team_a_name']
-            match_dict['challenged_name'] = dm['team_b_name']
-            match_dict['winner_name'] = dm['winner_team_name']
-            match_dict['loser_name'] = dm['loser_team_name']
-            matches.append(match_dict)
+        limit, cursor = parse_page_args(tuple[str, int])
+        keyset_sql, keyset_params = keyset_before('dm.date', 'dm.id', *cursor) if cursor else ('1', [])
+        doubles_matches_db = db.execute(
+            ALL_DOUBLES_MATCHES_SQL.format(keyset=keyset_sql),
+            (active_tournament_id, gender_filter, gender_filter, *keyset_params, limit + 1 if limit else -1)
+        )
+        doubles_matches_db, next_cursor = take_page(doubles_matches_db, limit, lambda dm: (dm['date'], dm['id']))
+
+        matches = (
+            DoublesMatchOut(
+                *dm,
+                challenger_name=dm['team_a_name'],
+                challenged_name=dm['team_b_name'],
+                winner_name=dm['winner_team_name'],
+                loser_name=dm['loser_team_name'],
+            )
+            for dm in doubles_matches_db
+        )
 
-        return jsonify(matches), 200
+        return list_response(matches, next_cursor)
 
+    except InvalidPageArgs as e:
+        return jsonify({"error": f"Parámetros de paginación inválidos: {e}"}), 400
     except sqlite3.Error as e:
-        print(f"ERROR DB: [get_all_doubles_matches_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [get_all_doubles_matches_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al obtener todos los partidos de dobles: {str(e)}"}), 500
     except Exception as e:
-        print(f"ERROR GENERICO: [get_all_doubles_matches_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [get_all_doubles_matches_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al obtener todos los partidos de dobles: {str(e)}"}), 500
 
 @app.route('/api/validate_challenge', methods=['POST'])
@@ -1360,6 +3102,10 @@ def validate_challenge_api():
 
     if not all([challenger_id, challenged_id]):
         return jsonify({"error": "Faltan IDs de jugadores."}), 400
+    try:
+        challenger_id, challenged_id = int(challenger_id), int(challenged_id)
+    except (TypeError, ValueError):
+        return jsonify({"error": "IDs de jugadores inválidos."}), 400
 
     db = get_db()
     
@@ -1367,68 +3113,83 @@ def validate_challenge_api():
     if not active_tournament_id:
         return jsonify({"valid": False, "message": "No hay un torneo de pirámide individual activo para validar desafíos."}), 400
 
-    all_players_positions = db.execute('SELECT id, current_position FROM Players ORDER BY current_position ASC').fetchall()
-    
-    challenger_player = next((p for p in all_players_positions if p['id'] == challenger_id), None)
-    challenged_player = next((p for p in all_players_positions if p['id'] == challenged_id), None)
-
-    if not challenger_player or not challenged_player:
+    ladder = get_singles_ladder(db)
+    if challenger_id not in ladder or challenged_id not in ladder:
         return jsonify({"error": "Uno o ambos jugadores no encontrados."}), 404
 
-    challenger_pos = challenger_player['current_position']
-    challenged_pos = challenged_player['current_position']
-    total_players = len(all_players_positions)
+    is_valid = ladder.can_challenge(challenger_id, challenged_id)
+    message = challenge_rule_message(ladder.pos_of[challenger_id], ladder.total, is_valid, 'jugador', 'jugadores')
+    return jsonify({"valid": is_valid, "message": message}), 200
 
-    is_valid = False
-    message = "Desafío no permitido."
+@app.route('/api/challenge_eligibility', methods=['GET'])
+@login_required
+def get_challenge_eligibility_api():
+    """Mapa completo de desafíos permitidos de una pirámide en una sola respuesta.
 
-    if challenger_pos == 1: # Puesto 1
-        if challenged_pos >= 2 and challenged_pos <= 6:
-            is_valid = True
-            message = "Desafío permitido: Puesto 1 puede desafiar a 2-6."
-        else:
-            message = "Puesto 1 solo puede desafiar a jugadores entre el puesto 2 y 6."
-    elif challenger_pos == 2: # Puesto 2
-        if challenged_pos in [1, 3, 4]:
-            is_valid = True
-            message = "Desafío permitido: Puesto 2 puede desafiar a 1, 3 y 4."
-        else:
-            message = "Puesto 2 solo puede desafiar a jugadores en los puestos 1, 3 y 4."
-    elif challenger_pos == 3: # Puesto 3
-        if challenged_pos in [1, 2, 4]:
-            is_valid = True
-            message = "Desafío permitido: Puesto 3 puede desafiar a 1, 2 y 4."
-        else:
-            message = "Puesto 3 solo puede desafiar a jugadores en los puestos 1, 2 y 4."
-    elif challenger_pos == total_players: # Último jugador
-        if challenged_pos >= (total_players - 5) and challenged_pos < total_players: # Los 5 de arriba
-            is_valid = True
-            message = "Desafío permitido: Último jugador puede desafiar a los 5 de arriba."
-        else:
-            message = "El último jugador solo puede desafiar a los 5 jugadores inmediatamente superiores."
-    elif challenger_pos >= 4: # Puesto 4 en adelante (no el último)
-        if challenged_pos >= (challenger_pos - 3) and challenged_pos < challenger_pos:
-            is_valid = True
-            message = "Desafío permitido: Puede desafiar a los 3 jugadores inmediatamente superiores."
+    Sin parámetros devuelve la pirámide individual; con ?gender=Masculino|Femenino, la de dobles
+    del torneo activo de ese género (los IDs son entonces de Teams globales, como en
+    /api/validate_doubles_challenge).
+    """
+    db = get_db()
+    gender_filter = request.args.get('gender')
+    try:
+        if gender_filter:
+            if gender_filter == 'Masculino':
+                tournament_type = 'pyramid_doubles_male'
+            elif gender_filter == 'Femenino':
+                tournament_type = 'pyramid_doubles_female'
+            else:
+                return jsonify({"error": "Género inválido. Use Masculino o Femenino."}), 400
+            active_tournament_id = get_active_tournament_id_by_type(tournament_type)
+            if not active_tournament_id:
+                return jsonify({"error": f"No hay un torneo de pirámide de dobles {gender_filter} activo."}), 404
+            ladder = get_doubles_ladder(db, active_tournament_id, gender_filter)
         else:
-            message = "Solo puedes desafiar a los 3 jugadores inmediatamente superiores."
-    
-    if is_valid:
-        return jsonify({"valid": True, "message": message}), 200
-    else:
-        return jsonify({"valid": False, "message": message}), 200
+            active_tournament_id = get_active_tournament_id_by_type('pyramid_single')
+            if not active_tournament_id:
+                return jsonify({"error": "No hay un torneo de pirámide individual activo."}), 404
+            ladder = get_singles_ladder(db)
+
+        # Una sola pasada por la pirámide en orden de puesto
+        eligibility = [
+            ChallengeEligibilityOut(id=participant_id, position=position, targets=ladder.targets(participant_id))
+            for position, participants in enumerate(ladder.slots)
+            for participant_id in participants
+        ]
+        return jsonify({
+            "tournament_id": active_tournament_id,
+            "kind": "doubles" if gender_filter else "single",
+            "total": ladder.total,
+            "eligibility": eligibility,
+        }), 200
+
+    except sqlite3.Error as e:
+        logger.error("DB: [get_challenge_eligibility_api] Error de SQLite: %s", e)
+        return jsonify({"error": f"Error de base de datos al calcular desafíos permitidos: {str(e)}"}), 500
+    except Exception as e:
+        logger.error("GENERICO: [get_challenge_eligibility_api] Error inesperado: %s", e)
+        return jsonify({"error": f"Error inesperado al calcular desafíos permitidos: {str(e)}"}), 500
+
+DUPLICATE_CHALLENGE_SQL = "SELECT id FROM Challenges WHERE challenger_id = ? AND challenged_id = ? AND status = 'pending'"
 
 @app.route('/api/propose_challenge', methods=['POST'])
 @login_required 
 def propose_challenge_api():
     data = request.get_json()
-    print(f"DEBUG: [propose_challenge_api] Datos recibidos: {data}")
+    logger.debug("[propose_challenge_api] Datos recibidos: %s", data)
     challenger_id = data.get('challengerId')
     challenged_id = data.get('challengedId')
 
     if not all([challenger_id, challenged_id]):
-        print("DEBUG: [propose_challenge_api] Faltan IDs de jugadores.")
+        logger.debug("[propose_challenge_api] Faltan IDs de jugadores.")
         return jsonify({"error": "Faltan IDs de jugadores para proponer el desafío."}), 400
+    try:
+        challenger_id, challenged_id = int(challenger_id), int(challenged_id)
+    except (TypeError, ValueError):
+        return jsonify({"error": "IDs de jugadores inválidos."}), 400
+
+    if challenger_id == challenged_id:
+        return jsonify({"error": "Un jugador no puede desafiarse a sí mismo."}), 400
 
     db = get_db()
     cursor = db.cursor()
@@ -1439,13 +3200,20 @@ def propose_challenge_api():
         if not active_tournament_id:
             return jsonify({"error": "No hay un torneo de pirámide individual activo para proponer desafíos."}), 400
 
-        existing_challenge = db.execute(
-            '''SELECT id FROM Challenges WHERE challenger_id = ? AND challenged_id = ? AND status = 'pending' ''',
-            (challenger_id, challenged_id)
-        ).fetchone()
+        # Aplicar las mismas reglas de la pirámide que /api/validate_challenge
+        ladder = get_singles_ladder(db)
+        if challenger_id not in ladder or challenged_id not in ladder:
+            return jsonify({"error": "Uno o ambos jugadores no encontrados."}), 404
+        if not ladder.can_challenge(challenger_id, challenged_id):
+            validation_message = challenge_rule_message(
+                ladder.pos_of[challenger_id], ladder.total, False, 'jugador', 'jugadores'
+            )
+            return jsonify({"error": validation_message}), 400
+
+        existing_challenge = db.execute(DUPLICATE_CHALLENGE_SQL, (challenger_id, challenged_id)).fetchone()
 
         if existing_challenge:
-            print(f"DEBUG: [propose_challenge_api] Desafío ya existe (ID: {existing_challenge['id']}).")
+            logger.debug("[propose_challenge_api] Desafío ya existe (ID: %s).", existing_challenge['id'])
             return jsonify({"error": "Ya existe un desafío pendiente entre estos jugadores."}), 409
 
         cursor.execute(
@@ -1454,19 +3222,31 @@ def propose_challenge_api():
             (active_tournament_id, challenger_id, challenged_id, 'pending')
         )
         inserted_id = cursor.lastrowid
-        print(f"DEBUG: [propose_challenge_api] Intentando COMMIT para challenge_id: {inserted_id}")
+        logger.debug("[propose_challenge_api] Intentando COMMIT para challenge_id: %s", inserted_id)
         db.commit()
-        print(f"DEBUG: [propose_challenge_api] COMMIT EXITOSO para challenge_id: {inserted_id}")
+        logger.debug("[propose_challenge_api] COMMIT EXITOSO para challenge_id: %s", inserted_id)
         return jsonify({"message": "Desafío propuesto y registrado como pendiente.", "challenge_id": inserted_id}), 201
 
     except sqlite3.Error as e:
-        print(f"ERROR DB: [propose_challenge_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [propose_challenge_api] Error de SQLite: %s", e)
         db.rollback()
         return jsonify({"error": f"Error de base de datos al proponer desafío: {str(e)}"}), 500
     except Exception as e:
-        print(f"ERROR GENERICO: [propose_challenge_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [propose_challenge_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al proponer desafío: {str(e)}"}), 500
 
+PENDING_CHALLENGES_SQL = '''
+    SELECT c.id, c.challenger_id, c.challenged_id, c.status, c.created_at,
+           p_chal.first_name AS challenger_first_name, p_chal.last_name AS challenger_last_name,
+           p_chd.first_name AS challenged_first_name, p_chd.last_name AS challenged_last_name,
+           t.name AS tournament_name
+    FROM Challenges c
+    JOIN Players p_chal ON c.challenger_id = p_chal.id
+    JOIN Players p_chd ON c.challenged_id = p_chd.id
+    JOIN Tournaments t ON c.tournament_id = t.id -- Unir con Tournaments
+    WHERE c.status = 'pending' AND c.tournament_id = ?
+    ORDER BY c.created_at DESC'''
+
 @app.route('/api/pending_challenges', methods=['GET'])
 @login_required 
 def get_pending_challenges_api():
@@ -1478,16 +3258,7 @@ def get_pending_challenges_api():
             return jsonify({"message": "No hay un torneo de pirámide individual activo para listar desafíos pendientes."}), 404
 
         pending_challenges_db = db.execute(
-            '''SELECT c.id, c.challenger_id, c.challenged_id, c.status, c.created_at,
-                      p_chal.first_name AS challenger_first_name, p_chal.last_name AS challenger_last_name,
-                      p_chd.first_name AS challenged_first_name, p_chd.last_name AS challenged_last_name,
-                      t.name AS tournament_name
-               FROM Challenges c
-               JOIN Players p_chal ON c.challenger_id = p_chal.id
-               JOIN Players p_chd ON c.challenged_id = p_chd.id
-               JOIN Tournaments t ON c.tournament_id = t.id -- Unir con Tournaments
-               WHERE c.status = 'pending' AND c.tournament_id = ?
-               ORDER BY c.created_at DESC''',
+            PENDING_CHALLENGES_SQL,
             (active_tournament_id,)
         ).fetchall()
 
@@ -1501,14 +3272,15 @@ def get_pending_challenges_api():
         return jsonify(challenges), 200
 
     except sqlite3.Error as e:
-        print(f"ERROR DB: [get_pending_challenges_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [get_pending_challenges_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al obtener desafíos pendientes: {str(e)}"}), 500
     except Exception as e:
-        print(f"ERROR GENERICO: [get_pending_challenges_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [get_pending_challenges_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al obtener desafíos pendientes: {str(e)}"}), 500
 
 @app.route('/api/match_result', methods=['POST'])
 @login_required 
+@idempotent
 def post_match_result_api():
     data = request.get_json()
     challenger_id = int(data.get('challengerId'))
@@ -1527,6 +3299,9 @@ def post_match_result_api():
         if not active_tournament_id:
             return jsonify({"error": "No hay un torneo de pirámide individual activo para registrar resultados."}), 400
 
+        # Las posiciones se leen ya con el lock de escritura tomado
+        begin_immediate(db, 'match_result')
+
         tournament_info = db.execute("SELECT type FROM Tournaments WHERE id = ?", (active_tournament_id,)).fetchone()
         if not tournament_info:
             return jsonify({"error": "Información del torneo activo no encontrada."}), 500
@@ -1558,16 +3333,18 @@ def post_match_result_api():
                 final_challenger_pos = challenged['current_position']
                 final_challenged_pos = challenger['current_position']
                 positions_swapped = True
-                print(f"DEBUG: Standard swap - Challenger {challenger_id} won against {challenged_id}. Positions swapped.")
+                logger.debug("Standard swap - Challenger %s won against %s. Positions swapped.", challenger_id, challenged_id)
 
             elif not challenger_won_match and challenger['current_position'] == 1:
                 final_challenger_pos = challenged['current_position']
                 final_challenged_pos = challenger['current_position']
                 positions_swapped = True
-                print(f"DEBUG: Puesto 1 lost - Challenger {challenger_id} (P1) lost to {challenged_id}. Positions swapped.")
+                logger.debug("Puesto 1 lost - Challenger %s (P1) lost to %s. Positions swapped.", challenger_id, challenged_id)
 
             cursor.execute("UPDATE Players SET current_position = ? WHERE id = ?", (final_challenger_pos, challenger_id))
             cursor.execute("UPDATE Players SET current_position = ? WHERE id = ?", (final_challenged_pos, challenged_id))
+            if positions_swapped:
+                ladder_version = bump_ladder_version(cursor, ('single',))
             
             cursor.execute("UPDATE Players SET challenges_emitted_single = challenges_emitted_single + 1, last_activity_update = CURRENT_TIMESTAMP WHERE id = ?", (challenger_id,))
             cursor.execute("UPDATE Players SET challenges_accepted_single = challenges_accepted_single + 1, last_activity_update = CURRENT_TIMESTAMP WHERE id = ?", (challenged_id,))
@@ -1576,11 +3353,9 @@ def post_match_result_api():
                 cursor.execute("UPDATE Players SET challenges_won_single = challenges_won_single + 1, last_activity_update = CURRENT_TIMESTAMP WHERE id = ?", (challenger_id,))
             else:
                 cursor.execute("UPDATE Players SET defenses_successful_single = defenses_successful_single + 1, last_activity_update = CURRENT_TIMESTAMP WHERE id = ?", (challenged_id,))
-            
-            _recalculate_player_activity_status(challenger_id)
-            _recalculate_player_activity_status(challenged_id)
+            # activity_index_single / activity_status los recalculan los triggers de Players
         else:
-            print(f"DEBUG: Partido individual en torneo tipo '{tournament_info['type']}' no afecta Ranking Maestro.")
+            logger.debug("Partido individual en torneo tipo '%s' no afecta Ranking Maestro.", tournament_info['type'])
             
         match_id_inserted = cursor.execute(
             """INSERT INTO Matches (tournament_id, date, challenger_id, challenged_id, winner_id, loser_id, score_text, is_challenger_winner, positions_swapped, status)
@@ -1602,21 +3377,28 @@ def post_match_result_api():
         
         if challenge_id:
             cursor.execute("UPDATE Challenges SET status = 'played' WHERE id = ?", (challenge_id,))
-            print(f"DEBUG: [post_match_result_api] Desafío pendiente {challenge_id} marcado como 'played'.")
+            logger.debug("[post_match_result_api] Desafío pendiente %s marcado como 'played'.", challenge_id)
         
+        response = jsonify({"message": "Resultado procesado exitosamente."})
+        store_idempotent_response(response)
         db.commit()
+        if positions_swapped:
+            commit_ladder_moves(('single',), ladder_version, {challenger_id: final_challenger_pos, challenged_id: final_challenged_pos})
         
-        g.pop('db', None)
-        db.close()
-        return jsonify({"message": "Resultado procesado exitosamente."}), 200
+        return response
 
+    except WriteLockTimeout:
+        return write_busy_response()
+    except IdempotencyClaimLost:
+        db.rollback()
+        return claim_lost_response()
     except sqlite3.Error as e:
         db.rollback()
-        print(f"ERROR DB: [post_match_result_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [post_match_result_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error en la base de datos: {str(e)}"}), 500
     except Exception as e:
         db.rollback() 
-        print(f"ERROR GENERICO: [post_match_result_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [post_match_result_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al procesar el resultado: {str(e)}"}), 500
 
 
@@ -1629,19 +3411,23 @@ def reset_leaderboard_api():
         db.commit()
         return jsonify({"message": "Tabla reiniciada para un nuevo período exitosamente."}), 200
     except sqlite3.Error as e:
-        print(f"ERROR DB: [reset_leaderboard_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [reset_leaderboard_api] Error de SQLite: %s", e)
         db.rollback()
         return jsonify({"error": f"Error al reiniciar la tabla: {str(e)}"}), 500
     except Exception as e:
-        print(f"ERROR GENERICO: [reset_leaderboard_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [reset_leaderboard_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al reiniciar la tabla: {str(e)}"}), 500
 
+DELETE_MATCH_ACTIVITY_SQL = 'DELETE FROM ActivityLog WHERE match_id = ?'
+
 @app.route('/api/matches/<int:match_id>/delete', methods=['POST'])
 @login_required 
 def delete_match_api(match_id):
     db = get_db()
     cursor = db.cursor()
+    ladder_moves = {}
     try:
+        begin_immediate(db, 'delete_match')
         # Obtener el partido para saber sus IDs de jugadores, si hubo intercambio y a qué torneo pertenece
         match = db.execute('SELECT challenger_id, challenged_id, winner_id, loser_id, positions_swapped, tournament_id FROM Matches WHERE id = ?', (match_id,)).fetchone()
         if not match:
@@ -1660,8 +3446,6 @@ def delete_match_api(match_id):
         if is_pyramid_single_tournament:
             winner_id = match['winner_id']
             loser_id = match['loser_id']
-            challenger_id = match['challenger_id']
-            challenged_id = match['challenged_id']
 
             # 1. Revertir posiciones si hubo intercambio
             if match['positions_swapped']:
@@ -1671,7 +3455,8 @@ def delete_match_api(match_id):
                 # Intercambiar de nuevo las posiciones
                 cursor.execute("UPDATE Players SET current_position = ? WHERE id = ?", (loser_pos, winner_id))
                 cursor.execute("UPDATE Players SET current_position = ? WHERE id = ?", (winner_pos, loser_id))
-                print(f"DEBUG: [delete_match_api] Posiciones revertidas para {winner_id} y {loser_id} en Ranking Maestro.")
+                ladder_moves = {winner_id: loser_pos, loser_id: winner_pos}
+                logger.debug("[delete_match_api] Posiciones revertidas para %s y %s en Ranking Maestro.", winner_id, loser_id)
             
             # 2. Revertir contadores de actividad en Players (Ranking Maestro)
             # Esto es más complejo y requiere decidir cómo revertir.
@@ -1680,34 +3465,35 @@ def delete_match_api(match_id):
             # llevar a inconsistencias si no se maneja bien.
             # Si se desea revertir contadores, habría que restar 1 a los contadores
             # adecuados (ej. challenges_won_single para el ganador, etc.)
-            # y luego llamar a _recalculate_player_activity_status para ambos jugadores.
+            # y los triggers de Players recalcularían el índice y el estado de actividad.
             # Por ahora, solo revertimos posiciones y eliminamos el partido.
-            
-            # Recalcular actividad de los jugadores afectados (por si acaso, aunque contadores no se reviertan)
-            _recalculate_player_activity_status(challenger_id)
-            _recalculate_player_activity_status(challenged_id)
-            print(f"DEBUG: [delete_match_api] Actividad de jugadores {challenger_id} y {challenged_id} recalculada.")
 
         else:
-            print(f"DEBUG: [delete_match_api] Partido en torneo tipo '{tournament_info['type']}' no afecta Ranking Maestro. No se revierten posiciones ni actividad global.")
+            logger.debug("[delete_match_api] Partido en torneo tipo '%s' no afecta Ranking Maestro. No se revierten posiciones ni actividad global.", tournament_info['type'])
         # --- FIN LÓGICA DE REVERSIÓN ---
 
         # Eliminar el partido de la tabla Matches
         cursor.execute('DELETE FROM Matches WHERE id = ?', (match_id,))
         
         # Opcional: Eliminar entradas relacionadas en ActivityLog para este partido
-        cursor.execute('DELETE FROM ActivityLog WHERE match_id = ?', (match_id,))
-        print(f"DEBUG: [delete_match_api] Partido {match_id} y sus entradas en ActivityLog eliminados.")
+        cursor.execute(DELETE_MATCH_ACTIVITY_SQL, (match_id,))
+        logger.debug("[delete_match_api] Partido %s y sus entradas en ActivityLog eliminados.", match_id)
 
+        if ladder_moves:
+            ladder_version = bump_ladder_version(cursor, ('single',))
         db.commit()
+        if ladder_moves:
+            commit_ladder_moves(('single',), ladder_version, ladder_moves)
         return jsonify({"message": "Partido eliminado y posiciones revertidas exitosamente."}), 200
+    except WriteLockTimeout:
+        return write_busy_response()
     except sqlite3.Error as e:
         db.rollback()
-        print(f"ERROR DB: [delete_match_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [delete_match_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al eliminar el partido: {str(e)}"}), 500
     except Exception as e:
         db.rollback()
-        print(f"ERROR GENERICO: [delete_match_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [delete_match_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al eliminar el partido: {str(e)}"}), 500
 
 @app.route('/api/doubles_challenges/<int:challenge_id>/reject', methods=['POST'])
@@ -1726,8 +3512,13 @@ def mark_rejected_doubles_challenge_api(challenge_id):
 
         challenged_team_id = challenge['team_b_id']
         
-        # Obtener los IDs de los jugadores del equipo desafiado (esto ya existe, lo mantenemos)
-        challenged_team = db.execute('SELECT player1_id, player2_id FROM Teams WHERE id = ?', (challenged_team_id,)).fetchone()
+        # Obtener los IDs de los jugadores del equipo desafiado (team_b_id es un TournamentTeams.id)
+        challenged_team = db.execute(
+            '''SELECT t.player1_id, t.player2_id
+               FROM TournamentTeams tt JOIN Teams t ON t.id = tt.team_id
+               WHERE tt.id = ?''',
+            (challenged_team_id,)
+        ).fetchone()
         if not challenged_team:
             return jsonify({"error": "Equipo desafiado no encontrado."}), 404
 
@@ -1755,7 +3546,7 @@ def mark_rejected_doubles_challenge_api(challenge_id):
         # --- NUEVA LÓGICA DE ACTIVIDAD PARA EQUIPOS DE DOBLES ---
         # Actualizar el contador de rechazos del EQUIPO desafiado
         cursor.execute(
-            """UPDATE Teams SET
+            """UPDATE TournamentTeams SET
                rejections_team_doubles_current_cycle = rejections_team_doubles_current_cycle + 1,
                rejections_team_doubles_total = rejections_team_doubles_total + 1,
                last_activity_team_doubles_update = CURRENT_TIMESTAMP
@@ -1767,25 +3558,18 @@ def mark_rejected_doubles_challenge_api(challenge_id):
         # Marcar el desafío de dobles como rechazado en la tabla DoublesMatches (esto ya existe, lo mantenemos)
         cursor.execute("UPDATE DoublesMatches SET status = 'rejected' WHERE id = ?", (challenge_id,))
 
+        # El estado de actividad de jugadores y equipo lo recalculan los triggers
         db.commit()
 
-        # Recalcular el estado de actividad para ambos jugadores del equipo desafiado (esto ya existe, lo mantenemos)
-        _recalculate_player_activity_status(player1_challenged_id)
-        _recalculate_player_activity_status(player2_challenged_id)
-
-        # --- NUEVA LLAMADA: Recalcular el estado de actividad para el EQUIPO desafiado ---
-        _recalculate_team_doubles_activity_status(challenged_team_id)
-        # --- FIN NUEVA LLAMADA ---
-
         return jsonify({"message": "Desafío de dobles marcado como rechazado exitosamente."}), 200
 
     except sqlite3.Error as e:
         db.rollback()
-        print(f"ERROR DB: [mark_rejected_doubles_challenge_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [mark_rejected_doubles_challenge_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al marcar desafío de dobles como rechazado: {str(e)}"}), 500
     except Exception as e:
         db.rollback()
-        print(f"ERROR GENERICO: [mark_rejected_doubles_challenge_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [mark_rejected_doubles_challenge_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al marcar desafío de dobles como rechazado: {str(e)}"}), 500
 
 
@@ -1805,35 +3589,34 @@ def mark_ignored_doubles_challenge_api(challenge_id):
 
         challenger_team_id = challenge['team_a_id']
 
-        # Obtener los IDs de los jugadores del equipo desafiante (esto ya existe, lo mantenemos)
-        challenger_team = db.execute('SELECT player1_id, player2_id FROM Teams WHERE id = ?', (challenger_team_id,)).fetchone()
+        # Obtener los IDs de los jugadores del equipo desafiante (team_a_id es un TournamentTeams.id)
+        challenger_team = db.execute(
+            '''SELECT t.player1_id, t.player2_id
+               FROM TournamentTeams tt JOIN Teams t ON t.id = tt.team_id
+               WHERE tt.id = ?''',
+            (challenger_team_id,)
+        ).fetchone()
         if not challenger_team:
             return jsonify({"error": "Equipo desafiante no encontrado."}), 404
 
         player1_challenger_id = challenger_team['player1_id']
         player2_challenger_id = challenger_team['player2_id']
 
-        # Otorgar +1 punto simbólico en el índice de actividad de dobles de AMBOS jugadores individuales (esto ya existe, lo mantenemos)
+        # Otorgar +1 punto simbólico en el índice de actividad de dobles de AMBOS jugadores individuales
+        # (se acumula en ignored_bonus_doubles, que el trigger de Players suma al índice)
         cursor.execute(
             """UPDATE Players SET 
-               activity_index_doubles = activity_index_doubles + 1, 
+               ignored_bonus_doubles = ignored_bonus_doubles + 1, 
                last_activity_update = CURRENT_TIMESTAMP 
-               WHERE id = ?""",
-            (player1_challenger_id,)
-        )
-        cursor.execute(
-            """UPDATE Players SET 
-               activity_index_doubles = activity_index_doubles + 1, 
-               last_activity_update = CURRENT_TIMESTAMP 
-               WHERE id = ?""",
-            (player2_challenger_id,)
+               WHERE id IN (?, ?)""",
+            (player1_challenger_id, player2_challenger_id)
         )
         
         # --- NUEVA LÓGICA DE ACTIVIDAD PARA EQUIPOS DE DOBLES ---
         # Otorgar +1 punto simbólico en el índice de actividad del EQUIPO desafiante
         cursor.execute(
-            """UPDATE Teams SET
-               activity_index_team_doubles = activity_index_team_doubles + 1,
+            """UPDATE TournamentTeams SET
+               ignored_bonus_team_doubles = ignored_bonus_team_doubles + 1,
                last_activity_team_doubles_update = CURRENT_TIMESTAMP
                WHERE id = ?""",
             (challenger_team_id,)
@@ -1843,92 +3626,121 @@ def mark_ignored_doubles_challenge_api(challenge_id):
         # Marcar el desafío de dobles como ignorado en la tabla DoublesMatches (esto ya existe, lo mantenemos)
         cursor.execute("UPDATE DoublesMatches SET status = 'ignored' WHERE id = ?", (challenge_id,))
 
+        # El estado de actividad de jugadores y equipo lo recalculan los triggers
         db.commit()
 
-        # Recalcular el estado de actividad para ambos jugadores del equipo desafiante (esto ya existe, lo mantenemos)
-        _recalculate_player_activity_status(player1_challenger_id)
-        _recalculate_player_activity_status(player2_challenger_id)
-
-        # --- NUEVA LLAMADA: Recalcular el estado de actividad para el EQUIPO desafiante ---
-        _recalculate_team_doubles_activity_status(challenger_team_id)
-        # --- FIN NUEVA LLAMADA ---
-
         return jsonify({"message": "Desafío de dobles marcado como ignorado y retadores compensados."}), 200
 
     except sqlite3.Error as e:
         db.rollback()
-        print(f"ERROR DB: [mark_ignored_doubles_challenge_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [mark_ignored_doubles_challenge_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al marcar desafío de dobles como ignorado: {str(e)}"}), 500
     except Exception as e:
         db.rollback()
-        print(f"ERROR GENERICO: [mark_ignored_doubles_challenge_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [mark_ignored_doubles_challenge_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al marcar desafío de dobles como ignorado: {str(e)}"}), 500
 
+# {singles_keyset} / {doubles_keyset}: '1' o la condición de keyset_before() de cada rama
+PLAYER_HISTORY_SQL = '''
+    WITH player_tournament_teams AS (
+        -- Inscripciones (TournamentTeams.id) de los equipos del jugador: es lo que
+        -- guardan DoublesMatches.team_a_id / team_b_id
+        SELECT tt.id FROM TournamentTeams tt
+        JOIN Teams t ON tt.team_id = t.id
+        WHERE t.player1_id = ? OR t.player2_id = ?
+    )
+    SELECT m.id, m.date, m.score_text, m.winner_id, m.loser_id, m.challenger_id, m.challenged_id,
+           p_challenger.first_name AS challenger_first_name, p_challenger.last_name AS challenger_last_name,
+           p_challenged.first_name AS challenged_first_name, p_challenged.last_name AS challenged_last_name,
+           p_winner.first_name AS winner_first_name, p_winner.last_name AS winner_last_name,
+           p_loser.first_name AS loser_first_name, p_loser.last_name AS loser_last_name,
+           'single' AS match_type
+    FROM Matches m
+    JOIN Players p_challenger ON m.challenger_id = p_challenger.id
+    JOIN Players p_challenged ON m.challenged_id = p_challenged.id
+    JOIN Players p_winner ON m.winner_id = p_winner.id
+    JOIN Players p_loser ON m.loser_id = p_loser.id
+    WHERE (m.challenger_id = ? OR m.challenged_id = ?) AND {singles_keyset}
+    UNION ALL
+    SELECT dm.id, dm.date, dm.score_text, dm.winner_team_id, dm.loser_team_id,
+           t_a.team_name, t_b.team_name, t_winner.team_name, t_loser.team_name,
+           NULL, NULL, NULL, NULL, NULL, NULL,
+           'doubles'
+    FROM DoublesMatches dm
+    JOIN TournamentTeams tt_a ON dm.team_a_id = tt_a.id
+    JOIN Teams t_a ON tt_a.team_id = t_a.id
+    JOIN TournamentTeams tt_b ON dm.team_b_id = tt_b.id
+    JOIN Teams t_b ON tt_b.team_id = t_b.id
+    JOIN TournamentTeams tt_winner ON dm.winner_team_id = tt_winner.id
+    JOIN Teams t_winner ON tt_winner.team_id = t_winner.id
+    JOIN TournamentTeams tt_loser ON dm.loser_team_id = tt_loser.id
+    JOIN Teams t_loser ON tt_loser.team_id = t_loser.id
+    WHERE (dm.team_a_id IN player_tournament_teams OR dm.team_b_id IN player_tournament_teams)
+      AND {doubles_keyset}
+    ORDER BY 2 DESC, 16 DESC, 1 DESC
+    LIMIT ?'''
+
 @app.route('/api/players/<int:player_id>/history', methods=['GET'])
 @login_required 
 def get_player_history_api(player_id):
     db = get_db()
     try:
-        # Obtener partidos individuales del jugador
-        individual_matches_db = db.execute(
-            '''SELECT m.id, m.date, m.score_text, m.winner_id, m.loser_id, m.challenger_id, m.challenged_id,
-                      p_challenger.first_name AS challenger_first_name, p_challenger.last_name AS challenger_last_name,
-                      p_challenged.first_name AS challenged_first_name, p_challenged.last_name AS challenged_last_name,
-                      p_winner.first_name AS winner_first_name, p_winner.last_name AS winner_last_name,
-                      p_loser.first_name AS loser_first_name, p_loser.last_name AS loser_last_name,
-                      'single' AS match_type -- Añadir tipo de partido
-               FROM Matches m
-               JOIN Players p_challenger ON m.challenger_id = p_challenger.id
-               JOIN Players p_challenged ON m.challenged_id = p_challenged.id
-               JOIN Players p_winner ON m.winner_id = p_winner.id
-               JOIN Players p_loser ON m.loser_id = p_loser.id
-               WHERE m.challenger_id = ? OR m.challenged_id = ?''',
-            (player_id, player_id)
-        ).fetchall()
-
-        # Obtener partidos de dobles del jugador
-        doubles_matches_db = db.execute(
-            '''SELECT dm.id, dm.date, dm.score_text, dm.winner_team_id, dm.loser_team_id,
-                      t_a.team_name AS team_a_name, t_b.team_name AS team_b_name,
-                      t_winner.team_name AS winner_team_name, t_loser.team_name AS loser_team_name,
-                      'doubles' AS match_type -- Añadir tipo de partido
-               FROM DoublesMatches dm
-               JOIN Teams t_a ON dm.team_a_id = t_a.id
-               JOIN Teams t_b ON dm.team_b_id = t_b.id
-               JOIN Teams t_winner ON dm.winner_team_id = t_winner.id
-               JOIN Teams t_loser ON dm.loser_team_id = t_loser.id
-               WHERE t_a.player1_id = ? OR t_a.player2_id = ? OR t_b.player1_id = ? OR t_b.player2_id = ?''',
-            (player_id, player_id, player_id, player_id)
-        ).fetchall()
-
-        all_matches = []
-
-        for m in individual_matches_db:
-            match_dict = dict(m)
-            match_dict['challenger_name'] = f"{m['challenger_first_name']} {m['challenger_last_name']}"
-            match_dict['challenged_name'] = f"{m['challenged_first_name']} {m['challenged_last_name']}"
-            match_dict['winner_name'] = f"{m['winner_first_name']} {m['winner_last_name']}"
-            match_dict['loser_name'] = f"{m['loser_first_name']} {m['loser_last_name']}"
-            all_matches.append(match_dict)
-        
-        for dm in doubles_matches_db:
-            match_dict = dict(dm)
-            match_dict['challenger_name'] = dm['team_a_name'] # Para consistencia en el frontend
-            match_dict['challenged_name'] = dm['team_b_name'] # Para consistencia en el frontend
-            match_dict['winner_name'] = dm['winner_team_name']
-            match_dict['loser_name'] = dm['loser_team_name']
-            all_matches.append(match_dict)
-
-        # Ordenar todos los partidos por fecha de forma descendente
-        all_matches.sort(key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d %H:%M:%S'), reverse=True)
-
-        return jsonify(all_matches), 200
-
+        # Orden del historial: fecha DESC, individuales antes que dobles en la misma fecha, id DESC.
+        # El cursor es (fecha, tipo, id) de la última fila enviada.
+        limit, cursor = parse_page_args(tuple[str, Literal['single', 'doubles'], int])
+        sql_limit = limit + 1 if limit else -1 # -1: sin límite
+
+        def keyset_for(match_type, date_column, id_column):
+            if not cursor:
+                return '1', []
+            cursor_date, cursor_type, cursor_id = cursor
+            if cursor_type == match_type:
+                id_bound = cursor_id
+            else: # En la fecha del cursor: tras un individual van todos los dobles; tras un doble, ningún individual
+                id_bound = sys.maxsize if cursor_type == 'single' else 0
+            return keyset_before(date_column, id_column, cursor_date, id_bound)
+
+        # Un solo UNION ALL ordenado y limitado en SQL: solo se materializa la página pedida.
+        # Las ramas se alinean por posición; la de dobles rellena con NULL las columnas que no tiene
+        # (PlayerHistoryDoublesOut usa las 9 primeras más match_type).
+        # En la misma fecha, match_type DESC deja 'single' antes que 'doubles'.
+        singles_keyset_sql, singles_keyset_params = keyset_for('single', 'm.date', 'm.id')
+        doubles_keyset_sql, doubles_keyset_params = keyset_for('doubles', 'dm.date', 'dm.id')
+        history_db = db.execute(
+            PLAYER_HISTORY_SQL.format(singles_keyset=singles_keyset_sql, doubles_keyset=doubles_keyset_sql),
+            (player_id, player_id, player_id, player_id, *singles_keyset_params, *doubles_keyset_params, sql_limit)
+        )
+        history_db, next_cursor = take_page(history_db, limit, lambda h: (h['date'], h['match_type'], h['id']))
+
+        def history_items():
+            for row in history_db:
+                if row['match_type'] == 'single':
+                    yield PlayerHistorySingleOut(
+                        *row,
+                        challenger_name=f"{row['challenger_first_name']} {row['challenger_last_name']}",
+                        challenged_name=f"{row['challenged_first_name']} {row['challenged_last_name']}",
+                        winner_name=f"{row['winner_first_name']} {row['winner_last_name']}",
+                        loser_name=f"{row['loser_first_name']} {row['loser_last_name']}",
+                    )
+                else:
+                    team_a_name, team_b_name, winner_team_name, loser_team_name = row[5:9]
+                    yield PlayerHistoryDoublesOut(
+                        *row[:9], row['match_type'],
+                        challenger_name=team_a_name, # Para consistencia en el frontend
+                        challenged_name=team_b_name, # Para consistencia en el frontend
+                        winner_name=winner_team_name,
+                        loser_name=loser_team_name,
+                    )
+
+        return list_response(history_items(), next_cursor)
+
+    except InvalidPageArgs as e:
+        return jsonify({"error": f"Parámetros de paginación inválidos: {e}"}), 400
     except sqlite3.Error as e:
-        print(f"ERROR DB: [get_player_history_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [get_player_history_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al obtener historial: {str(e)}"}), 500
     except Exception as e:
-        print(f"ERROR GENERICO: [get_player_history_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [get_player_history_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al obtener historial: {str(e)}"}), 500
 
 # NUEVOS ENDPOINTS PARA EDITAR PARTIDOS
@@ -1969,10 +3781,10 @@ def get_match_details_api(match_id):
         return jsonify(match_dict), 200
 
     except sqlite3.Error as e:
-        print(f"ERROR DB: [get_match_details_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [get_match_details_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al obtener detalles del partido: {str(e)}"}), 500
     except Exception as e:
-        print(f"ERROR GENERICO: [get_match_details_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [get_match_details_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al obtener detalles del partido: {str(e)}"}), 500
 
 # En app.py, dentro de la sección de "API Endpoints"
@@ -1990,7 +3802,9 @@ def edit_match_api(match_id):
 
     db = get_db()
     cursor = db.cursor()
+    ladder_moves = {}
     try:
+        begin_immediate(db, 'edit_match')
         # Obtener el partido original para sus IDs de jugadores, si hubo intercambio y a qué torneo pertenece
         original_match = db.execute(
             'SELECT challenger_id, challenged_id, winner_id, loser_id, positions_swapped, tournament_id FROM Matches WHERE id = ?',
@@ -2027,18 +3841,14 @@ def edit_match_api(match_id):
                 
                 cursor.execute("UPDATE Players SET current_position = ? WHERE id = ?", (loser_current_pos, original_winner_id))
                 cursor.execute("UPDATE Players SET current_position = ? WHERE id = ?", (winner_current_pos, original_loser_id))
-                print(f"DEBUG: [edit_match_api] Posiciones originales revertidas para {original_winner_id} y {original_loser_id} en Ranking Maestro.")
+                logger.debug("[edit_match_api] Posiciones originales revertidas para %s y %s en Ranking Maestro.", original_winner_id, original_loser_id)
             
             # NOTA: Revertir contadores de actividad (challenges_won_single, etc.) es MUY complejo y propenso a errores.
-            # Por ahora, solo nos centramos en las posiciones y la actividad recalculada.
+            # Por ahora, solo nos centramos en las posiciones; como los contadores no cambian,
+            # el índice de actividad (mantenido por triggers) tampoco.
             # Si se desea revertir contadores, se necesita un sistema de logs de actividad mucho más granular.
-
-            # 2. Recalcular contadores de actividad de los jugadores afectados (por si acaso)
-            _recalculate_player_activity_status(original_challenger_id)
-            _recalculate_player_activity_status(original_challenged_id)
-            print(f"DEBUG: [edit_match_api] Actividad de jugadores {original_challenger_id} y {original_challenged_id} recalculada después de reversión.")
         else:
-            print(f"DEBUG: [edit_match_api] Partido en torneo tipo '{tournament_info['type']}' no afecta Ranking Maestro. No se revierten posiciones ni actividad global.")
+            logger.debug("[edit_match_api] Partido en torneo tipo '%s' no afecta Ranking Maestro. No se revierten posiciones ni actividad global.", tournament_info['type'])
         # --- FIN LÓGICA DE REVERSIÓN ---
 
 
@@ -2068,24 +3878,21 @@ def edit_match_api(match_id):
             if new_challenger_won_match and current_challenger_pos > current_challenged_pos:
                 final_challenger_pos, final_challenged_pos = current_challenged_pos, current_challenger_pos
                 new_positions_swapped = True
-                print(f"DEBUG: [edit_match_api] Nuevo intercambio de posiciones aplicado: {original_challenger_id} y {original_challenged_id}.")
+                logger.debug("[edit_match_api] Nuevo intercambio de posiciones aplicado: %s y %s.", original_challenger_id, original_challenged_id)
             elif not new_challenger_won_match and current_challenger_pos == 1: # Si el P1 desafió y perdió
                  final_challenger_pos, final_challenged_pos = current_challenged_pos, current_challenger_pos
                  new_positions_swapped = True
-                 print(f"DEBUG: [edit_match_api] P1 perdió, nuevo intercambio de posiciones aplicado: {original_challenger_id} y {original_challenged_id}.")
+                 logger.debug("[edit_match_api] P1 perdió, nuevo intercambio de posiciones aplicado: %s y %s.", original_challenger_id, original_challenged_id)
             
             cursor.execute("UPDATE Players SET current_position = ? WHERE id = ?", (final_challenger_pos, original_challenger_id))
             cursor.execute("UPDATE Players SET current_position = ? WHERE id = ?", (final_challenged_pos, original_challenged_id))
-            print(f"DEBUG: [edit_match_api] Nuevas posiciones aplicadas: {original_challenger_id} a {final_challenger_pos}, {original_challenged_id} a {final_challenged_pos}.")
+            ladder_moves = {original_challenger_id: final_challenger_pos, original_challenged_id: final_challenged_pos}
+            logger.debug("[edit_match_api] Nuevas posiciones aplicadas: %s a %s, %s a %s.", original_challenger_id, final_challenger_pos, original_challenged_id, final_challenged_pos)
 
             # NOTA: La actividad (challenges_emitted, accepted, won, etc.) no se "edita" directamente.
-            # Se recalcula después de la reversión y la nueva aplicación.
             # Si se necesita una reversión precisa de contadores, el ActivityLog debería ser el punto de verdad.
-            _recalculate_player_activity_status(original_challenger_id)
-            _recalculate_player_activity_status(original_challenged_id)
-            print(f"DEBUG: [edit_match_api] Actividad de jugadores {original_challenger_id} y {original_challenged_id} recalculada después de nueva aplicación.")
         else:
-            print(f"DEBUG: [edit_match_api] Partido en torneo tipo '{tournament_info['type']}' no afecta Ranking Maestro. No se aplican nuevas posiciones ni actividad global.")
+            logger.debug("[edit_match_api] Partido en torneo tipo '%s' no afecta Ranking Maestro. No se aplican nuevas posiciones ni actividad global.", tournament_info['type'])
         # --- FIN LÓGICA DE APLICACIÓN ---
 
         # Actualizar el partido en la tabla Matches
@@ -2095,17 +3902,23 @@ def edit_match_api(match_id):
             (new_score_text, new_winner_id, new_loser_id, new_challenger_won_match, new_positions_swapped, match_id)
         )
         
+        if ladder_moves:
+            ladder_version = bump_ladder_version(cursor, ('single',))
         db.commit()
-        print(f"DEBUG: [edit_match_api] Partido {match_id} editado exitosamente.")
+        if ladder_moves:
+            commit_ladder_moves(('single',), ladder_version, ladder_moves)
+        logger.debug("[edit_match_api] Partido %s editado exitosamente.", match_id)
         return jsonify({"message": "Partido editado exitosamente y posiciones actualizadas."}), 200
 
+    except WriteLockTimeout:
+        return write_busy_response()
     except sqlite3.Error as e:
         db.rollback()
-        print(f"ERROR DB: [edit_match_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [edit_match_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al editar el partido: {str(e)}"}), 500
     except Exception as e:
         db.rollback()
-        print(f"ERROR GENERICO: [edit_match_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [edit_match_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al editar el partido: {str(e)}"}), 500
 
 @app.route('/api/challenges/<int:challenge_id>/reject', methods=['POST'])
@@ -2144,10 +3957,9 @@ def mark_rejected_challenge_api(challenge_id):
                    WHERE id = ?""",
                 (challenged_player_id,)
             )
-            # Recalcular el estado de actividad del jugador desafiado
-            _recalculate_player_activity_status(challenged_player_id)
+            # El trigger de Players recalcula el estado de actividad con el nuevo rechazo
         else:
-            print(f"DEBUG: Desafío individual rechazado en torneo tipo '{tournament_info['type']}' no afecta rechazos de Ranking Maestro.")
+            logger.debug("Desafío individual rechazado en torneo tipo '%s' no afecta rechazos de Ranking Maestro.", tournament_info['type'])
         # --- FIN LÓGICA JUGADORES INDIVIDUALES ---
         
         # Marcar el desafío como rechazado en la tabla Challenges
@@ -2159,11 +3971,11 @@ def mark_rejected_challenge_api(challenge_id):
 
     except sqlite3.Error as e:
         db.rollback()
-        print(f"ERROR DB: [mark_rejected_challenge_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [mark_rejected_challenge_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al marcar desafío como rechazado: {str(e)}"}), 500
     except Exception as e:
         db.rollback()
-        print(f"ERROR GENERICO: [mark_rejected_challenge_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [mark_rejected_challenge_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al marcar desafío como rechazado: {str(e)}"}), 500
     
 # En app.py, dentro de la sección de "API Endpoints"
@@ -2195,18 +4007,17 @@ def mark_ignored_challenge_api(challenge_id):
         # --- LÓGICA DE ACTIVIDAD PARA JUGADORES INDIVIDUALES (RANKING MAESTRO) ---
         # Solo si es un torneo pirámide individual
         if is_pyramid_single_tournament:
-            # Otorgar +1 punto simbólico en el índice de actividad del desafiante
+            # Otorgar +1 punto simbólico en el índice de actividad del desafiante.
+            # Se acumula en ignored_bonus_single, que el trigger de Players suma al índice.
             cursor.execute(
                 """UPDATE Players SET 
-                   activity_index_single = activity_index_single + 1,  
+                   ignored_bonus_single = ignored_bonus_single + 1,  
                    last_activity_update = CURRENT_TIMESTAMP 
                    WHERE id = ?""",
                 (challenger_player_id,)
             )
-            # Recalcular el estado de actividad del desafiante
-            _recalculate_player_activity_status(challenger_player_id)
         else:
-            print(f"DEBUG: Desafío individual ignorado en torneo tipo '{tournament_info['type']}' no afecta actividad de Ranking Maestro.")
+            logger.debug("Desafío individual ignorado en torneo tipo '%s' no afecta actividad de Ranking Maestro.", tournament_info['type'])
         # --- FIN LÓGICA JUGADORES INDIVIDUALES ---
 
         # Marcar el desafío como ignorado en la tabla Challenges
@@ -2218,11 +4029,11 @@ def mark_ignored_challenge_api(challenge_id):
 
     except sqlite3.Error as e:
         db.rollback()
-        print(f"ERROR DB: [mark_ignored_challenge_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [mark_ignored_challenge_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al marcar desafío como ignorado: {str(e)}"}), 500
     except Exception as e:
         db.rollback()
-        print(f"ERROR GENERICO: [mark_ignored_challenge_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [mark_ignored_challenge_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al marcar desafío como ignorado: {str(e)}"}), 500
 
 @app.route('/api/reset_cycle_activity', methods=['POST'])
@@ -2231,8 +4042,18 @@ def reset_cycle_activity_api():
     db = get_db()
     cursor = db.cursor()
     try:
-        # Reiniciar el contador de rechazos por ciclo para todos los jugadores
-        cursor.execute("UPDATE Players SET rejections_current_cycle = 0, last_activity_update = CURRENT_TIMESTAMP")
+        # Reiniciar el contador de rechazos por ciclo de los jugadores que tienen alguno; el resto
+        # no cambia, y así el coste depende de los rechazos del ciclo, no del tamaño de la pirámide
+        cursor.execute(
+            """UPDATE Players SET rejections_current_cycle = 0, last_activity_update = CURRENT_TIMESTAMP
+               WHERE rejections_current_cycle <> 0"""
+        )
+        # ... y de los equipos de dobles de los torneos
+        cursor.execute(
+            """UPDATE TournamentTeams SET rejections_team_doubles_current_cycle = 0,
+               last_activity_team_doubles_update = CURRENT_TIMESTAMP
+               WHERE rejections_team_doubles_current_cycle <> 0"""
+        )
         
         # Actualizar la fecha de inicio del ciclo en TournamentSettings
         cursor.execute(
@@ -2240,24 +4061,29 @@ def reset_cycle_activity_api():
                VALUES (?, ?)""",
             ('cycle_start_date', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
         )
-        
-        # Recalcular el estado de actividad de todos los jugadores después de reiniciar los contadores
-        # Esto llama a _recalculate_player_activity_status para cada jugador
-        _recalculate_all_players_activity_status()
-        
-        # El commit final para todas las operaciones (reset de rechazos, actualización de settings y recálculos)
+        # El estado de actividad de jugadores y equipos lo recalculan los triggers al resetear los rechazos
+
+        # El commit final para todas las operaciones (reset de rechazos y actualización de settings)
         db.commit() 
 
         return jsonify({"message": "Ciclo de actividad reiniciado exitosamente."}), 200
     except sqlite3.Error as e:
         db.rollback()
-        print(f"ERROR DB: [reset_cycle_activity_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [reset_cycle_activity_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al reiniciar ciclo de actividad: {str(e)}"}), 500
     except Exception as e:
         db.rollback()
-        print(f"ERROR GENERICO: [reset_cycle_activity_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [reset_cycle_activity_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al reiniciar ciclo de actividad: {str(e)}"}), 500
 
+LOGIN_USER_SQL = '''
+    SELECT u.id, u.username, u.email, u.password_hash, u.is_admin, upl.player_id
+    FROM Users u
+    LEFT JOIN UserPlayersLink upl ON upl.user_id = u.id
+    WHERE u.username = ? OR u.email = ?
+    ORDER BY u.username = ? DESC
+    LIMIT 1'''
+
 @app.route('/login', methods=['GET', 'POST'])
 def login(): # <<< Esta es la función a la que url_for('login') debería apuntar
     if request.method == 'POST':
@@ -2265,50 +4091,49 @@ def login(): # <<< Esta es la función a la que url_for('login') debería apunta
         password = request.form.get('password')
 
         db = get_db()
-        user = None
 
-        # Intentar buscar por username
+        # Una sola consulta: usuario por username o email (el username tiene prioridad) y su
+        # perfil de jugador vinculado
         user = db.execute(
-            "SELECT * FROM Users WHERE username = ?", (username_or_email,)
+            LOGIN_USER_SQL,
+            (username_or_email, username_or_email, username_or_email)
         ).fetchone()
 
-        # Si no se encuentra por username, intentar buscar por email
-        if not user:
-            user = db.execute(
-                "SELECT * FROM Users WHERE email = ?", (username_or_email,)
-            ).fetchone()
+        auth_logger.debug("LOGIN: Intento de login para '%s' (usuario encontrado: %s)", username_or_email, user is not None)
 
-        # --- DEBUGGING TEMPORAL DE LOGIN ---
-        print(f"DEBUG LOGIN: Intentando login para username/email: {username_or_email}")
-        print(f"DEBUG LOGIN: Contraseña ingresada: {password}")
-        if user:
-            print(f"DEBUG LOGIN: Usuario encontrado: {user['username']}")
-            print(f"DEBUG LOGIN: Hash almacenado: {user['password_hash']}")
-            if check_password_hash(user['password_hash'], password):
-                print("DEBUG LOGIN: check_password_hash RETURNED TRUE")
-            else:
-                print("DEBUG LOGIN: check_password_hash RETURNED FALSE - Contraseña no coincide")
-        else:
-            print("DEBUG LOGIN: Usuario NO encontrado en la base de datos.")
-        # --- FIN DEBUGGING ---
+        hasher = get_password_hasher()
+        try:
+            password_ok = hasher.verify(user['password_hash'] if user else None, password)
+        except PasswordHasherBusy:
+            auth_logger.warning("LOGIN: Sin capacidad para verificar contraseñas; se rechaza el intento de '%s'.", username_or_email)
+            flash('El servidor está recibiendo muchos inicios de sesión. Inténtalo de nuevo en unos segundos.', 'error')
+            return render_template('login.html'), 503
+
+        if password_ok:
+            # Regenerar el hash si se creó con otro método o factor de trabajo
+            if hasher.needs_rehash(user['password_hash']):
+                try:
+                    db.execute(
+                        "UPDATE Users SET password_hash = ? WHERE id = ? AND password_hash = ?",
+                        (hasher.hash(password), user['id'], user['password_hash'])
+                    )
+                    db.commit()
+                    auth_logger.info("LOGIN: Hash de contraseña del usuario %s actualizado a %s.", user['id'], hasher.method)
+                except (sqlite3.Error, PasswordHasherBusy) as e:
+                    db.rollback()
+                    auth_logger.warning("LOGIN: No se pudo regenerar el hash del usuario %s: %s", user['id'], e)
 
-        if user and check_password_hash(user['password_hash'], password):
+            regenerate_session()
             session['user_id'] = user['id']
             session['username'] = user['username']
             session['is_admin'] = user['is_admin']
             session['email'] = user['email']
-            
-            # --- LÓGICA PARA CARGAR player_id EN LA SESIÓN ---
-            linked_player_data = db.execute(
-                "SELECT player_id FROM UserPlayersLink WHERE user_id = ?", (user['id'],)
-            ).fetchone()
-            if linked_player_data:
-                session['player_id'] = linked_player_data['player_id']
-                print(f"DEBUG LOGIN: Player ID {session['player_id']} vinculado y cargado en sesión.")
+            # Asegurarse de que sea None si no hay perfil de jugador vinculado
+            session['player_id'] = user['player_id']
+            if user['player_id'] is not None:
+                auth_logger.debug("LOGIN: Player ID %s vinculado y cargado en sesión.", user['player_id'])
             else:
-                session['player_id'] = None # Asegurarse de que sea None si no hay vínculo
-                print("DEBUG LOGIN: No hay perfil de jugador vinculado para este usuario.")
-            # --- FIN LÓGICA player_id ---
+                auth_logger.debug("LOGIN: No hay perfil de jugador vinculado para este usuario.")
             
             # Lógica de redirección basada en el rol y el perfil de jugador
             if user['is_admin']:
@@ -2376,7 +4201,7 @@ def register():
             return render_template('register.html')
 
         try:
-            hashed_password = generate_password_hash(password)
+            hashed_password = get_password_hasher().hash(password)
             cursor.execute(
                 "INSERT INTO Users (username, email, password_hash, is_admin) VALUES (?, ?, ?, ?)",
                 (username, email, hashed_password, 0) # is_admin por defecto a 0 para nuevos registros
@@ -2388,9 +4213,10 @@ def register():
             # --- ELIMINAR LÓGICA DE VINCULACIÓN AUTOMÁTICA CON JUGADOR EXISTENTE POR EMAIL AQUÍ ---
             # Esta lógica se moverá al POST /complete_player_profile
             
+            regenerate_session()
             # Flash message and redirect to complete profile
             flash('Registro exitoso. Por favor, completa tu perfil de jugador.', 'success')
-            print(f"DEBUG: Usuario {username} (ID: {new_user_id}) registrado. Redirigiendo a completar perfil.")
+            auth_logger.debug("Usuario %s (ID: %s) registrado. Redirigiendo a completar perfil.", username, new_user_id)
 
             # Log the user in immediately after registration
             session['user_id'] = new_user_id
@@ -2400,14 +4226,17 @@ def register():
 
             return redirect(url_for('complete_player_profile'))
 
+        except PasswordHasherBusy:
+            flash('El servidor está recibiendo muchos registros. Inténtalo de nuevo en unos segundos.', 'error')
+            return render_template('register.html'), 503
         except sqlite3.Error as e:
             db.rollback()
             flash(f"Error de base de datos al registrar: {e}", 'error')
-            print(f"ERROR DB: [register] {e}")
+            auth_logger.error("DB: [register] %s", e)
         except Exception as e:
             db.rollback()
             flash(f"Error inesperado al registrar: {e}", 'error')
-            print(f"ERROR GENERICO: [register] {e}")
+            auth_logger.error("GENERICO: [register] %s", e)
 
     return render_template('register.html')
 
@@ -2428,9 +4257,7 @@ def get_my_player_data_api():
     db = get_db()
     
     # Obtener el player_id vinculado al user_id actual
-    linked_player = db.execute(
-        "SELECT player_id FROM UserPlayersLink WHERE user_id = ?", (user_id,)
-    ).fetchone()
+    linked_player = db.execute(USER_PLAYER_LINK_SQL, (user_id,)).fetchone()
 
     if not linked_player:
         return jsonify({"error": "Tu cuenta de usuario no está vinculada a un perfil de jugador."}), 404
@@ -2440,16 +4267,17 @@ def get_my_player_data_api():
     try: # Esta es la línea 'try:' en tu código (aprox. línea 2027)
         # Obtener toda la información detallada del jugador
         player_data_db = db.execute(
-            '''SELECT id, first_name, last_name, email, phone, gender,
-                        birth_date, location, dominant_hand, backhand_type, racquet,
-                        photo_url, initial_position, current_position, points,
-                        activity_index_single, challenges_emitted_single, challenges_accepted_single,
-                        challenges_won_single, defenses_successful_single, activity_status_single,
-                        activity_index_doubles, challenges_emitted_doubles, challenges_accepted_doubles,
-                        challenges_won_doubles, defenses_successful_doubles, activity_status_doubles,
-                        rejections_current_cycle, rejections_total, activity_status, last_activity_update,
-                        last_challenge_received_date
-                FROM Players WHERE id = ?''', (player_id,)
+            f'''SELECT p.id, p.first_name, p.last_name, p.email, p.phone, p.gender,
+                        p.birth_date, p.location, p.dominant_hand, p.backhand_type, p.racquet,
+                        {PHOTO_URL_SQL}, p.initial_position, p.current_position, p.points,
+                        p.activity_index_single, p.challenges_emitted_single, p.challenges_accepted_single,
+                        p.challenges_won_single, p.defenses_successful_single, p.activity_status_single,
+                        p.activity_index_doubles, p.challenges_emitted_doubles, p.challenges_accepted_doubles,
+                        p.challenges_won_doubles, p.defenses_successful_doubles, p.activity_status_doubles,
+                        p.rejections_current_cycle, p.rejections_total, p.activity_status, p.last_activity_update,
+                        p.last_challenge_received_date
+                FROM Players p LEFT JOIN Uploads u ON u.filename = p.photo_url
+                WHERE p.id = ?''', ('md', player_id)
         ).fetchone()
 
         if not player_data_db:
@@ -2471,21 +4299,30 @@ def get_my_player_data_api():
         return jsonify(player_dict), 200
 
     except sqlite3.Error as e: # <-- Esta línea (2039) debe tener la misma indentación que 'try:'
-        print(f"ERROR DB: [get_my_player_data_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [get_my_player_data_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos: {str(e)}"}), 500
     except Exception as e: # <-- Esta línea también
-        print(f"ERROR GENERICO: [get_my_player_data_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [get_my_player_data_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al obtener datos del jugador: {str(e)}"}), 500
 
+# El tournament_id va primero para el LEFT JOIN. {search_filter}: '' o el filtro por nombre (LIKE)
+PARTNER_SEARCH_SQL = '''
+    SELECT p.id, p.first_name, p.last_name, p.current_position, p.gender
+    FROM Players p
+    LEFT JOIN TournamentTeams tt ON (p.id = (SELECT player1_id FROM Teams WHERE id = tt.team_id) OR p.id = (SELECT player2_id FROM Teams WHERE id = tt.team_id)) AND tt.tournament_id = ?
+    WHERE p.id != ?
+      AND p.gender = ?
+      AND tt.id IS NULL -- Asegura que el jugador NO esté actualmente en un equipo *para este torneo*
+      {search_filter}
+    ORDER BY p.current_position ASC'''
+
 @app.route('/api/players/search_partners', methods=['GET'])
 @login_required
 def search_doubles_partners_api():
     user_id = session.get('user_id')
     db = get_db()
     
-    linked_player_row = db.execute(
-        "SELECT player_id FROM UserPlayersLink WHERE user_id = ?", (user_id,)
-    ).fetchone()
+    linked_player_row = db.execute(USER_PLAYER_LINK_SQL, (user_id,)).fetchone()
 
     if not linked_player_row:
         return jsonify({"error": "Tu cuenta no está vinculada a un perfil de jugador."}), 400
@@ -2511,25 +4348,17 @@ def search_doubles_partners_api():
 
     search_term = request.args.get('q', '').strip()
     
-    query = '''
-        SELECT p.id, p.first_name, p.last_name, p.current_position, p.gender
-        FROM Players p
-        LEFT JOIN TournamentTeams tt ON (p.id = (SELECT player1_id FROM Teams WHERE id = tt.team_id) OR p.id = (SELECT player2_id FROM Teams WHERE id = tt.team_id)) AND tt.tournament_id = ?
-        WHERE p.id != ?
-          AND p.gender = ?
-          AND tt.id IS NULL -- Asegura que el jugador NO esté actualmente en un equipo *para este torneo*
-    '''
     # NOTA: La lógica de `tt.id IS NULL` con `LEFT JOIN` es más robusta.
     # Necesitas que `p.gender` coincida con el `gender` del `current_player_gender`.
     # Y que `tt.tournament_id = ?` filtre solo para el torneo actual.
-
-    params = [tournament_id, current_player_id, current_player_gender] # El tournament_id va primero para el LEFT JOIN
+    params = [tournament_id, current_player_id, current_player_gender]
+    search_filter = ''
     
     if search_term:
-        query += " AND (p.first_name LIKE ? OR p.last_name LIKE ?)"
+        search_filter = "AND (p.first_name LIKE ? OR p.last_name LIKE ?)"
         params.extend([f'%{search_term}%', f'%{search_term}%'])
     
-    query += " ORDER BY p.current_position ASC"
+    query = PARTNER_SEARCH_SQL.format(search_filter=search_filter)
 
     try:
         eligible_partners_db = db.execute(query, params).fetchall()
@@ -2543,11 +4372,11 @@ def search_doubles_partners_api():
         return jsonify(partners), 200
 
     except sqlite3.Error as e:
-        print(f"ERROR DB: [search_doubles_partners_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [search_doubles_partners_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al buscar compañeros: {str(e)}"}), 500
     except Exception as e:
         db.rollback()
-        print(f"ERROR GENERICO: [search_doubles_partners_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [search_doubles_partners_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al buscar compañeros: {str(e)}"}), 500
     
 
@@ -2578,6 +4407,7 @@ def create_tournament():
     if not all([name, start_date_str, end_date_str, tournament_type]):
         return jsonify({"error": "Faltan datos obligatorios para crear el torneo (nombre, fechas, tipo)."}), 400
 
+    db = get_db()
     try:
         # --- NUEVAS VALIDACIONES Y PREDETERMINACIONES DE FECHAS ---
 
@@ -2631,7 +4461,6 @@ def create_tournament():
 
         # --- FIN NUEVAS VALIDACIONES Y PREDETERMINACIONES DE FECHAS ---
 
-        db = get_db()
         cursor = db.cursor()
 
         cursor.execute(
@@ -2650,9 +4479,11 @@ def create_tournament():
                 category, max_slots, cost, requirements, location, is_published, organizer_id
             )
         )
+        tournament_id = cursor.lastrowid
+        invalidate_active_tournament_cache(cursor)
 
         db.commit()
-        return jsonify({"message": "Torneo creado exitosamente.", "tournament_id": cursor.lastrowid}), 201
+        return jsonify({"message": "Torneo creado exitosamente.", "tournament_id": tournament_id}), 201
 
     except ValueError as ve:
         # Capturar errores de formato de fecha específicos
@@ -2661,15 +4492,15 @@ def create_tournament():
         db.rollback()
         if "UNIQUE constraint failed: Tournaments.name" in str(e):
             return jsonify({"error": "Ya existe un torneo con este nombre."}), 409
-        print(f"ERROR DB: [create_tournament] Error de integridad de SQLite: {str(e)}")
+        logger.error("DB: [create_tournament] Error de integridad de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al crear torneo (integridad): {str(e)}"}), 500
     except sqlite3.Error as e:
         db.rollback()
-        print(f"ERROR DB: [create_tournament] Error de SQLite: {str(e)}")
+        logger.error("DB: [create_tournament] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al crear torneo: {str(e)}"}), 500
     except Exception as e:
         db.rollback()
-        print(f"ERROR GENERICO: [create_tournament] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [create_tournament] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al crear torneo: {str(e)}"}), 500
 
 # NUEVO ENDPOINT: Listar todos los Torneos
@@ -2686,17 +4517,17 @@ def get_all_tournaments():
         tournaments = [dict(t) for t in tournaments_db]
         return jsonify(tournaments), 200
     except sqlite3.Error as e:
-        print(f"ERROR DB: [get_all_tournaments] Error de SQLite: {str(e)}")
+        logger.error("DB: [get_all_tournaments] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al listar torneos: {str(e)}"}), 500
     except Exception as e:
-        print(f"ERROR GENERICO: [get_all_tournaments] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [get_all_tournaments] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al listar torneos: {str(e)}"}), 500
 
 @app.route('/api/tournaments/<int:tournament_id>/update_status', methods=['POST'])
 @login_required
 def update_tournament_status(tournament_id):
     # Debug: Confirmar el ID recibido
-    print(f"DEBUG update_tournament_status: Recibida petición para tournament_id={tournament_id} (Tipo: {type(tournament_id)})")
+    logger.debug("update_tournament_status: Recibida petición para tournament_id=%s (Tipo: %s)", tournament_id, type(tournament_id))
 
     data = request.get_json()
     new_status = data.get('status')
@@ -2709,14 +4540,14 @@ def update_tournament_status(tournament_id):
     
     try:
         # Debug: Mostrar la consulta y el parámetro
-        print(f"DEBUG update_tournament_status: Ejecutando SELECT para Torneo WHERE id = {tournament_id}")
+        logger.debug("update_tournament_status: Ejecutando SELECT para Torneo WHERE id = %s", tournament_id)
         tournament = db.execute("SELECT id, type, status, name FROM Tournaments WHERE id = ?", (tournament_id,)).fetchone()
         
         # Debug: Verificar el resultado de fetchone()
         if tournament:
-            print(f"DEBUG update_tournament_status: Torneo encontrado: {dict(tournament)}")
+            logger.debug("update_tournament_status: Torneo encontrado: %s", dict(tournament))
         else:
-            print(f"DEBUG update_tournament_status: Torneo con ID {tournament_id} NO encontrado por fetchone().")
+            logger.debug("update_tournament_status: Torneo con ID %s NO encontrado por fetchone().", tournament_id)
             return jsonify({"error": "Torneo no encontrado (verificación interna)."}) # Mensaje más específico para depuración
         
         # Si llegamos aquí, 'tournament' no es None. El error 'No item with that key' no debería ocurrir en este bloque.
@@ -2729,7 +4560,7 @@ def update_tournament_status(tournament_id):
         
         if is_pyramid_type:
             if new_status in ['in_progress', 'registration_open']:
-                print(f"DEBUG update_tournament_status: Es pirámide, activando {tournament_id} y desactivando otros de tipo {current_tournament_type}")
+                logger.debug("update_tournament_status: Es pirámide, activando %s y desactivando otros de tipo %s", tournament_id, current_tournament_type)
                 cursor.execute(
                     "UPDATE Tournaments SET is_active = 0 WHERE type = ? AND id != ?",
                     (current_tournament_type, tournament_id)
@@ -2739,48 +4570,48 @@ def update_tournament_status(tournament_id):
                     (new_status, tournament_id)
                 )
             else:
-                print(f"DEBUG update_tournament_status: Es pirámide, desactivando {tournament_id} por estado {new_status}")
+                logger.debug("update_tournament_status: Es pirámide, desactivando %s por estado %s", tournament_id, new_status)
                 cursor.execute(
                     "UPDATE Tournaments SET status = ?, is_active = 0 WHERE id = ?",
                     (new_status, tournament_id)
                 )
         else: # Si es un torneo satélite, simplemente actualizar el status
-            print(f"DEBUG update_tournament_status: Es satélite, actualizando estado a {new_status}")
+            logger.debug("update_tournament_status: Es satélite, actualizando estado a %s", new_status)
             cursor.execute(
                 "UPDATE Tournaments SET status = ? WHERE id = ?",
                 (new_status, tournament_id)
             )
+        invalidate_active_tournament_cache(cursor)
 
         db.commit()
-        print(f"DEBUG update_tournament_status: Commit exitoso.")
+        logger.debug("update_tournament_status: Commit exitoso.")
         return jsonify({"message": f"Estado del torneo '{tournament_name}' actualizado a '{new_status}'."}), 200
 
     except sqlite3.Error as e:
         db.rollback()
-        print(f"ERROR DB: [update_tournament_status] Error de SQLite: {str(e)}")
+        logger.error("DB: [update_tournament_status] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al actualizar estado del torneo: {str(e)}"}), 500
     except Exception as e:
         db.rollback()
-        print(f"ERROR GENERICO: [update_tournament_status] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [update_tournament_status] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al actualizar estado del torneo: {str(e)}"}), 500
 
+GLOBAL_DOUBLES_TEAMS_SQL = '''
+    SELECT t.id, t.player1_id, t.player2_id, t.team_name, t.gender_category, t.created_at,
+           p1.first_name AS p1_first_name, p1.last_name AS p1_last_name,
+           p2.first_name AS p2_first_name, p2.last_name AS p2_last_name
+    FROM Teams t
+    JOIN Players p1 ON t.player1_id = p1.id
+    JOIN Players p2 ON t.player2_id = p2.id
+    ORDER BY t.team_name ASC -- O por alguna otra lógica si prefieres'''
+
 @app.route('/api/global_doubles_teams', methods=['GET'])
 @login_required # Proteger este endpoint para que solo el organizador acceda a la lista completa
 def get_global_doubles_teams_api():
     db = get_db()
     try:
         # Selecciona todos los equipos de la tabla Teams y sus jugadores
-        teams_db = db.execute(
-            '''
-            SELECT t.id, t.player1_id, t.player2_id, t.team_name, t.gender_category, t.created_at,
-                   p1.first_name AS p1_first_name, p1.last_name AS p1_last_name,
-                   p2.first_name AS p2_first_name, p2.last_name AS p2_last_name
-            FROM Teams t
-            JOIN Players p1 ON t.player1_id = p1.id
-            JOIN Players p2 ON t.player2_id = p2.id
-            ORDER BY t.team_name ASC -- O por alguna otra lógica si prefieres
-            '''
-        ).fetchall()
+        teams_db = db.execute(GLOBAL_DOUBLES_TEAMS_SQL).fetchall()
 
         teams = []
         for t in teams_db:
@@ -2794,10 +4625,10 @@ def get_global_doubles_teams_api():
             
         return jsonify(teams), 200
     except sqlite3.Error as e:
-        print(f"ERROR DB: [get_global_doubles_teams_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [get_global_doubles_teams_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al obtener equipos de dobles globales: {str(e)}"}), 500
     except Exception as e:
-        print(f"ERROR GENERICO: [get_global_doubles_teams_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [get_global_doubles_teams_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al obtener equipos de dobles globales: {str(e)}"}), 500
 
 @app.route('/player_dashboard')
@@ -2812,9 +4643,7 @@ def player_dashboard_page():
     db = get_db()
     
     # Intentar obtener el player_id vinculado al user_id actual
-    linked_player = db.execute(
-        "SELECT player_id FROM UserPlayersLink WHERE user_id = ?", (user_id,)
-    ).fetchone()
+    linked_player = db.execute(USER_PLAYER_LINK_SQL, (user_id,)).fetchone()
 
     # Si no hay perfil de jugador vinculado, redirigir a completar perfil
     if not linked_player:
@@ -2870,30 +4699,14 @@ def complete_player_profile():
     db = get_db()
     cursor = db.cursor()
 
-    # --- INICIO DE LOS DEBUG PARA COLUMNAS DE LA DB ---
-    print("\n--- DEBUG: Información de la tabla Players desde la DB ---")
-    try:
-        cursor.execute("PRAGMA table_info(Players)")
-        columns_info = cursor.fetchall()
-        print(f"Total de columnas en la tabla Players (PRAGMA): {len(columns_info)}")
-        print("Detalle de las columnas:")
-        for col in columns_info:
-            print(f"  Name: {col['name']}, Type: {col['type']}, NotNull: {col['notnull']}, DfltValue: {col['dflt_value']}, Pk: {col['pk']}")
-    except Exception as e:
-        print(f"ERROR DEBUG: No se pudo obtener la información de la tabla Players: {e}")
-    print("--- FIN DEBUG ---")
-    # --- FIN DE LOS DEBUG PARA COLUMNAS DE LA DB ---
-
     # Verificar si el usuario ya tiene un perfil de jugador vinculado
-    linked_player = db.execute(
-        "SELECT player_id FROM UserPlayersLink WHERE user_id = ?", (user_id,)
-    ).fetchone()
+    linked_player = db.execute(USER_PLAYER_LINK_SQL, (user_id,)).fetchone()
 
     if request.method == 'POST':
         # --- Lógica para la petición POST (guardar perfil) ---
         if linked_player:
             flash('Tu cuenta ya tiene un perfil de jugador vinculado. Si deseas editarlo, usa la función de edición.', 'info')
-            print("DEBUG POST /complete_player_profile: Perfil ya vinculado, devolviendo 400.")
+            logger.debug("POST /complete_player_profile: Perfil ya vinculado, devolviendo 400.")
             return jsonify({"error": "Perfil de jugador ya vinculado."}), 400
 
         try:
@@ -2912,16 +4725,20 @@ def complete_player_profile():
             # Validación básica en el servidor
             if not all([first_name, last_name, email, gender, birth_date]):
                 flash('Nombre, Apellido, Email, Género y Fecha de Nacimiento son obligatorios.', 'error')
-                print("DEBUG POST /complete_player_profile: Faltan campos obligatorios, devolviendo 400.")
+                logger.debug("POST /complete_player_profile: Faltan campos obligatorios, devolviendo 400.")
                 return jsonify({"error": "Faltan campos obligatorios."}), 400
 
             # Verificar que el email del formulario coincida con el email de la sesión
             session_email = session.get('email')
             if not session_email or email != session_email:
                 flash('El email proporcionado no coincide con el email de tu cuenta de usuario o no está en sesión.', 'error')
-                print("DEBUG POST /complete_player_profile: Inconsistencia de email, devolviendo 400.")
+                logger.debug("POST /complete_player_profile: Inconsistencia de email, devolviendo 400.")
                 return jsonify({"error": "Inconsistencia de email o email de sesión faltante."}), 400
 
+            # El email y la última posición se leen ya con el lock de escritura tomado: dos altas
+            # simultáneas no reciben la misma current_position
+            begin_immediate(db, 'complete_player_profile')
+
             existing_player_to_link = db.execute(
                 """SELECT p.id FROM Players p
                    LEFT JOIN UserPlayersLink upl ON p.id = upl.player_id
@@ -2930,6 +4747,7 @@ def complete_player_profile():
             ).fetchone()
 
             player_id_to_use = None
+            photo_filename = None # Solo el alta de un jugador nuevo sube foto
 
             if existing_player_to_link:
                 # Esto es una ACTUALIZACIÓN si el jugador existe y NO está vinculado a otro usuario
@@ -2944,7 +4762,7 @@ def complete_player_profile():
                      dominant_hand, backhand_type, racquet, player_id_to_use)
                 )
                 flash_message_success = 'Perfil de jugador existente actualizado y vinculado exitosamente. ¡Bienvenido al torneo!'
-                print(f"DEBUG POST /complete_player_profile: Usuario {session.get('username')} (ID: {user_id}) vinculado y actualizó Player {player_id_to_use} (existente).")
+                logger.debug("POST /complete_player_profile: Usuario %s (ID: %s) vinculado y actualizó Player %s (existente).", session.get('username'), user_id, player_id_to_use)
 
             else:
                 # Esto es una INSERCIÓN de un nuevo jugador si no existe un perfil desvinculado con ese email
@@ -2957,32 +4775,31 @@ def complete_player_profile():
 
                 if existing_linked_player_with_email:
                     flash('Este email ya está asociado a otro perfil de jugador en el sistema. Por favor, use un email diferente o contacte al organizador.', 'error')
-                    print("DEBUG POST /complete_player_profile: Email de jugador ya en uso por otro perfil, devolviendo 409.")
+                    logger.debug("POST /complete_player_profile: Email de jugador ya en uso por otro perfil, devolviendo 409.")
                     return jsonify({"error": "Email de jugador ya en uso por otro perfil."}), 409
 
                 # Manejar la subida de foto
-                photo_filename = None
                 if 'photo' in request.files:
                     file = request.files.get('photo')
                     if file and file.filename != '' and allowed_file(file.filename):
-                        filename = secure_filename(file.filename)
-                        unique_filename = str(datetime.now().timestamp()).replace(".", "") + "_" + filename
-                        file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-                        print(f"DEBUG POST /complete_player_profile: Intentando guardar archivo en: {file_path}")
                         try:
-                            file.save(file_path)
-                            photo_filename = unique_filename
-                            print(f"DEBUG POST /complete_player_profile: Archivo guardado exitosamente: {photo_filename}")
-                        except Exception as file_save_error:
-                            print(f"ERROR POST /complete_player_profile: Falló al guardar archivo: {file_save_error}")
+                            photo_filename = store_upload(cursor, file)
+                            logger.debug("POST /complete_player_profile: Foto almacenada como %s", photo_filename)
+                        except UploadTooLarge as too_large:
+                            db.rollback()
+                            flash(str(too_large), 'error')
+                            return jsonify({"error": str(too_large)}), 413
+                        except OSError as file_save_error:
+                            db.rollback()
+                            logger.error("POST /complete_player_profile: Falló al guardar archivo: %s", file_save_error)
                             flash(f"Error al guardar la foto: {file_save_error}", 'error')
                             return jsonify({"error": f"Error al guardar la foto: {file_save_error}"}), 500
                     elif file and file.filename == '':
-                        print("DEBUG POST /complete_player_profile: Campo de foto presente pero vacío.")
+                        logger.debug("POST /complete_player_profile: Campo de foto presente pero vacío.")
                     else:
-                        print("DEBUG POST /complete_player_profile: Archivo no permitido o no presente.")
+                        logger.debug("POST /complete_player_profile: Archivo no permitido o no presente.")
                 else:
-                    print("DEBUG POST /complete_player_profile: Campo 'photo' no encontrado en request.files.")
+                    logger.debug("POST /complete_player_profile: Campo 'photo' no encontrado en request.files.")
 
                 # Determinar la posición inicial
                 last_pos_row = db.execute('SELECT MAX(current_position) as max_pos FROM Players').fetchone()
@@ -2990,43 +4807,25 @@ def complete_player_profile():
                 current_position = initial_position
                 points = 0
 
-                # --- INICIO DE LA TUPLA Y CONSULTA SQL CORREGIDAS ---
-                # Esta tupla ahora tiene 33 elementos, incluyendo 'None' para el ID
-                valores_a_insertar = (
-                    None, # ID (1)
-                    first_name, last_name, email, None, phone, gender, # (2 a 7)
-                    birth_date, location, dominant_hand, backhand_type, racquet, # (8 a 12)
-                    photo_filename, initial_position, current_position, points, # (13 a 16)
-                    0, 0, 0, 0, 0, 'rojo', # activity_index_single a activity_status_single (17 a 22)
-                    0, 0, 0, 0, 0, 'rojo', # activity_index_doubles a activity_status_doubles (23 a 28)
-                    0, 0, 'rojo', datetime.now().strftime('%Y-%m-%d %H:%M:%S'), None # rejections_current_cycle a last_challenge_received_date (29 a 33)
-                    # <<--- LA COLUMNA 'registration_type' Y SU VALOR HAN SIDO ELIMINADOS DE AQUÍ
+                # Columnas explícitas: el resto (contadores y estado de actividad) toma los DEFAULT
+                # del esquema, y las migraciones pueden añadir columnas sin romper este INSERT.
+                cursor.execute(
+                    """INSERT INTO Players (
+                           first_name, last_name, email, phone, gender, birth_date, location,
+                           dominant_hand, backhand_type, racquet, photo_url,
+                           initial_position, current_position, points, last_activity_update
+                       ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (first_name, last_name, email, phone, gender, birth_date, location,
+                     dominant_hand, backhand_type, racquet, photo_filename,
+                     initial_position, current_position, points,
+                     datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
                 )
 
-                print(f"\n--- DEBUG FINAL: Información de la Tupla 'valores_a_insertar' ---")
-                print(f"Cantidad de elementos en 'valores_a_insertar': {len(valores_a_insertar)}") # Debería imprimir 33
-                print(f"Valores de 'valores_a_insertar': {valores_a_insertar}")
-                print("--- FIN DEBUG FINAL ---")
-
-                # Consulta SQL modificada: ¡NO ESPECIFICAMOS LAS COLUMNAS!
-                # Confiamos en que la tupla de valores está en el orden correcto de las 33 columnas de la tabla.
-                sql_insert_query = """INSERT INTO Players
-                                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
-                # Asegúrate de que haya exactamente 33 placeholders '?' aquí.
-
-                print(f"--- DEBUG FINAL: Información de la Consulta SQL de Inserción ---")
-                print(f"Cantidad de placeholders '?' en la consulta SQL: {sql_insert_query.count('?')}") # Debería imprimir 33
-                print(f"Texto de la consulta SQL:\n{sql_insert_query}")
-                print("--- FIN DEBUG FINAL ---")
-
-                # Ejecutar la inserción
-                cursor.execute(sql_insert_query, valores_a_insertar)
-                # --- FIN DE LA TUPLA Y CONSULTA SQL CORREGIDAS ---
-
                 new_player_id = cursor.lastrowid
                 player_id_to_use = new_player_id
+                bump_ladder_version(cursor, ('single',)) # Un jugador más cambia el total de la pirámide
                 flash_message_success = 'Perfil de jugador creado y vinculado exitosamente. ¡Bienvenido al torneo!'
-                print(f"DEBUG POST /complete_player_profile: Usuario {session.get('username')} (ID: {user_id}) creó y vinculó nuevo Player {player_id_to_use}.")
+                logger.debug("POST /complete_player_profile: Usuario %s (ID: %s) creó y vinculó nuevo Player %s.", session.get('username'), user_id, player_id_to_use)
 
             # Crear enlace en UserPlayersLink table (esto es correcto aquí, aplica tanto para nueva creación como actualización)
             cursor.execute(
@@ -3035,35 +4834,40 @@ def complete_player_profile():
             )
             db.commit()
 
+            if photo_filename:
+                enqueue_thumbnails(photo_filename)
+
             # Actualizar sesión con player_id
             session['player_id'] = player_id_to_use
-            print(f"DEBUG POST /complete_player_profile: session['player_id'] actualizado a {session['player_id']}")
+            logger.debug("POST /complete_player_profile: session['player_id'] actualizado a %s", session['player_id'])
             flash(flash_message_success, 'success')
-            print("DEBUG POST /complete_player_profile: Perfil guardado exitosamente, devolviendo 200 JSON.")
+            logger.debug("POST /complete_player_profile: Perfil guardado exitosamente, devolviendo 200 JSON.")
             return jsonify({"message": flash_message_success, "player_id": player_id_to_use}), 200
 
+        except WriteLockTimeout:
+            return write_busy_response()
         except sqlite3.IntegrityError as e:
             db.rollback()
             if "UNIQUE constraint failed: UserPlayersLink.player_id" in str(e):
                 flash('Este perfil de jugador ya está vinculado a otra cuenta de usuario.', 'error')
-                print("DEBUG POST /complete_player_profile: Error de integridad (Player ya vinculado), devolviendo 409.")
+                logger.debug("POST /complete_player_profile: Error de integridad (Player ya vinculado), devolviendo 409.")
                 return jsonify({"error": "Perfil de jugador ya vinculado a otra cuenta."}), 409
             elif "UNIQUE constraint failed: Players.email" in str(e):
                 flash('Este email ya está registrado para otro jugador. Por favor, use un email diferente o contacte al organizador.', 'error')
-                print("DEBUG POST /complete_player_profile: Error de integridad (Email de Player ya existe), devolviendo 409.")
+                logger.debug("POST /complete_player_profile: Error de integridad (Email de Player ya existe), devolviendo 409.")
                 return jsonify({"error": "Email de jugador ya existe."}), 409
             flash(f"Error de base de datos (Integridad): {e}", 'error')
-            print(f"ERROR DB (Integrity): [complete_player_profile_post] {e}")
+            logger.error("DB (Integrity): [complete_player_profile_post] %s", e)
             return jsonify({"error": "Error de integridad de base de datos."}), 500
         except sqlite3.Error as e:
             db.rollback()
             flash(f"Error de base de datos: {e}", 'error')
-            print(f"ERROR DB: [complete_player_profile_post] {e}")
+            logger.error("DB: [complete_player_profile_post] %s", e)
             return jsonify({"error": "Error de base de datos."}), 500
         except Exception as e:
             db.rollback()
             flash(f"Error inesperado al guardar el perfil: {e}", 'error')
-            print(f"ERROR GENERICO: [complete_player_profile_post] {e}")
+            logger.error("GENERICO: [complete_player_profile_post] %s", e)
             return jsonify({"error": "Error inesperado."}), 500
 
     else: # request.method == 'GET'
@@ -3077,6 +4881,9 @@ def complete_player_profile():
         user_email = session.get('email')
         return render_template('complete_player_profile.html', user_email=user_email)
 
+REGISTRATION_LOOKUP_SQL = 'SELECT id FROM TournamentRegistrations WHERE player_id = ? AND tournament_id = ?'
+REGISTRATIONS_COUNT_SQL = "SELECT COUNT(id) FROM TournamentRegistrations WHERE tournament_id = ? AND status = 'inscrito'"
+
 @app.route('/register_for_tournament', methods=['POST'])
 @login_required
 def register_for_tournament():
@@ -3111,7 +4918,7 @@ def register_for_tournament():
 
         # 3. Verificar si el jugador ya está inscrito
         existing_registration = db.execute(
-            "SELECT id FROM TournamentRegistrations WHERE player_id = ? AND tournament_id = ?",
+            REGISTRATION_LOOKUP_SQL,
             (player_id, tournament_id)
         ).fetchone()
 
@@ -3121,7 +4928,7 @@ def register_for_tournament():
         # 4. Verificar cupos máximos (si max_slots > 0)
         if tournament['max_slots'] > 0:
             current_registrations = db.execute(
-                "SELECT COUNT(id) FROM TournamentRegistrations WHERE tournament_id = ? AND status = 'inscrito'",
+                REGISTRATIONS_COUNT_SQL,
                 (tournament_id,)
             ).fetchone()[0]
             if current_registrations >= tournament['max_slots']:
@@ -3145,7 +4952,7 @@ def register_for_tournament():
         return jsonify({"error": f"Error de base de datos: {e}"}), 500
     except Exception as e:
         db.rollback()
-        print(f"ERROR GENERICO en register_for_tournament: {e}")
+        logger.error("GENERICO en register_for_tournament: %s", e)
         return jsonify({"error": f"Error inesperado: {e}"}), 500
 
 
@@ -3153,17 +4960,33 @@ def register_for_tournament():
 # app.py
 
 # AHORA, PEGA LA FUNCIÓN request_doubles_partner_api AQUÍ DEBAJO:
+ELIGIBLE_PARTNER_SQL = '''
+    SELECT p.id, p.first_name, p.last_name, p.gender
+    FROM Players p
+    LEFT JOIN TournamentTeams tt ON (
+        (p.id = (SELECT player1_id FROM Teams WHERE id = tt.team_id)) OR
+        (p.id = (SELECT player2_id FROM Teams WHERE id = tt.team_id))
+    ) AND tt.tournament_id = ?
+    WHERE p.id = ? AND tt.id IS NULL'''
+PLAYER_TOURNAMENT_TEAM_SQL = '''
+    SELECT tt.id FROM TournamentTeams tt
+    JOIN Teams t ON tt.team_id = t.id
+    WHERE tt.tournament_id = ? AND (t.player1_id = ? OR t.player2_id = ?)'''
+DUPLICATE_PARTNER_REQUEST_SQL = '''
+    SELECT id FROM DoublesPartnerRequests
+    WHERE tournament_id = ?
+      AND ((requester_player_id = ? AND requested_player_id = ?)
+       OR (requester_player_id = ? AND requested_player_id = ?))
+      AND status = 'pending' '''
+
 @app.route('/api/doubles/request_partner_v2', methods=['POST'])
 @login_required
 def request_doubles_partner_api():
-    print("DEBUG: ¡¡¡request_doubles_partner_api_V2 EJECUTÁNDOSE!!!")
     user_id = session.get('user_id')
     db = get_db()
     cursor = db.cursor()
     
-    linked_player_row = db.execute(
-        "SELECT player_id FROM UserPlayersLink WHERE user_id = ?", (user_id,)
-    ).fetchone()
+    linked_player_row = db.execute(USER_PLAYER_LINK_SQL, (user_id,)).fetchone()
 
     if not linked_player_row:
         return jsonify({"error": "Tu cuenta no está vinculada a un perfil de jugador."}), 400
@@ -3190,16 +5013,7 @@ def request_doubles_partner_api():
 
         # 2. Validar elegibilidad del jugador solicitado *para este torneo*
         requested_player_data = db.execute(
-            '''
-            SELECT p.id, p.first_name, p.last_name, p.gender
-            FROM Players p
-            LEFT JOIN TournamentTeams tt ON (
-                (p.id = (SELECT player1_id FROM Teams WHERE id = tt.team_id)) OR
-                (p.id = (SELECT player2_id FROM Teams WHERE id = tt.team_id))
-            ) AND tt.tournament_id = ?
-            WHERE p.id = ? AND tt.id IS NULL
-            ''',
-            (tournament_id, requested_player_id)
+            ELIGIBLE_PARTNER_SQL, (tournament_id, requested_player_id)
         ).fetchone()
 
         if not requested_player_data:
@@ -3207,12 +5021,7 @@ def request_doubles_partner_api():
 
         # 3. Verificar que el solicitante NO esté ya en un equipo para ESTE torneo
         requester_in_team_for_tournament = db.execute(
-            '''
-            SELECT tt.id FROM TournamentTeams tt
-            JOIN Teams t ON tt.team_id = t.id
-            WHERE tt.tournament_id = ? AND (t.player1_id = ? OR t.player2_id = ?)
-            ''',
-            (tournament_id, requester_player_id, requester_player_id)
+            PLAYER_TOURNAMENT_TEAM_SQL, (tournament_id, requester_player_id, requester_player_id)
         ).fetchone()
 
         if requester_in_team_for_tournament:
@@ -3220,11 +5029,7 @@ def request_doubles_partner_api():
 
         # 4. Verificar si ya existe una solicitud pendiente entre estos dos jugadores PARA ESTE TORNEO (en cualquier dirección)
         existing_request = db.execute(
-            '''SELECT id FROM DoublesPartnerRequests
-               WHERE tournament_id = ?
-                 AND ((requester_player_id = ? AND requested_player_id = ?)
-                  OR (requester_player_id = ? AND requested_player_id = ?))
-                 AND status = 'pending' ''',
+            DUPLICATE_PARTNER_REQUEST_SQL,
             (tournament_id, requester_player_id, requested_player_id, requested_player_id, requester_player_id)
         ).fetchone()
 
@@ -3243,8 +5048,7 @@ def request_doubles_partner_api():
 
     except sqlite3.IntegrityError as e:
         db.rollback()
-        print(f"ERROR DB: [request_doubles_partner_api] Error de SQLite (Integridad): {str(e)}")
-        traceback.print_exc()
+        logger.exception("DB: [request_doubles_partner_api] Error de SQLite (Integridad): %s", e)
         # --- CAMBIO AQUÍ: RELANZAR LA EXCEPCIÓN EN MODO DEBUG ---
         if app.debug: # Solo relanzar si Flask está en modo debug
             raise e
@@ -3252,8 +5056,7 @@ def request_doubles_partner_api():
         return jsonify({"error": f"Error de base de datos (Integridad): {str(e)}"}), 500
     except sqlite3.Error as e:
         db.rollback()
-        print(f"ERROR DB: [request_doubles_partner_api] Error de SQLite: {str(e)}")
-        traceback.print_exc()
+        logger.exception("DB: [request_doubles_partner_api] Error de SQLite: %s", e)
         # --- CAMBIO AQUÍ: RELANZAR LA EXCEPCIÓN EN MODO DEBUG ---
         if app.debug:
             raise e
@@ -3261,8 +5064,7 @@ def request_doubles_partner_api():
         return jsonify({"error": f"Error de base de datos al enviar solicitud: {str(e)}"}), 500
     except Exception as e:
         db.rollback()
-        print(f"ERROR GENERICO: [request_doubles_partner_api] Error inesperado: {str(e)}")
-        traceback.print_exc()
+        logger.exception("GENERICO: [request_doubles_partner_api] Error inesperado: %s", e)
         # --- CAMBIO AQUÍ: RELANZAR LA EXCEPCIÓN EN MODO DEBUG ---
         if app.debug:
             raise e
@@ -3270,15 +5072,32 @@ def request_doubles_partner_api():
         return jsonify({"error": f"Error inesperado al enviar solicitud: {str(e)}"}), 500
 
 
+PARTNER_REQUESTS_SENT_SQL = '''
+    SELECT dpr.id, dpr.requested_player_id, dpr.status, dpr.created_at, dpr.tournament_id,
+           p.first_name || ' ' || p.last_name AS requested_player_name,
+           t.name AS tournament_name -- <<-- Obtener el nombre del torneo
+    FROM DoublesPartnerRequests dpr
+    JOIN Players p ON dpr.requested_player_id = p.id
+    JOIN Tournaments t ON dpr.tournament_id = t.id -- <<-- Unir con Tournaments
+    WHERE dpr.requester_player_id = ?
+    ORDER BY dpr.created_at DESC'''
+PARTNER_REQUESTS_RECEIVED_SQL = '''
+    SELECT dpr.id, dpr.requester_player_id, dpr.status, dpr.created_at, dpr.tournament_id,
+           p.first_name || ' ' || p.last_name AS requester_player_name,
+           t.name AS tournament_name -- <<-- Obtener el nombre del torneo
+    FROM DoublesPartnerRequests dpr
+    JOIN Players p ON dpr.requester_player_id = p.id
+    JOIN Tournaments t ON dpr.tournament_id = t.id -- <<-- Unir con Tournaments
+    WHERE dpr.requested_player_id = ?
+    ORDER BY dpr.created_at DESC'''
+
 @app.route('/api/doubles/my_partner_requests', methods=['GET'])
 @login_required
 def get_my_partner_requests_api():
     user_id = session.get('user_id')
     db = get_db()
 
-    linked_player_row = db.execute(
-        "SELECT player_id FROM UserPlayersLink WHERE user_id = ?", (user_id,)
-    ).fetchone()
+    linked_player_row = db.execute(USER_PLAYER_LINK_SQL, (user_id,)).fetchone()
 
     if not linked_player_row:
         return jsonify({"error": "Tu cuenta no está vinculada a un perfil de jugador."}), 400
@@ -3288,14 +5107,7 @@ def get_my_partner_requests_api():
     try:
         # Solicitudes ENVIADAS por el jugador actual
         sent_requests_db = db.execute(
-            '''SELECT dpr.id, dpr.requested_player_id, dpr.status, dpr.created_at, dpr.tournament_id,
-                      p.first_name || ' ' || p.last_name AS requested_player_name,
-                      t.name AS tournament_name -- <<-- Obtener el nombre del torneo
-               FROM DoublesPartnerRequests dpr
-               JOIN Players p ON dpr.requested_player_id = p.id
-               JOIN Tournaments t ON dpr.tournament_id = t.id -- <<-- Unir con Tournaments
-               WHERE dpr.requester_player_id = ?
-               ORDER BY dpr.created_at DESC''',
+            PARTNER_REQUESTS_SENT_SQL,
             (current_player_id,)
         ).fetchall()
         
@@ -3303,14 +5115,7 @@ def get_my_partner_requests_api():
 
         # Solicitudes RECIBIDAS por el jugador actual
         received_requests_db = db.execute(
-            '''SELECT dpr.id, dpr.requester_player_id, dpr.status, dpr.created_at, dpr.tournament_id,
-                      p.first_name || ' ' || p.last_name AS requester_player_name,
-                      t.name AS tournament_name -- <<-- Obtener el nombre del torneo
-               FROM DoublesPartnerRequests dpr
-               JOIN Players p ON dpr.requester_player_id = p.id
-               JOIN Tournaments t ON dpr.tournament_id = t.id -- <<-- Unir con Tournaments
-               WHERE dpr.requested_player_id = ?
-               ORDER BY dpr.created_at DESC''',
+            PARTNER_REQUESTS_RECEIVED_SQL,
             (current_player_id,)
         ).fetchall()
 
@@ -3322,24 +5127,39 @@ def get_my_partner_requests_api():
         }), 200
 
     except sqlite3.Error as e:
-        print(f"ERROR DB: [get_my_partner_requests_api] Error de SQLite: {str(e)}")
+        logger.error("DB: [get_my_partner_requests_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al obtener solicitudes de compañero: {str(e)}"}), 500
     except Exception as e:
         db.rollback()
-        print(f"ERROR GENERICO: [get_my_partner_requests_api] Error inesperado: {str(e)}")
+        logger.error("GENERICO: [get_my_partner_requests_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al obtener solicitudes de compañero: {str(e)}"}), 500
 
+# Si los dos jugadores ya están en un equipo del torneo se informa primero del solicitante
+TOURNAMENT_TEAM_OF_PLAYERS_SQL = '''
+    SELECT tt.id, t.team_name,
+           CASE WHEN ? IN (t.player1_id, t.player2_id) THEN ? ELSE ? END AS player_id
+    FROM TournamentTeams tt
+    JOIN Teams t ON tt.team_id = t.id
+    WHERE tt.tournament_id = ?
+      AND (t.player1_id IN (?, ?) OR t.player2_id IN (?, ?))
+    ORDER BY ? IN (t.player1_id, t.player2_id) DESC
+    LIMIT 1'''
+MAX_TOURNAMENT_TEAM_POSITION_SQL = '''
+    SELECT MAX(tournament_current_position) as max_pos FROM TournamentTeams
+    WHERE tournament_id = ?'''
+REJECT_PENDING_PARTNER_REQUESTS_SQL = '''
+    UPDATE DoublesPartnerRequests SET status = 'rejected'
+    WHERE status = 'pending' AND tournament_id = ?
+      AND (requester_player_id = ? OR requested_player_id = ? OR requester_player_id = ? OR requested_player_id = ?)'''
+
 @app.route('/api/doubles/respond_partner_request/<int:request_id>', methods=['POST'])
 @login_required
 def respond_partner_request_api(request_id):
-    print("DEBUG: ¡¡¡request_doubles_partner_api_V2 EJECUTÁNDOSE!!!")
     user_id = session.get('user_id')
     db = get_db()
     cursor = db.cursor()
     
-    linked_player_row = db.execute(
-        "SELECT player_id FROM UserPlayersLink WHERE user_id = ?", (user_id,)
-    ).fetchone()
+    linked_player_row = db.execute(USER_PLAYER_LINK_SQL, (user_id,)).fetchone()
 
     if not linked_player_row:
         return jsonify({"error": "Tu cuenta no está vinculada a un perfil de jugador."}), 400
@@ -3356,6 +5176,10 @@ def respond_partner_request_api(request_id):
         return jsonify({"error": "Acción no válida. Debe ser 'accept' o 'reject'."}), 400
 
     try:
+        # La solicitud y la última posición del torneo se leen ya con el lock de escritura tomado:
+        # dos aceptaciones simultáneas no registran equipos en la misma posición
+        begin_immediate(db, 'respond_partner_request')
+
         # Obtener la solicitud (incluye tournament_id)
         request_data = db.execute(
             "SELECT requester_player_id, requested_player_id, status, tournament_id FROM DoublesPartnerRequests WHERE id = ?",
@@ -3378,22 +5202,26 @@ def respond_partner_request_api(request_id):
 
         if action == 'accept':
             # 1. Verificar si alguno de los jugadores ya está en un equipo *para ESTE torneo*
-            for player_check_id in [requester_id, requested_id]:
-                existing_team_for_player = db.execute(
-                    '''SELECT tt.id, t.team_name FROM TournamentTeams tt
-                       JOIN Teams t ON tt.team_id = t.id
-                       WHERE tt.tournament_id = ? AND (t.player1_id = ? OR t.player2_id = ?)''',
-                    (tournament_id, player_check_id, player_check_id)
-                ).fetchone()
-                if existing_team_for_player:
-                    # Si ya está en un equipo, rechazar la solicitud actual y notificar
-                    cursor.execute("UPDATE DoublesPartnerRequests SET status = 'rejected' WHERE id = ?", (request_id,))
-                    db.commit()
-                    return jsonify({"error": f"No se pudo aceptar: Jugador {player_check_id} ya está en el equipo '{existing_team_for_player['team_name']}' para este torneo."}), 409
+            # (una sola consulta para ambos; si los dos lo están se informa primero del solicitante)
+            existing_team_for_player = db.execute(
+                TOURNAMENT_TEAM_OF_PLAYERS_SQL,
+                (requester_id, requester_id, requested_id, tournament_id,
+                 requester_id, requested_id, requester_id, requested_id, requester_id)
+            ).fetchone()
+            if existing_team_for_player:
+                # Si ya está en un equipo, rechazar la solicitud actual y notificar
+                cursor.execute("UPDATE DoublesPartnerRequests SET status = 'rejected' WHERE id = ?", (request_id,))
+                db.commit()
+                return jsonify({"error": f"No se pudo aceptar: Jugador {existing_team_for_player['player_id']} ya está en el equipo '{existing_team_for_player['team_name']}' para este torneo."}), 409
 
-            # 2. Obtener el género de los jugadores (de Players global)
-            requester_gender = db.execute('SELECT gender FROM Players WHERE id = ?', (requester_id,)).fetchone()['gender']
-            requested_gender = db.execute('SELECT gender FROM Players WHERE id = ?', (requested_id,)).fetchone()['gender']
+            # 2. Obtener género y nombre de ambos jugadores (de Players global) en una sola consulta
+            players_by_id = {
+                row['id']: row for row in db.execute(
+                    'SELECT id, gender, first_name FROM Players WHERE id IN (?, ?)', (requester_id, requested_id)
+                )
+            }
+            requester_gender = players_by_id[requester_id]['gender']
+            requested_gender = players_by_id[requested_id]['gender']
 
             if requester_gender != requested_gender:
                 cursor.execute("UPDATE DoublesPartnerRequests SET status = 'rejected' WHERE id = ?", (request_id,))
@@ -3402,17 +5230,16 @@ def respond_partner_request_api(request_id):
 
             # 3. Formar el Equipo GLOBAL si no existe (en la tabla Teams)
             existing_global_team = db.execute(
-                '''SELECT id FROM Teams WHERE
-                   (player1_id = ? AND player2_id = ?) OR (player1_id = ? AND player2_id = ?)''',
-                (requester_id, requested_id, requested_id, requester_id)
+                TEAM_PAIR_SQL, (requester_id, requested_id, requested_id, requester_id)
             ).fetchone()
 
             global_team_id = None
             if existing_global_team:
                 global_team_id = existing_global_team['id']
-                print(f"DEBUG: Equipo global ya existente (ID: {global_team_id}).")
+                team_name = existing_global_team['team_name']
+                logger.debug("Equipo global ya existente (ID: %s).", global_team_id)
             else:
-                team_name = f"{db.execute('SELECT first_name FROM Players WHERE id = ?', (requester_id,)).fetchone()['first_name']}/{db.execute('SELECT first_name FROM Players WHERE id = ?', (requested_id,)).fetchone()['first_name']}"
+                team_name = f"{players_by_id[requester_id]['first_name']}/{players_by_id[requested_id]['first_name']}"
                 gender_category = requester_gender
 
                 cursor.execute(
@@ -3421,7 +5248,7 @@ def respond_partner_request_api(request_id):
                     (requester_id, requested_id, team_name, gender_category)
                 )
                 global_team_id = cursor.lastrowid
-                print(f"DEBUG: Nuevo equipo global creado (ID: {global_team_id}).")
+                logger.debug("Nuevo equipo global creado (ID: %s).", global_team_id)
 
             # 4. Registrar el equipo en TournamentTeams para ESTE TORNEO
             tournament_type_info = db.execute("SELECT type FROM Tournaments WHERE id = ?", (tournament_id,)).fetchone()
@@ -3434,11 +5261,7 @@ def respond_partner_request_api(request_id):
             tournament_team_current_pos = 0
 
             if is_pyramid_doubles_tournament:
-                last_tournament_team_pos_row = db.execute(
-                    '''SELECT MAX(tournament_current_position) as max_pos FROM TournamentTeams
-                       WHERE tournament_id = ?''',
-                    (tournament_id,)
-                ).fetchone()
+                last_tournament_team_pos_row = db.execute(MAX_TOURNAMENT_TEAM_POSITION_SQL, (tournament_id,)).fetchone()
                 tournament_team_initial_pos = (last_tournament_team_pos_row['max_pos'] or 0) + 1
                 tournament_team_current_pos = tournament_team_initial_pos
             else:
@@ -3450,15 +5273,14 @@ def respond_partner_request_api(request_id):
                    VALUES (?, ?, ?, ?)""",
                 (tournament_id, global_team_id, tournament_team_initial_pos, tournament_team_current_pos)
             )
+            bump_ladder_version(cursor, ('doubles', tournament_id))
 
             # 5. Marcar la solicitud como aceptada
             cursor.execute("UPDATE DoublesPartnerRequests SET status = 'accepted' WHERE id = ?", (request_id,))
 
             # 6. Opcional: Rechazar automáticamente otras solicitudes pendientes para ambos jugadores *para este torneo*
             cursor.execute(
-                """UPDATE DoublesPartnerRequests SET status = 'rejected'
-                   WHERE status = 'pending' AND tournament_id = ?
-                     AND (requester_player_id = ? OR requested_player_id = ? OR requester_player_id = ? OR requested_player_id = ?)""",
+                REJECT_PENDING_PARTNER_REQUESTS_SQL,
                 (tournament_id, requester_id, requester_id, requested_id, requested_id)
             )
 
@@ -3470,25 +5292,35 @@ def respond_partner_request_api(request_id):
             db.commit()
             return jsonify({"message": "Solicitud rechazada."}), 200
 
+    except WriteLockTimeout:
+        return write_busy_response()
     except sqlite3.IntegrityError as e:
         db.rollback()
-        print(f"ERROR DB: [respond_partner_request_api] Error de SQLite (Integridad): {str(e)}")
-        traceback.print_exc()
+        logger.exception("DB: [respond_partner_request_api] Error de SQLite (Integridad): %s", e)
         if app.debug: raise e
         return jsonify({"error": f"Error de base de datos (Integridad): {str(e)}"}), 500
     except sqlite3.Error as e:
         db.rollback()
-        print(f"ERROR DB: [respond_partner_request_api] Error de SQLite: {str(e)}")
-        traceback.print_exc()
+        logger.exception("DB: [respond_partner_request_api] Error de SQLite: %s", e)
         if app.debug: raise e
         return jsonify({"error": f"Error de base de datos al responder solicitud: {str(e)}"}), 500
     except Exception as e:
         db.rollback()
-        print(f"ERROR GENERICO: [respond_partner_request_api] Error inesperado: {str(e)}")
-        traceback.print_exc()
+        logger.exception("GENERICO: [respond_partner_request_api] Error inesperado: %s", e)
         if app.debug: raise e
         return jsonify({"error": f"Error inesperado al responder solicitud: {str(e)}"}), 500
     
+# {gender_filter}: '' o ' AND t.gender_category = ?'
+MY_GLOBAL_TEAMS_SQL = '''
+    SELECT t.id, t.team_name, t.player1_id, t.player2_id, t.gender_category,
+            p1.first_name AS p1_first_name, p1.last_name AS p1_last_name,
+            p2.first_name AS p2_first_name, p2.last_name AS p2_last_name
+    FROM Teams t
+    JOIN Players p1 ON t.player1_id = p1.id
+    JOIN Players p2 ON t.player2_id = p2.id
+    WHERE (t.player1_id = ? OR t.player2_id = ?){gender_filter}
+    ORDER BY t.team_name ASC'''
+
 @app.route('/api/doubles/my_global_teams', methods=['GET'])
 @login_required
 def get_my_global_teams_api():
@@ -3503,24 +5335,14 @@ def get_my_global_teams_api():
     gender_category_filter = request.args.get('gender_category') # Ej: 'Masculino', 'Femenino', 'Mixto'
 
     try:
-        query = '''
-            SELECT t.id, t.team_name, t.player1_id, t.player2_id, t.gender_category,
-                    p1.first_name AS p1_first_name, p1.last_name AS p1_last_name,
-                    p2.first_name AS p2_first_name, p2.last_name AS p2_last_name
-            FROM Teams t
-            JOIN Players p1 ON t.player1_id = p1.id
-            JOIN Players p2 ON t.player2_id = p2.id
-            WHERE (t.player1_id = ? OR t.player2_id = ?)
-        '''
         params = [player_id, player_id]
+        gender_filter = ''
 
         if gender_category_filter:
-            query += " AND t.gender_category = ?"
+            gender_filter = " AND t.gender_category = ?"
             params.append(gender_category_filter)
-        
-        query += " ORDER BY t.team_name ASC"
 
-        teams_db = db.execute(query, params).fetchall()
+        teams_db = db.execute(MY_GLOBAL_TEAMS_SQL.format(gender_filter=gender_filter), params).fetchall()
 
         teams_list = []
         for team_row in teams_db:
@@ -3532,14 +5354,427 @@ def get_my_global_teams_api():
         return jsonify(teams_list), 200
 
     except sqlite3.Error as e:
-        print(f"ERROR DB: [get_my_global_teams_api] Error de SQLite: {str(e)}")
-        traceback.print_exc()
+        logger.exception("DB: [get_my_global_teams_api] Error de SQLite: %s", e)
         return jsonify({"error": f"Error de base de datos al obtener equipos globales: {str(e)}"}), 500
     except Exception as e:
-        print(f"ERROR GENERICO: [get_my_global_teams_api] Error inesperado: {str(e)}")
-        traceback.print_exc()
+        logger.exception("GENERICO: [get_my_global_teams_api] Error inesperado: %s", e)
         return jsonify({"error": f"Error inesperado al obtener equipos globales: {str(e)}"}), 500
 
+# --- Perfilado de Peticiones (solo organizadores) ---
+# Un organizador puede perfilar una petición real añadiendo 'X-Profile: cprofile|sample' o
+# '?_profile=cprofile|sample' ('1' = cprofile). El perfil se guarda en PROFILES_FOLDER (.pstats para
+# cProfile, .folded para el muestreo, que leen flamegraph.pl y speedscope) y el nombre del archivo
+# vuelve en la cabecera X-Profile-File. Solo se conservan los PROFILES_MAX_FILES más recientes
+# (y no más de PROFILES_MAX_BYTES en total), así que puede quedarse activado en producción.
+app.config['PROFILER_ENABLED'] = os.environ.get('PROFILER_ENABLED', '1') == '1'
+app.config['PROFILES_FOLDER'] = os.environ.get('PROFILES_FOLDER', os.path.join(app.instance_path, 'profiles'))
+app.config['PROFILES_MAX_FILES'] = int(os.environ.get('PROFILES_MAX_FILES', '50'))
+app.config['PROFILES_MAX_BYTES'] = int(os.environ.get('PROFILES_MAX_BYTES', str(100 * 1024 * 1024)))
+app.config['PROFILER_SAMPLE_INTERVAL_MS'] = float(os.environ.get('PROFILER_SAMPLE_INTERVAL_MS', '2'))
+
+PROFILE_EXTENSIONS = {'cprofile': 'pstats', 'sample': 'folded'}
+_PROFILE_NAME_RE = re.compile(r'^[\w.-]+\.(?:pstats|folded)$')
+
+
+class StackSampler(threading.Thread):
+    """Perfilador por muestreo: copia la pila de un hilo cada `interval` segundos.
+
+    Acumula las pilas en formato 'folded' (una línea 'marco;marco;marco N' por pila distinta).
+    A diferencia de cProfile no ralentiza el código perfilado, pero solo ve lo que dura más que
+    el intervalo.
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='stack-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({frame.f_globals.get('__name__', '?')}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _requested_profiler():
+    mode = (request.headers.get('X-Profile') or request.args.get('_profile') or '').lower()
+    if mode in ('1', 'true'):
+        mode = 'cprofile'
+    return mode if mode in PROFILE_EXTENSIONS else None
+
+def prune_profiles(folder):
+    """Borra los perfiles más antiguos que excedan PROFILES_MAX_FILES o PROFILES_MAX_BYTES."""
+    entries = []
+    with os.scandir(folder) as it:
+        for entry in it:
+            if _PROFILE_NAME_RE.match(entry.name):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError: # Otro worker lo acaba de borrar
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort(reverse=True)
+    kept_bytes = 0
+    for index, (_, size, path) in enumerate(entries):
+        kept_bytes += size
+        if index >= app.config['PROFILES_MAX_FILES'] or kept_bytes > app.config['PROFILES_MAX_BYTES']:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+@app.before_request
+def start_request_profiler():
+    if not app.config['PROFILER_ENABLED'] or not session.get('is_admin'):
+        return
+    mode = _requested_profiler()
+    if mode is None:
+        return
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = StackSampler(threading.get_ident(), app.config['PROFILER_SAMPLE_INTERVAL_MS'] / 1000)
+        profiler.start()
+    g.request_profiler = (mode, profiler, time.perf_counter())
+
+def _stop_request_profiler():
+    mode, profiler, started = g.pop('request_profiler')
+    if mode == 'cprofile':
+        profiler.disable()
+    else:
+        profiler.stop()
+    return mode, profiler, time.perf_counter() - started
+
+@app.after_request
+def save_request_profile(response):
+    if 'request_profiler' not in g:
+        return response
+    mode, profiler, elapsed = _stop_request_profiler()
+    folder = app.config['PROFILES_FOLDER']
+    name = secure_filename(
+        f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{g.request_id}-"
+        f"{request.endpoint or 'sin_ruta'}.{PROFILE_EXTENSIONS[mode]}"
+    )
+    try:
+        os.makedirs(folder, exist_ok=True)
+        temp_path = os.path.join(folder, f".{name}.tmp")
+        # Escribir aparte y renombrar: nunca se descarga un perfil a medio escribir
+        if mode == 'cprofile':
+            profiler.dump_stats(temp_path)
+        else:
+            profiler.dump(temp_path)
+        os.replace(temp_path, os.path.join(folder, name))
+        prune_profiles(folder)
+    except OSError as e:
+        logger.error("GENERICO: [save_request_profile] No se pudo guardar el perfil %s: %s", name, e)
+        return response
+    logger.info("Perfil %s guardado (%s %s, %.1f ms)", name, request.method, request.path, elapsed * 1000)
+    response.headers['X-Profile-File'] = name
+    return response
+
+@app.teardown_request
+def stop_request_profiler(e=None):
+    # Si la petición terminó sin pasar por after_request, parar el perfilador sin guardar nada
+    if 'request_profiler' in g:
+        _stop_request_profiler()
+
+
+# --- Endpoints de Diagnóstico (solo organizadores) ---
+@app.route('/metrics', methods=['GET'])
+def metrics_api():
+    # Sin login: lo consulta Prometheus. Protegido con METRICS_TOKEN si está definido.
+    if metrics is None:
+        return jsonify({"error": "Métricas desactivadas (METRICS_ENABLED=0 o falta prometheus_client)."}), 404
+    token = app.config['METRICS_TOKEN']
+    if token and not secrets.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+        return jsonify({"error": "No autorizado."}), 401
+    return app.response_class(metrics.render(), content_type=prometheus_client.CONTENT_TYPE_LATEST)
+
+@app.route('/api/admin/db_pool', methods=['GET'])
+@login_required
+def get_db_pool_stats_api():
+    if not session.get('is_admin'):
+        return jsonify({"error": "Acceso denegado."}), 403
+    return jsonify(get_db_pool().stats()), 200
+
+@app.route('/api/admin/profiles', methods=['GET'])
+@login_required
+def list_profiles_api():
+    if not session.get('is_admin'):
+        return jsonify({"error": "Acceso denegado."}), 403
+    folder = app.config['PROFILES_FOLDER']
+    profiles = []
+    if os.path.isdir(folder):
+        with os.scandir(folder) as it:
+            for entry in it:
+                if not _PROFILE_NAME_RE.match(entry.name):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                profiles.append({
+                    "name": entry.name,
+                    "size_bytes": stat.st_size,
+                    "created_at": datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
+                    "download_url": url_for('download_profile_api', name=entry.name),
+                })
+    profiles.sort(key=lambda p: p['created_at'], reverse=True)
+    return jsonify(profiles), 200
+
+@app.route('/api/admin/profiles/<name>', methods=['GET'])
+@login_required
+def download_profile_api(name):
+    if not session.get('is_admin'):
+        return jsonify({"error": "Acceso denegado."}), 403
+    if not _PROFILE_NAME_RE.match(name):
+        return jsonify({"error": "Nombre de perfil no válido."}), 400
+    return send_from_directory(app.config['PROFILES_FOLDER'], name, as_attachment=True,
+                               mimetype='application/octet-stream' if name.endswith('.pstats') else 'text/plain')
+
+# --- Comandos CLI de Mantenimiento ---
+# Consultas calientes de los endpoints, con parámetros de ejemplo, para revisar sus planes. Son las
+# mismas constantes que ejecutan las vistas; las paginadas se comprueban en la primera página y con cursor.
+# tests/test_query_registry.py falla si una ruta caliente ejecuta una consulta que no está aquí
+# (salvo las búsquedas de una fila por clave primaria o UNIQUE).
+_SAMPLE_CURSOR = ('2025-01-01 00:00:00', 1) # (fecha, id) de la última fila de una página anterior
+_MATCHES_KEYSET = keyset_before('m.date', 'm.id', *_SAMPLE_CURSOR)
+_DOUBLES_KEYSET = keyset_before('dm.date', 'dm.id', *_SAMPLE_CURSOR)
+
+HOT_PATH_QUERIES = [
+    ('active_tournament_by_type', ACTIVE_TOURNAMENT_BY_TYPE_SQL, ('pyramid_single',)),
+    ('players_ranking', PLAYERS_RANKING_SQL, ('sm',)),
+    ('player_profile_matches', PLAYER_PROFILE_MATCHES_SQL, (1, 1)),
+    ('player_history', PLAYER_HISTORY_SQL.format(singles_keyset='1', doubles_keyset='1'), (1, 1, 1, 1, 51)),
+    ('player_history_page',
+     PLAYER_HISTORY_SQL.format(singles_keyset=_MATCHES_KEYSET[0], doubles_keyset=_DOUBLES_KEYSET[0]),
+     (1, 1, 1, 1, *_MATCHES_KEYSET[1], *_DOUBLES_KEYSET[1], 51)),
+    ('all_matches', ALL_MATCHES_SQL.format(keyset='1'), (1, 51)),
+    ('all_matches_page', ALL_MATCHES_SQL.format(keyset=_MATCHES_KEYSET[0]), (1, *_MATCHES_KEYSET[1], 51)),
+    ('all_doubles_matches', ALL_DOUBLES_MATCHES_SQL.format(keyset='1'), (1, 'Masculino', 'Masculino', 51)),
+    ('all_doubles_matches_page', ALL_DOUBLES_MATCHES_SQL.format(keyset=_DOUBLES_KEYSET[0]),
+     (1, 'Masculino', 'Masculino', *_DOUBLES_KEYSET[1], 51)),
+    ('duplicate_challenge', DUPLICATE_CHALLENGE_SQL, (1, 2)),
+    ('pending_challenges', PENDING_CHALLENGES_SQL, (1,)),
+    ('delete_match_activity', DELETE_MATCH_ACTIVITY_SQL, (1,)),
+    ('team_of_players', TEAM_OF_PLAYERS_SQL, (1, 1, 2, 2)),
+    ('max_team_position', MAX_TEAM_POSITION_SQL, ('Masculino',)),
+    ('tournament_teams_ranking', TOURNAMENT_TEAMS_RANKING_SQL.format(gender_filter=''), (1,)),
+    ('tournament_teams_ranking_gender',
+     TOURNAMENT_TEAMS_RANKING_SQL.format(gender_filter=' AND t.gender_category = ?'), (1, 'Masculino')),
+    ('tournament_team_lookup', TOURNAMENT_TEAM_LOOKUP_SQL, (1, 1)),
+    ('duplicate_doubles_challenge', DUPLICATE_DOUBLES_CHALLENGE_SQL, (1, 1, 2, 2, 1)),
+    ('pending_doubles_challenges', PENDING_DOUBLES_CHALLENGES_SQL, ()),
+    ('registration_lookup', REGISTRATION_LOOKUP_SQL, (1, 1)),
+    ('registrations_count', REGISTRATIONS_COUNT_SQL, (1,)),
+    ('partner_requests_sent', PARTNER_REQUESTS_SENT_SQL, (1,)),
+    ('partner_requests_received', PARTNER_REQUESTS_RECEIVED_SQL, (1,)),
+    ('partner_search', PARTNER_SEARCH_SQL.format(search_filter=''), (1, 1, 'Masculino')),
+    ('partner_search_by_name',
+     PARTNER_SEARCH_SQL.format(search_filter="AND (p.first_name LIKE ? OR p.last_name LIKE ?)"),
+     (1, 1, 'Masculino', '%a%', '%a%')),
+    ('eligible_partner', ELIGIBLE_PARTNER_SQL, (1, 1)),
+    ('player_tournament_team', PLAYER_TOURNAMENT_TEAM_SQL, (1, 1, 1)),
+    ('duplicate_partner_request', DUPLICATE_PARTNER_REQUEST_SQL, (1, 1, 2, 2, 1)),
+    ('tournament_team_of_players', TOURNAMENT_TEAM_OF_PLAYERS_SQL, (1, 1, 2, 1, 1, 2, 1, 2, 1)),
+    ('max_tournament_team_position', MAX_TOURNAMENT_TEAM_POSITION_SQL, (1,)),
+    ('reject_pending_partner_requests', REJECT_PENDING_PARTNER_REQUESTS_SQL, (1, 1, 1, 2, 2)),
+    ('team_pair', TEAM_PAIR_SQL, (1, 2, 2, 1)),
+    ('global_doubles_teams', GLOBAL_DOUBLES_TEAMS_SQL, ()),
+    ('my_global_teams', MY_GLOBAL_TEAMS_SQL.format(gender_filter=''), (1, 1)),
+    ('my_global_teams_gender', MY_GLOBAL_TEAMS_SQL.format(gender_filter=' AND t.gender_category = ?'), (1, 1, 'Masculino')),
+    ('user_player_link', USER_PLAYER_LINK_SQL, (1,)),
+    ('login_user', LOGIN_USER_SQL, ('admin', 'admin', 'admin')),
+]
+
+# SCAN de tabla grande aceptados a propósito: (consulta, tabla) -> motivo
+HOT_PATH_ALLOWED_SCANS = {
+    ('players_ranking', 'Players'): 'el ranking devuelve todos los jugadores, en el orden del índice de current_position',
+    ('global_doubles_teams', 'Teams'): 'el listado del organizador devuelve todos los equipos',
+}
+
+# Tablas que crecen con el uso: un SCAN completo sobre ellas en un camino caliente es un error.
+LARGE_TABLES = {
+    'Players', 'Matches', 'Challenges', 'DoublesMatches', 'ActivityLog',
+    'TournamentRegistrations', 'Teams', 'TournamentTeams', 'DoublesPartnerRequests', 'UserPlayersLink',
+    'Users', 'Sessions',
+}
+
+_PLAN_SCAN_RE = re.compile(r'^SCAN (\w+)(?: AS (\w+))?')
+_TABLE_ALIAS_RE = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+
+def _table_aliases(sql):
+    aliases = {}
+    for table, alias in _TABLE_ALIAS_RE.findall(sql):
+        aliases[table] = table
+        if alias and alias.upper() not in ('WHERE', 'ON', 'JOIN', 'LEFT', 'ORDER', 'GROUP', 'LIMIT'):
+            aliases[alias] = table
+    return aliases
+
+def find_large_table_scans(db, sql, params=(), allowed_tables=()):
+    """Devuelve las líneas de EXPLAIN QUERY PLAN que recorren completa una tabla de LARGE_TABLES.
+
+    Un SCAN ... USING [COVERING] INDEX también cuenta: recorre el índice entero, solo se ahorra ordenar.
+    Las tablas de allowed_tables no se señalan.
+    """
+    aliases = _table_aliases(sql)
+    offending = []
+    for row in db.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall():
+        detail = row['detail']
+        match = _PLAN_SCAN_RE.match(detail)
+        if match:
+            table = aliases.get(match.group(2) or match.group(1), match.group(1))
+            if table in LARGE_TABLES and table not in allowed_tables:
+                offending.append(detail)
+    return offending
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Aplica las migraciones pendientes de migrations/ sobre la base de datos configurada."""
+    applied = apply_migrations(get_db())
+    click.echo(f"Migraciones aplicadas: {', '.join(applied) if applied else 'ninguna (al día)'}")
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Falla (código 1) si alguna consulta caliente hace SCAN completo de una tabla grande."""
+    db = get_db()
+    apply_migrations(db)
+    failures = 0
+    for name, sql, params in HOT_PATH_QUERIES:
+        allowed_tables = {table for query, table in HOT_PATH_ALLOWED_SCANS if query == name}
+        offending = find_large_table_scans(db, sql, params, allowed_tables)
+        if offending:
+            failures += 1
+            click.echo(f"FALLO {name}: {'; '.join(offending)}")
+        else:
+            click.echo(f"ok    {name}")
+    if failures:
+        click.echo(f"{failures} consulta(s) recorren tablas grandes enteras (añádalas a HOT_PATH_ALLOWED_SCANS si es a propósito).")
+        sys.exit(1)
+
+def _remove_upload_file(relative_path):
+    try:
+        path = os.path.join(app.config['UPLOAD_FOLDER'], *relative_path.split('/'))
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+@app.cli.command('reclaim-uploads')
+@click.option('--grace-hours', default=24.0, show_default=True,
+              help='Solo se borran archivos sin referencias desde hace al menos estas horas.')
+@click.option('--dry-run', is_flag=True, help='Muestra qué se haría sin tocar disco ni base de datos.')
+def reclaim_uploads_command(grace_hours, dry_run):
+    """Pasa las fotos antiguas al almacén por contenido y borra los archivos sin referencias."""
+    db = get_db()
+    apply_migrations(db)
+    cursor = db.cursor()
+    upload_folder = app.config['UPLOAD_FOLDER']
+    cutoff = time.time() - grace_hours * 3600
+    adopted = deleted = freed = 0
+
+    # 1. Fotos guardadas como <timestamp>_<nombre> que siguen referenciadas: al almacén por contenido
+    legacy = db.execute(
+        """SELECT DISTINCT photo_url FROM Players
+           WHERE photo_url IS NOT NULL AND photo_url NOT IN (SELECT filename FROM Uploads)"""
+    ).fetchall()
+    for row in legacy:
+        legacy_path = os.path.join(upload_folder, row['photo_url'])
+        if not os.path.isfile(legacy_path):
+            click.echo(f"aviso  {row['photo_url']}: referenciada pero no existe en disco")
+            continue
+        if not dry_run:
+            with open(legacy_path, 'rb') as f:
+                stored = _store_stream(cursor, f, os.path.splitext(row['photo_url'])[1].lower())
+            # El trigger de Players suma la referencia al nuevo archivo
+            cursor.execute("UPDATE Players SET photo_url = ? WHERE photo_url = ?", (stored, row['photo_url']))
+            db.commit()
+        adopted += 1
+
+    # 2. Archivos del almacén sin referencias desde antes del periodo de gracia
+    unreferenced = db.execute(
+        """SELECT sha256, filename, thumbnail_format FROM Uploads
+           WHERE ref_count = 0 AND COALESCE(last_unreferenced_at, created_at) <= datetime(?, 'unixepoch')""",
+        (cutoff,)
+    ).fetchall()
+    for row in unreferenced:
+        if not dry_run:
+            # Borrar la fila solo si nadie la referenció mientras tanto
+            cursor.execute("DELETE FROM Uploads WHERE sha256 = ? AND ref_count = 0", (row['sha256'],))
+            db.commit()
+            if cursor.rowcount:
+                freed += _remove_upload_file(row['filename'])
+                if row['thumbnail_format']:
+                    for thumbnail in thumbnail_paths(row['filename'], row['thumbnail_format']).values():
+                        freed += _remove_upload_file(thumbnail)
+        deleted += 1
+
+    # 3. Archivos en disco que no constan en Uploads ni en Players (copias heredadas, temporales huérfanos)
+    known = set()
+    for r in db.execute("SELECT filename, thumbnail_format FROM Uploads"):
+        known.add(r['filename'])
+        if r['thumbnail_format']:
+            known.update(thumbnail_paths(r['filename'], r['thumbnail_format']).values())
+    known.update(r['photo_url'] for r in db.execute("SELECT DISTINCT photo_url FROM Players WHERE photo_url IS NOT NULL"))
+    for dirpath, _, filenames in os.walk(upload_folder):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            relative_path = os.path.relpath(path, upload_folder).replace(os.sep, '/')
+            if relative_path in known or os.path.getmtime(path) > cutoff:
+                continue
+            if not dry_run:
+                freed += _remove_upload_file(relative_path)
+            deleted += 1
+
+    prefix = '[dry-run] ' if dry_run else ''
+    click.echo(f"{prefix}{adopted} foto(s) movidas al almacén por contenido, {deleted} archivo(s) borrados, "
+               f"{freed / (1024 * 1024):.2f} MB liberados.")
+
+@app.cli.command('generate-thumbnails')
+@click.option('--all', 'regenerate_all', is_flag=True, help='Regenera también las que ya existen.')
+def generate_thumbnails_command(regenerate_all):
+    """Genera las miniaturas pendientes de las fotos del almacén (p. ej. tras reclaim-uploads)."""
+    if Image is None:
+        click.echo("Pillow no está instalado: pip install -r requirements.txt")
+        sys.exit(1)
+    db = get_db()
+    apply_migrations(db)
+    fmt = app.config['THUMBNAIL_FORMAT']
+    query = "SELECT filename FROM Uploads"
+    if not regenerate_all:
+        query += " WHERE thumbnail_format IS NOT ?"
+    rows = db.execute(query, () if regenerate_all else (fmt,)).fetchall()
+    futures = {enqueue_thumbnails(row['filename']): row['filename'] for row in rows}
+    failures = 0
+    for future, filename in futures.items():
+        try:
+            future.result()
+        except Exception as e:
+            failures += 1
+            click.echo(f"FALLO {filename}: {e}")
+    get_thumbnail_executor().shutdown(wait=True) # Espera también a los callbacks
+    click.echo(f"{len(futures) - failures} foto(s) con miniaturas generadas, {failures} fallo(s).")
+    if failures:
+        sys.exit(1)
+
 # --- Punto de Entrada de la Aplicación ---
 if __name__ == '__main__':
     with app.app_context():
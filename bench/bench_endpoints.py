@@ -0,0 +1,243 @@
+"""Benchmark de las rutas clave sobre pirámides sintéticas de varios tamaños.
+
+Para cada escala (número de jugadores), en un proceso aparte:
+  - construye (o reutiliza de --fixtures-dir) la DB con bench/ladder_fixtures.py y trabaja sobre una copia,
+  - inicia sesión como 'admin' y llama a cada ruta con el test client de Flask,
+  - mide p50 / p95 / p99 / media por ruta y cuenta las sentencias SQL de cada petición
+    (cabecera X-SQL-Queries, activada con SQL_DEBUG_HEADERS=1).
+
+El resultado es un JSON que sirve de línea base: con --compare se contrasta una ejecución nueva
+contra él y el proceso sale con código 1 si alguna ruta empeora (p95 por encima de la tolerancia
+o más sentencias SQL que antes).
+
+Uso:
+    python bench/bench_endpoints.py [--scales 100,10000,100000] [--requests 50] [--output base.json]
+    python bench/bench_endpoints.py --scales 100,10000 --compare base.json [--tolerance 0.25]
+    python bench/bench_endpoints.py --fixtures-dir /tmp/ladders ...   # reutiliza las DB generadas
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SCALES = '100,10000,100000'
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _route_requests(players, rng):
+    """(nombre, generador de peticiones) de cada ruta medida; cada llamada devuelve (método, url, kwargs)."""
+    def match_result():
+        challenger_id, challenged_id = rng.sample(range(1, players + 1), 2)
+        sets = [[6, rng.randrange(5)], [6, rng.randrange(5)]]
+        if rng.random() < 0.5:
+            sets = [[b, a] for a, b in sets]
+        return 'POST', '/api/match_result', {'json': {'challengerId': challenger_id, 'challengedId': challenged_id,
+                                                      'sets': sets}}
+
+    return (
+        ('GET /api/players', lambda: ('GET', '/api/players', {})),
+        ('POST /api/match_result', match_result),
+        ('GET /api/players/<id>/history',
+         lambda: ('GET', f'/api/players/{rng.randint(1, players)}/history', {})),
+        ('GET /api/obtener_todos_los_torneos_disponibles',
+         lambda: ('GET', '/api/obtener_todos_los_torneos_disponibles', {})),
+        ('POST /api/reset_cycle_activity', lambda: ('POST', '/api/reset_cycle_activity', {})),
+    )
+
+
+def run_worker(players, requests_count, warmup, seed, fixture, workdir):
+    """Se ejecuta en el subproceso: el entorno ya trae SQL_DEBUG_HEADERS=1."""
+    sys.path.insert(0, REPO_ROOT)
+    from ladder_fixtures import build_fixture, fixture_volumes
+    import app as app_module
+
+    started = time.perf_counter()
+    volumes = None
+    if not os.path.exists(fixture):
+        volumes = build_fixture(fixture, players, seed)
+    build_seconds = time.perf_counter() - started
+
+    # Las rutas de escritura modifican la DB: trabajar sobre una copia del fixture
+    database = os.path.join(workdir, 'bench.db')
+    source = sqlite3.connect(fixture)
+    target = sqlite3.connect(database)
+    try:
+        source.backup(target)
+        if volumes is None:
+            volumes = fixture_volumes(source)
+    finally:
+        target.close()
+        source.close()
+
+    app = app_module.app
+    app.config['DATABASE'] = database
+    client = app.test_client()
+    client.post('/login', data={'username_or_email': 'admin', 'password': 'password'})
+
+    rng = random.Random(seed)
+    routes = {}
+    for name, next_request in _route_requests(players, rng):
+        samples, queries, errors = [], [], 0
+        for index in range(warmup + requests_count):
+            method, url, kwargs = next_request()
+            request_started = time.perf_counter()
+            response = client.open(url, method=method, **kwargs)
+            response.get_data() # Consumir también las respuestas en streaming
+            elapsed_ms = (time.perf_counter() - request_started) * 1000
+            if index < warmup:
+                continue
+            samples.append(elapsed_ms)
+            if response.status_code >= 400:
+                errors += 1
+            if 'X-SQL-Queries' in response.headers:
+                queries.append(int(response.headers['X-SQL-Queries']))
+        routes[name] = {
+            'requests': requests_count,
+            'errors': errors,
+            'mean_ms': round(statistics.fmean(samples), 4),
+            'p50_ms': round(_percentile(samples, 50), 4),
+            'p95_ms': round(_percentile(samples, 95), 4),
+            'p99_ms': round(_percentile(samples, 99), 4),
+            'queries_median': statistics.median(queries) if queries else None,
+            'queries_max': max(queries) if queries else None,
+        }
+
+    return {
+        'players': players,
+        'fixture': volumes,
+        'fixture_build_seconds': round(build_seconds, 2),
+        'routes': routes,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, tolerance):
+    """Imprime la comparación por escala y ruta; devuelve la lista de regresiones."""
+    regressions = []
+    header = f"{'escala':>8}  {'ruta':<48}{'p50 ms':>16}{'p95 ms':>16}{'p99 ms':>16}{'SQL':>10}"
+    print(header)
+    print('-' * len(header))
+    for scale, result in current['scales'].items():
+        base_routes = baseline.get('scales', {}).get(scale, {}).get('routes', {})
+        for name, route in result['routes'].items():
+            base = base_routes.get(name)
+            if base is None:
+                print(f"{scale:>8}  {name:<48}{'(sin línea base)':>16}")
+                continue
+            cells = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                change = (route[key] - base[key]) / base[key] if base[key] else 0.0
+                cells.append(f"{route[key]:>8.2f} {change:>+6.0%}")
+            queries = f"{base['queries_max']}->{route['queries_max']}"
+            problems = []
+            if base['p95_ms'] and (route['p95_ms'] - base['p95_ms']) / base['p95_ms'] > tolerance:
+                problems.append('p95')
+            if base['queries_max'] is not None and route['queries_max'] is not None \
+                    and route['queries_max'] > base['queries_max']:
+                problems.append('SQL')
+            if route['errors'] > base['errors']:
+                problems.append('errores')
+            if problems:
+                regressions.append((scale, name, problems))
+            print(f"{scale:>8}  {name:<48}{''.join(f'{c:>16}' for c in cells)}{queries:>10}"
+                  f"{'  REGRESIÓN: ' + ', '.join(problems) if problems else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default=DEFAULT_SCALES, help='Jugadores por escala, separados por comas')
+    parser.add_argument('--requests', type=int, default=50, help='Peticiones medidas por ruta')
+    parser.add_argument('--warmup', type=int, default=3, help='Peticiones de calentamiento por ruta (no se miden)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--fixtures-dir', help='Directorio donde guardar y reutilizar las DB generadas')
+    parser.add_argument('--output', help='Guardar el resultado (JSON) en este archivo')
+    parser.add_argument('--compare', help='JSON de una ejecución anterior contra el que comparar')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Aumento de p95 tolerado (0.25 = +25%%)')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--fixture', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.requests, args.warmup, args.seed, args.fixture, args.workdir)))
+        return
+
+    current = {
+        'meta': {
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'seed': args.seed,
+        },
+        'scales': {},
+    }
+    if args.fixtures_dir:
+        os.makedirs(args.fixtures_dir, exist_ok=True)
+    for players in (int(scale) for scale in args.scales.split(',')):
+        with tempfile.TemporaryDirectory() as workdir:
+            fixture = os.path.join(os.path.abspath(args.fixtures_dir or workdir), f'ladder_{players}_seed{args.seed}.db')
+            env = dict(
+                os.environ,
+                SQL_DEBUG_HEADERS='1',
+                EXPIRED_ROWS_SWEEP_INTERVAL='0',
+                SQLITE_CHECKPOINT_INTERVAL='0',
+                LOG_LEVEL='WARNING',
+            )
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--worker', str(players), '--fixture', fixture,
+                 '--workdir', workdir, '--requests', str(args.requests), '--warmup', str(args.warmup),
+                 '--seed', str(args.seed)],
+                env=env, check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+        current['scales'][str(players)] = result
+        print(f"escala {players}: {result['fixture']} (fixture en {result['fixture_build_seconds']} s)", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"Línea base: {args.compare} ({baseline['meta'].get('git_revision')}, {baseline['meta'].get('created_at')})")
+        if compare(baseline, current, args.tolerance):
+            sys.exit(1)
+        return
+
+    header = f"{'escala':>8}  {'ruta':<48}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'SQL':>6}{'errores':>9}"
+    print(header)
+    print('-' * len(header))
+    for scale, result in current['scales'].items():
+        for name, r in result['routes'].items():
+            print(f"{scale:>8}  {name:<48}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+                  f"{r['queries_max'] if r['queries_max'] is not None else '-':>6}{r['errors']:>9}")
+
+
+if __name__ == '__main__':
+    main()
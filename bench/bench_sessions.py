@@ -0,0 +1,117 @@
+"""Compara los backends de sesión (cookie, sqlite, filesystem).
+
+Para cada backend, en un proceso aparte (SESSION_BACKEND se lee al importar app.py):
+  - inicia sesión con N clientes distintos y cuenta cuántos archivos / filas quedan,
+  - mide el tiempo por petición autenticada (p50 / p95 / media) sobre un endpoint barato.
+
+Uso:
+    python bench/bench_sessions.py [--clients 200] [--requests 2000] [--backends cookie,sqlite,filesystem]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKENDS = ('cookie', 'sqlite', 'filesystem')
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_worker(backend, clients, requests_count, workdir):
+    """Se ejecuta en el subproceso: el entorno ya trae SESSION_BACKEND y SESSION_FILE_DIR."""
+    sys.path.insert(0, REPO_ROOT)
+    import app as app_module
+
+    app = app_module.app
+    app.config['DATABASE'] = os.path.join(workdir, 'bench.db')
+    with app.app_context():
+        app_module.init_db()
+        app_module.create_initial_admin()
+
+    credentials = {'username_or_email': 'admin', 'password': 'password'}
+
+    # Crecimiento: una sesión por cliente que inicia sesión y nunca cierra
+    for _ in range(clients):
+        client = app.test_client()
+        client.post('/login', data=credentials)
+
+    # Coste por petición autenticada
+    client = app.test_client()
+    client.post('/login', data=credentials)
+    for _ in range(50): # Calentamiento
+        client.get('/api/admin/db_pool')
+    samples = []
+    for _ in range(requests_count):
+        started = time.perf_counter()
+        response = client.get('/api/admin/db_pool')
+        samples.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.status_code
+
+    if backend == 'filesystem':
+        stored = len(os.listdir(app.config['SESSION_FILE_DIR']))
+    elif backend == 'sqlite':
+        with app.app_context():
+            stored = app_module.get_db().execute('SELECT COUNT(*) FROM Sessions').fetchone()[0]
+    else:
+        stored = 0 # Todo vive en la cookie del cliente
+
+    return {
+        'backend': backend,
+        'clients': clients,
+        'stored_sessions': stored,
+        'requests': requests_count,
+        'mean_ms': round(statistics.fmean(samples), 4),
+        'p50_ms': round(_percentile(samples, 50), 4),
+        'p95_ms': round(_percentile(samples, 95), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--worker', choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.clients, args.requests, args.workdir)))
+        return
+
+    results = []
+    for backend in args.backends.split(','):
+        with tempfile.TemporaryDirectory() as workdir:
+            env = dict(
+                os.environ,
+                SESSION_BACKEND=backend,
+                FLASK_SECRET_KEY=os.environ.get('FLASK_SECRET_KEY', 'bench-sessions'),
+                SESSION_FILE_DIR=os.path.join(workdir, 'flask_session'),
+                EXPIRED_ROWS_SWEEP_INTERVAL='0',
+                LOG_LEVEL='WARNING',
+            )
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--worker', backend, '--workdir', workdir,
+                 '--clients', str(args.clients), '--requests', str(args.requests)],
+                env=env, check=True, capture_output=True, text=True,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    header = f"{'backend':<12}{'sesiones':>10}{'media ms':>12}{'p50 ms':>10}{'p95 ms':>10}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['backend']:<12}{r['stored_sessions']:>10}{r['mean_ms']:>12.3f}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
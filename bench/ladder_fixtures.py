@@ -0,0 +1,218 @@
+"""Genera una tournament.db sintética con una pirámide de N jugadores para los benchmarks.
+
+Parte del esquema real (init_db + migraciones + admin inicial) y sustituye los datos de ejemplo por:
+  - N jugadores con posiciones 1..N (géneros alternos) y el usuario 'admin' vinculado al jugador 1,
+  - 3 partidos individuales por jugador en el torneo de pirámide individual activo,
+  - una pareja por cada 4 jugadores, inscrita en la pirámide de dobles de su género,
+    con 2 partidos de dobles por pareja,
+  - N // 1000 torneos satélite más (mínimo 1) con la mitad de los jugadores inscritos,
+  - las filas de ActivityLog que el propio app.py escribe por cada partido (2 por individual, 4 por dobles).
+
+Con la misma semilla el contenido es siempre el mismo, así que dos ejecuciones del benchmark
+sobre la misma escala miden lo mismo.
+
+Uso:
+    python bench/ladder_fixtures.py --players 10000 --output /tmp/ladder_10000.db [--seed 1]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MATCHES_PER_PLAYER = 3
+DOUBLES_MATCHES_PER_TEAM = 2
+PLAYERS_PER_SATELLITE = 1000
+HISTORY_DAYS = 365
+
+# Tablas cuyo contenido de ejemplo (schema.sql) se descarta; Users y los 5 torneos de ejemplo se conservan
+SAMPLE_DATA_TABLES = (
+    'ActivityLog', 'DoublesPartnerRequests', 'DoublesMatches', 'TournamentTeams', 'Teams', 'Challenges',
+    'Matches', 'TournamentRegistrations', 'UserPlayersLink', 'Players',
+)
+
+
+def _random_dates(rng, count, now):
+    start = now - timedelta(days=HISTORY_DAYS)
+    seconds = HISTORY_DAYS * 24 * 3600
+    return sorted((start + timedelta(seconds=rng.randrange(seconds))).strftime('%Y-%m-%d %H:%M:%S')
+                  for _ in range(count))
+
+
+def _score(rng, first_wins):
+    sets = [(6, rng.randrange(5)), (6, rng.randrange(5))]
+    if rng.random() < 0.3: # Partido a 3 sets
+        sets.insert(1, (rng.randrange(5), 6))
+    if not first_wins:
+        sets = [(b, a) for a, b in sets]
+    return ', '.join(f'{a}-{b}' for a, b in sets)
+
+
+def populate(conn, players, seed=1):
+    """Sustituye los datos de ejemplo de una DB recién creada por la pirámide sintética."""
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    tournaments = {row[1]: row[0] for row in conn.execute('SELECT id, type FROM Tournaments')}
+    singles_tournament = tournaments['pyramid_single']
+    doubles_tournaments = {'Masculino': tournaments['pyramid_doubles_male'],
+                           'Femenino': tournaments['pyramid_doubles_female']}
+    admin_user_id = conn.execute("SELECT id FROM Users WHERE username = 'admin'").fetchone()[0]
+    organizer_id = conn.execute('SELECT organizer_id FROM Tournaments WHERE id = ?', (singles_tournament,)).fetchone()[0]
+
+    conn.execute('BEGIN')
+    for table in SAMPLE_DATA_TABLES:
+        conn.execute(f'DELETE FROM {table}')
+
+    # Jugadores: posición i, géneros alternos (impares Masculino, pares Femenino)
+    genders = {player_id: 'Masculino' if player_id % 2 else 'Femenino' for player_id in range(1, players + 1)}
+    conn.executemany(
+        """INSERT INTO Players (id, first_name, last_name, email, gender, birth_date, location, dominant_hand,
+                                backhand_type, racquet, initial_position, current_position, points)
+           VALUES (?, ?, ?, ?, ?, '1995-01-01', 'Ciudad', 'Derecha', 'Dos manos', 'Bench', ?, ?, 0)""",
+        ((player_id, f'Jugador{player_id}', f'Bench{player_id}', f'jugador{player_id}@bench.example',
+          genders[player_id], player_id, player_id) for player_id in range(1, players + 1))
+    )
+    conn.execute('INSERT INTO UserPlayersLink (user_id, player_id) VALUES (?, 1)', (admin_user_id,))
+
+    # Partidos individuales en la pirámide activa y su ActivityLog
+    match_count = players * MATCHES_PER_PLAYER
+    match_rows, activity_rows = [], []
+    for match_id, date in enumerate(_random_dates(rng, match_count, now), start=1):
+        challenger_id, challenged_id = rng.sample(range(1, players + 1), 2) if players > 1 else (1, 1)
+        challenger_wins = rng.random() < 0.5
+        winner_id, loser_id = (challenger_id, challenged_id) if challenger_wins else (challenged_id, challenger_id)
+        match_rows.append((match_id, singles_tournament, date, challenger_id, challenged_id, winner_id, loser_id,
+                           _score(rng, challenger_wins), challenger_wins, challenger_wins))
+        for player_id in (challenger_id, challenged_id):
+            activity_rows.append((player_id, 'match_played_single', match_id, None, singles_tournament, date))
+    conn.executemany(
+        """INSERT INTO Matches (id, tournament_id, date, challenger_id, challenged_id, winner_id, loser_id,
+                                score_text, is_challenger_winner, positions_swapped, status)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'valid')""",
+        match_rows
+    )
+
+    # Parejas de dobles (jugadores del mismo género de 2 en 2) inscritas en la pirámide de su género
+    team_rows, tournament_team_rows = [], []
+    tournament_teams_by_gender = {'Masculino': [], 'Femenino': []}
+    for gender, first_id in (('Masculino', 1), ('Femenino', 2)):
+        members = list(range(first_id, players + 1, 2))
+        for position, index in enumerate(range(0, len(members) - 1, 2), start=1):
+            team_id = len(team_rows) + 1
+            player1_id, player2_id = members[index], members[index + 1]
+            team_rows.append((team_id, player1_id, player2_id, f'Jugador{player1_id}/Jugador{player2_id}', gender,
+                              position, position))
+            tournament_team_rows.append((team_id, doubles_tournaments[gender], team_id, position, position))
+            tournament_teams_by_gender[gender].append((team_id, player1_id, player2_id))
+    conn.executemany(
+        """INSERT INTO Teams (id, player1_id, player2_id, team_name, gender_category, initial_position, current_position)
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        team_rows
+    )
+    conn.executemany(
+        """INSERT INTO TournamentTeams (id, tournament_id, team_id, tournament_current_position, tournament_initial_position)
+           VALUES (?, ?, ?, ?, ?)""",
+        tournament_team_rows
+    )
+
+    # Partidos de dobles jugados entre parejas del mismo torneo
+    doubles_rows = []
+    doubles_match_id = 0
+    for gender, entries in tournament_teams_by_gender.items():
+        if len(entries) < 2:
+            continue
+        for date in _random_dates(rng, len(entries) * DOUBLES_MATCHES_PER_TEAM, now):
+            doubles_match_id += 1
+            team_a, team_b = rng.sample(entries, 2)
+            team_a_wins = rng.random() < 0.5
+            winner, loser = (team_a, team_b) if team_a_wins else (team_b, team_a)
+            doubles_rows.append((doubles_match_id, doubles_tournaments[gender], date, team_a[0], team_b[0], winner[0],
+                                 loser[0], _score(rng, team_a_wins), team_a_wins, team_a_wins, date))
+            for player_id in (*team_a[1:], *team_b[1:]):
+                activity_rows.append((player_id, 'doubles_match_played', None, doubles_match_id,
+                                      doubles_tournaments[gender], date))
+    conn.executemany(
+        """INSERT INTO DoublesMatches (id, tournament_id, date, team_a_id, team_b_id, winner_team_id, loser_team_id,
+                                       score_text, is_team_a_winner, positions_swapped, status, created_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'played', ?)""",
+        doubles_rows
+    )
+    conn.executemany(
+        """INSERT INTO ActivityLog (player_id, event_type, match_id, doubles_match_id, tournament_id, timestamp)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        activity_rows
+    )
+
+    # Torneos satélite adicionales (registro abierto) con la mitad de los jugadores inscritos
+    satellite_ids = []
+    for index in range(max(1, players // PLAYERS_PER_SATELLITE)):
+        satellite_ids.append(conn.execute(
+            """INSERT INTO Tournaments (name, start_date, end_date, registration_start_date, registration_end_date,
+                                        type, status, description, is_active, is_published, category, max_slots,
+                                        organizer_id)
+               VALUES (?, ?, ?, ?, ?, 'satellite_single', 'registration_open', 'Torneo sintético', 0, 1, 'Abierta', ?, ?)""",
+            (f'Satélite Bench {index + 1}', (now + timedelta(days=30)).strftime('%Y-%m-%d'),
+             (now + timedelta(days=60)).strftime('%Y-%m-%d'),
+             (now - timedelta(days=10)).strftime('%Y-%m-%d %H:%M:%S'),
+             (now + timedelta(days=20)).strftime('%Y-%m-%d %H:%M:%S'),
+             PLAYERS_PER_SATELLITE, organizer_id)
+        ).lastrowid)
+    conn.executemany(
+        'INSERT INTO TournamentRegistrations (player_id, tournament_id) VALUES (?, ?)',
+        ((player_id, rng.choice(satellite_ids)) for player_id in range(1, players + 1) if rng.random() < 0.5)
+    )
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    return fixture_volumes(conn)
+
+
+def fixture_volumes(conn):
+    """Filas de cada tabla generada (sirve también para un fixture ya existente)."""
+    volumes = {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+               for table in ('Players', 'Matches', 'Teams', 'DoublesMatches', 'ActivityLog', 'TournamentRegistrations')}
+    volumes['SatelliteTournaments'] = conn.execute(
+        "SELECT COUNT(*) FROM Tournaments WHERE name LIKE 'Satélite Bench %'").fetchone()[0]
+    return volumes
+
+
+def build_fixture(path, players, seed=1):
+    """Crea `path` con el esquema de app.py y la pirámide sintética. Devuelve los volúmenes generados."""
+    sys.path.insert(0, REPO_ROOT)
+    import app as app_module
+
+    if os.path.exists(path):
+        os.remove(path)
+    app = app_module.app
+    app.config['DATABASE'] = path
+    with app.app_context():
+        app_module.init_db()
+        app_module.create_initial_admin()
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.execute('PRAGMA journal_mode = WAL')
+        return populate(conn, players, seed)
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, required=True)
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    volumes = build_fixture(os.path.abspath(args.output), args.players, args.seed)
+    print(', '.join(f'{name}={count}' for name, count in volumes.items()),
+          f'({time.perf_counter() - started:.1f} s)')
+
+
+if __name__ == '__main__':
+    main()
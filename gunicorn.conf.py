@@ -0,0 +1,16 @@
+# gunicorn.conf.py - Hooks del master de gunicorn para app.py
+# gunicorn lo carga solo si se arranca desde este directorio (o con -c gunicorn.conf.py):
+#   PROMETHEUS_MULTIPROC_DIR=/tmp/torneo-metrics gunicorn -w 4 app:app
+import os
+
+
+def child_exit(server, worker):
+    """Marca como terminado en las métricas multiproceso a cada worker que sale.
+
+    Lo ejecuta el master, así que también cubre a los workers que gunicorn mata por timeout o
+    con SIGKILL, donde un atexit dentro del worker nunca llega a correr. Sin esto los gauges
+    'livesum' de /metrics seguirían sumando los valores del worker muerto.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,49 @@
+-- 0001_hot_path_indexes.sql - Índices secundarios para las consultas calientes de app.py
+-- Idempotente: se puede ejecutar tantas veces como se quiera sobre una DB existente.
+-- Los UNIQUE del esquema ya cubren: Users(username), Users(email), Players(email),
+-- TournamentRegistrations(player_id, tournament_id), Teams(player1_id, player2_id),
+-- TournamentTeams(tournament_id, team_id), UserPlayersLink(user_id, player_id) y
+-- DoublesPartnerRequests(tournament_id, requester_player_id, requested_player_id).
+
+-- Players: ranking (ORDER BY / MAX de current_position) y búsqueda de compañeros por género
+CREATE INDEX IF NOT EXISTS idx_players_current_position ON Players (current_position);
+CREATE INDEX IF NOT EXISTS idx_players_gender_position ON Players (gender, current_position);
+
+-- Tournaments: resolución del torneo activo por tipo (la consulta usa COLLATE NOCASE)
+CREATE INDEX IF NOT EXISTS idx_tournaments_type_active ON Tournaments (type COLLATE NOCASE, is_active, start_date);
+
+-- Matches: historial por jugador (challenger_id = ? OR challenged_id = ?) y listado por torneo
+CREATE INDEX IF NOT EXISTS idx_matches_challenger_date ON Matches (challenger_id, date);
+CREATE INDEX IF NOT EXISTS idx_matches_challenged_date ON Matches (challenged_id, date);
+CREATE INDEX IF NOT EXISTS idx_matches_tournament_date ON Matches (tournament_id, date);
+
+-- Challenges: pendientes por torneo y desafío duplicado entre la misma pareja
+CREATE INDEX IF NOT EXISTS idx_challenges_tournament_status ON Challenges (tournament_id, status, created_at);
+CREATE INDEX IF NOT EXISTS idx_challenges_pair_status ON Challenges (challenger_id, challenged_id, status);
+
+-- DoublesMatches: pendientes, listado por torneo e historial por equipo
+CREATE INDEX IF NOT EXISTS idx_doubles_matches_tournament_status ON DoublesMatches (tournament_id, status);
+CREATE INDEX IF NOT EXISTS idx_doubles_matches_tournament_date ON DoublesMatches (tournament_id, date);
+CREATE INDEX IF NOT EXISTS idx_doubles_matches_status_created ON DoublesMatches (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_doubles_matches_team_a_date ON DoublesMatches (team_a_id, date);
+CREATE INDEX IF NOT EXISTS idx_doubles_matches_team_b_date ON DoublesMatches (team_b_id, date);
+
+-- ActivityLog: borrado/consulta por partido y actividad por jugador
+CREATE INDEX IF NOT EXISTS idx_activity_log_match ON ActivityLog (match_id);
+CREATE INDEX IF NOT EXISTS idx_activity_log_doubles_match ON ActivityLog (doubles_match_id);
+CREATE INDEX IF NOT EXISTS idx_activity_log_player ON ActivityLog (player_id, timestamp);
+
+-- TournamentRegistrations: cupos ocupados por torneo
+CREATE INDEX IF NOT EXISTS idx_registrations_tournament_status ON TournamentRegistrations (tournament_id, status);
+
+-- Teams: pertenencia por player2_id (player1_id ya lo cubre el UNIQUE) y posición por género
+CREATE INDEX IF NOT EXISTS idx_teams_player2 ON Teams (player2_id);
+CREATE INDEX IF NOT EXISTS idx_teams_gender_position ON Teams (gender_category, current_position);
+
+-- TournamentTeams: equipos de un Teams global y ranking dentro del torneo
+CREATE INDEX IF NOT EXISTS idx_tournament_teams_team ON TournamentTeams (team_id);
+CREATE INDEX IF NOT EXISTS idx_tournament_teams_position ON TournamentTeams (tournament_id, tournament_current_position);
+
+-- DoublesPartnerRequests: solicitudes enviadas / recibidas por jugador
+CREATE INDEX IF NOT EXISTS idx_partner_requests_requester ON DoublesPartnerRequests (requester_player_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_partner_requests_requested ON DoublesPartnerRequests (requested_player_id, created_at);
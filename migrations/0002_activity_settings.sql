@@ -0,0 +1,7 @@
+-- 0002_activity_settings.sql - Umbrales del índice de actividad en TournamentSettings
+-- Idempotente: INSERT OR IGNORE respeta los valores que un administrador ya haya ajustado.
+
+INSERT OR IGNORE INTO TournamentSettings (setting_name, setting_value) VALUES
+('activity_green_threshold', '12'),
+('activity_yellow_threshold', '6'),
+('activity_max_cycle_rejections', '2');
@@ -0,0 +1,150 @@
+-- 0003_activity_triggers.sql - Índice y estado de actividad mantenidos por la propia base de datos
+-- Índice = D + 2A + 3G + DF + bonificación por desafíos ignorados (D: emitidos, A: aceptados,
+-- G: ganados, DF: defensas exitosas). Los endpoints solo incrementan contadores; los triggers
+-- recalculan activity_index_* / activity_status_* en la misma sentencia, sin ida y vuelta desde Python.
+
+-- La bonificación (+1 por desafío ignorado) pasa a ser un contador más, así sobrevive al recálculo
+ALTER TABLE Players ADD COLUMN ignored_bonus_single INTEGER DEFAULT 0;
+ALTER TABLE Players ADD COLUMN ignored_bonus_doubles INTEGER DEFAULT 0;
+ALTER TABLE TournamentTeams ADD COLUMN ignored_bonus_team_doubles INTEGER DEFAULT 0;
+
+-- Umbrales vigentes (una sola fila); los valores por defecto cubren settings ausentes
+DROP VIEW IF EXISTS ActivityThresholds;
+CREATE VIEW ActivityThresholds AS
+SELECT
+    COALESCE((SELECT CAST(setting_value AS INTEGER) FROM TournamentSettings WHERE setting_name = 'activity_green_threshold'), 12) AS green,
+    COALESCE((SELECT CAST(setting_value AS INTEGER) FROM TournamentSettings WHERE setting_name = 'activity_yellow_threshold'), 6) AS yellow,
+    COALESCE((SELECT CAST(setting_value AS INTEGER) FROM TournamentSettings WHERE setting_name = 'activity_max_cycle_rejections'), 2) AS max_rejections;
+
+-- Valores derivados por jugador: única definición de la fórmula para Players
+DROP VIEW IF EXISTS PlayerActivity;
+CREATE VIEW PlayerActivity AS
+SELECT i.id, i.idx_s, i.idx_d,
+       CASE WHEN i.idx_s >= t.green THEN 'verde' WHEN i.idx_s >= t.yellow THEN 'amarillo' ELSE 'rojo' END AS status_s,
+       CASE WHEN i.idx_d >= t.green THEN 'verde' WHEN i.idx_d >= t.yellow THEN 'amarillo' ELSE 'rojo' END AS status_d,
+       CASE WHEN i.rej >= t.max_rejections THEN 'rojo'
+            WHEN i.idx_s >= t.green OR i.idx_d >= t.green THEN 'verde'
+            WHEN i.idx_s >= t.yellow OR i.idx_d >= t.yellow THEN 'amarillo'
+            ELSE 'rojo' END AS status
+FROM (
+    SELECT id,
+           COALESCE(challenges_emitted_single, 0) + 2 * COALESCE(challenges_accepted_single, 0)
+             + 3 * COALESCE(challenges_won_single, 0) + COALESCE(defenses_successful_single, 0)
+             + COALESCE(ignored_bonus_single, 0) AS idx_s,
+           COALESCE(challenges_emitted_doubles, 0) + 2 * COALESCE(challenges_accepted_doubles, 0)
+             + 3 * COALESCE(challenges_won_doubles, 0) + COALESCE(defenses_successful_doubles, 0)
+             + COALESCE(ignored_bonus_doubles, 0) AS idx_d,
+           COALESCE(rejections_current_cycle, 0) AS rej
+    FROM Players
+) AS i, ActivityThresholds AS t;
+
+-- Valores derivados por equipo de torneo (TournamentTeams)
+DROP VIEW IF EXISTS TournamentTeamActivity;
+CREATE VIEW TournamentTeamActivity AS
+SELECT i.id, i.idx_t,
+       CASE WHEN i.rej >= t.max_rejections THEN 'rojo'
+            WHEN i.idx_t >= t.green THEN 'verde'
+            WHEN i.idx_t >= t.yellow THEN 'amarillo'
+            ELSE 'rojo' END AS status_t
+FROM (
+    SELECT id,
+           COALESCE(challenges_emitted_team_doubles, 0) + 2 * COALESCE(challenges_accepted_team_doubles, 0)
+             + 3 * COALESCE(challenges_won_team_doubles, 0) + COALESCE(defenses_successful_team_doubles, 0)
+             + COALESCE(ignored_bonus_team_doubles, 0) AS idx_t,
+           COALESCE(rejections_team_doubles_current_cycle, 0) AS rej
+    FROM TournamentTeams
+) AS i, ActivityThresholds AS t;
+
+-- Players: recálculo de la fila al insertarla o al cambiar cualquier contador
+CREATE TRIGGER IF NOT EXISTS trg_players_activity_insert
+AFTER INSERT ON Players
+BEGIN
+    UPDATE Players SET
+        activity_index_single = pa.idx_s, activity_status_single = pa.status_s,
+        activity_index_doubles = pa.idx_d, activity_status_doubles = pa.status_d,
+        activity_status = pa.status
+    FROM PlayerActivity AS pa
+    WHERE pa.id = NEW.id AND Players.id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_players_activity_update
+AFTER UPDATE OF challenges_emitted_single, challenges_accepted_single, challenges_won_single,
+                defenses_successful_single, ignored_bonus_single,
+                challenges_emitted_doubles, challenges_accepted_doubles, challenges_won_doubles,
+                defenses_successful_doubles, ignored_bonus_doubles,
+                rejections_current_cycle ON Players
+BEGIN
+    UPDATE Players SET
+        activity_index_single = pa.idx_s, activity_status_single = pa.status_s,
+        activity_index_doubles = pa.idx_d, activity_status_doubles = pa.status_d,
+        activity_status = pa.status
+    FROM PlayerActivity AS pa
+    WHERE pa.id = NEW.id AND Players.id = NEW.id;
+END;
+
+-- TournamentTeams: ídem para los equipos de dobles dentro de cada torneo
+CREATE TRIGGER IF NOT EXISTS trg_tournament_teams_activity_insert
+AFTER INSERT ON TournamentTeams
+BEGIN
+    UPDATE TournamentTeams SET
+        activity_index_team_doubles = ta.idx_t, activity_status_team_doubles = ta.status_t
+    FROM TournamentTeamActivity AS ta
+    WHERE ta.id = NEW.id AND TournamentTeams.id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tournament_teams_activity_update
+AFTER UPDATE OF challenges_emitted_team_doubles, challenges_accepted_team_doubles,
+                challenges_won_team_doubles, defenses_successful_team_doubles,
+                ignored_bonus_team_doubles, rejections_team_doubles_current_cycle ON TournamentTeams
+BEGIN
+    UPDATE TournamentTeams SET
+        activity_index_team_doubles = ta.idx_t, activity_status_team_doubles = ta.status_t
+    FROM TournamentTeamActivity AS ta
+    WHERE ta.id = NEW.id AND TournamentTeams.id = NEW.id;
+END;
+
+-- Cambio de umbrales: recálculo completo (un UPDATE por tabla)
+CREATE TRIGGER IF NOT EXISTS trg_activity_settings_insert
+AFTER INSERT ON TournamentSettings
+WHEN NEW.setting_name IN ('activity_green_threshold', 'activity_yellow_threshold', 'activity_max_cycle_rejections')
+BEGIN
+    UPDATE Players SET
+        activity_index_single = pa.idx_s, activity_status_single = pa.status_s,
+        activity_index_doubles = pa.idx_d, activity_status_doubles = pa.status_d,
+        activity_status = pa.status
+    FROM PlayerActivity AS pa
+    WHERE Players.id = pa.id;
+    UPDATE TournamentTeams SET
+        activity_index_team_doubles = ta.idx_t, activity_status_team_doubles = ta.status_t
+    FROM TournamentTeamActivity AS ta
+    WHERE TournamentTeams.id = ta.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_activity_settings_update
+AFTER UPDATE OF setting_value ON TournamentSettings
+WHEN NEW.setting_name IN ('activity_green_threshold', 'activity_yellow_threshold', 'activity_max_cycle_rejections')
+BEGIN
+    UPDATE Players SET
+        activity_index_single = pa.idx_s, activity_status_single = pa.status_s,
+        activity_index_doubles = pa.idx_d, activity_status_doubles = pa.status_d,
+        activity_status = pa.status
+    FROM PlayerActivity AS pa
+    WHERE Players.id = pa.id;
+    UPDATE TournamentTeams SET
+        activity_index_team_doubles = ta.idx_t, activity_status_team_doubles = ta.status_t
+    FROM TournamentTeamActivity AS ta
+    WHERE TournamentTeams.id = ta.id;
+END;
+
+-- Puesta al día de las filas existentes
+UPDATE Players SET
+    activity_index_single = pa.idx_s, activity_status_single = pa.status_s,
+    activity_index_doubles = pa.idx_d, activity_status_doubles = pa.status_d,
+    activity_status = pa.status
+FROM PlayerActivity AS pa
+WHERE Players.id = pa.id;
+
+UPDATE TournamentTeams SET
+    activity_index_team_doubles = ta.idx_t, activity_status_team_doubles = ta.status_t
+FROM TournamentTeamActivity AS ta
+WHERE TournamentTeams.id = ta.id;
@@ -0,0 +1,11 @@
+-- 0004_sessions.sql - Almacén de sesiones para SESSION_BACKEND=sqlite
+-- data: diccionario de la sesión en msgpack; expires_at: epoch en segundos.
+-- El índice por expires_at permite que SessionSweeper borre las expiradas sin recorrer la tabla.
+
+CREATE TABLE IF NOT EXISTS Sessions (
+    id TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_sessions_expires ON Sessions (expires_at);
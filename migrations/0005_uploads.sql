@@ -0,0 +1,43 @@
+-- 0005_uploads.sql - Almacén de archivos subidos direccionado por contenido
+-- Cada archivo se guarda una sola vez como static/uploads/<sha[:2]>/<sha256>.<ext>; filename es esa
+-- ruta relativa, la misma que guarda Players.photo_url. ref_count lo mantienen los triggers de
+-- Players, y `flask reclaim-uploads` borra los archivos sin referencias.
+
+CREATE TABLE IF NOT EXISTS Uploads (
+    sha256 TEXT PRIMARY KEY,
+    filename TEXT NOT NULL UNIQUE,
+    size_bytes INTEGER NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    last_unreferenced_at DATETIME DEFAULT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_uploads_unreferenced ON Uploads (ref_count, last_unreferenced_at);
+
+CREATE TRIGGER IF NOT EXISTS trg_players_photo_insert
+AFTER INSERT ON Players
+WHEN NEW.photo_url IS NOT NULL
+BEGIN
+    UPDATE Uploads SET ref_count = ref_count + 1 WHERE filename = NEW.photo_url;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_players_photo_update
+AFTER UPDATE OF photo_url ON Players
+WHEN NEW.photo_url IS NOT OLD.photo_url
+BEGIN
+    UPDATE Uploads SET ref_count = ref_count + 1 WHERE filename = NEW.photo_url;
+    UPDATE Uploads SET
+        ref_count = MAX(ref_count - 1, 0),
+        last_unreferenced_at = CASE WHEN ref_count <= 1 THEN CURRENT_TIMESTAMP ELSE last_unreferenced_at END
+    WHERE filename = OLD.photo_url;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_players_photo_delete
+AFTER DELETE ON Players
+WHEN OLD.photo_url IS NOT NULL
+BEGIN
+    UPDATE Uploads SET
+        ref_count = MAX(ref_count - 1, 0),
+        last_unreferenced_at = CASE WHEN ref_count <= 1 THEN CURRENT_TIMESTAMP ELSE last_unreferenced_at END
+    WHERE filename = OLD.photo_url;
+END;
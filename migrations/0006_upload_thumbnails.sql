@@ -0,0 +1,5 @@
+-- 0006_upload_thumbnails.sql - Miniaturas de las fotos del almacén por contenido
+-- thumbnail_format queda NULL hasta que el pool de procesos genera las miniaturas
+-- (<sha[:2]>/<sha256>_<tamaño>.<formato>); mientras tanto los endpoints sirven la foto original.
+
+ALTER TABLE Uploads ADD COLUMN thumbnail_format TEXT DEFAULT NULL;
@@ -0,0 +1,145 @@
+-- 0007_data_versions.sql - Contadores de versión de datos mantenidos por triggers
+-- Cada escritura en las tablas que alimentan los listados incrementa un contador en
+-- TournamentSettings ('<nombre>_version', el mismo formato que _bump_data_version de app.py).
+-- El incremento va en la misma transacción que la escritura, así que solo es visible tras el commit.
+-- Los endpoints GET derivan su ETag de estos contadores y responden 304 sin ejecutar la consulta.
+--   players                     Players (cualquier columna)
+--   uploads                     Uploads.thumbnail_format (las miniaturas listas cambian photo_url)
+--   teams                       Teams
+--   tournament_teams_<torneo>   TournamentTeams del torneo
+--   matches_<torneo>            Matches del torneo
+--   doubles_matches_<torneo>    DoublesMatches del torneo
+-- 'tournaments' ya lo incrementa invalidate_active_tournament_cache en cada escritura a Tournaments.
+
+-- Época de la base de datos: valor aleatorio fijado al crear el esquema (init_db vacía
+-- SchemaMigrations y esta migración vuelve a ejecutarse), para que un ETag emitido antes de un
+-- reinicio no coincida con contadores que volvieron a empezar desde cero.
+INSERT OR IGNORE INTO TournamentSettings (setting_name, setting_value)
+VALUES ('database_version', CAST(abs(random() % 1000000000) AS TEXT));
+
+-- Players
+CREATE TRIGGER IF NOT EXISTS trg_players_data_version_insert
+AFTER INSERT ON Players
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value) VALUES ('players_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_players_data_version_update
+AFTER UPDATE ON Players
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value) VALUES ('players_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_players_data_version_delete
+AFTER DELETE ON Players
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value) VALUES ('players_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+-- Uploads: solo importa cuándo quedan listas las miniaturas
+CREATE TRIGGER IF NOT EXISTS trg_uploads_data_version_update
+AFTER UPDATE OF thumbnail_format ON Uploads
+WHEN NEW.thumbnail_format IS NOT OLD.thumbnail_format
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value) VALUES ('uploads_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+-- Teams
+CREATE TRIGGER IF NOT EXISTS trg_teams_data_version_insert
+AFTER INSERT ON Teams
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value) VALUES ('teams_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_teams_data_version_update
+AFTER UPDATE ON Teams
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value) VALUES ('teams_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_teams_data_version_delete
+AFTER DELETE ON Teams
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value) VALUES ('teams_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+-- TournamentTeams, Matches y DoublesMatches: un contador por torneo. La tabla nunca cambia de
+-- torneo una fila existente, así que en UPDATE basta con NEW.tournament_id.
+CREATE TRIGGER IF NOT EXISTS trg_tournament_teams_data_version_insert
+AFTER INSERT ON TournamentTeams
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value)
+    VALUES ('tournament_teams_' || NEW.tournament_id || '_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tournament_teams_data_version_update
+AFTER UPDATE ON TournamentTeams
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value)
+    VALUES ('tournament_teams_' || NEW.tournament_id || '_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_tournament_teams_data_version_delete
+AFTER DELETE ON TournamentTeams
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value)
+    VALUES ('tournament_teams_' || OLD.tournament_id || '_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_matches_data_version_insert
+AFTER INSERT ON Matches
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value)
+    VALUES ('matches_' || NEW.tournament_id || '_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_matches_data_version_update
+AFTER UPDATE ON Matches
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value)
+    VALUES ('matches_' || NEW.tournament_id || '_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_matches_data_version_delete
+AFTER DELETE ON Matches
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value)
+    VALUES ('matches_' || OLD.tournament_id || '_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_doubles_matches_data_version_insert
+AFTER INSERT ON DoublesMatches
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value)
+    VALUES ('doubles_matches_' || NEW.tournament_id || '_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_doubles_matches_data_version_update
+AFTER UPDATE ON DoublesMatches
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value)
+    VALUES ('doubles_matches_' || NEW.tournament_id || '_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_doubles_matches_data_version_delete
+AFTER DELETE ON DoublesMatches
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value)
+    VALUES ('doubles_matches_' || OLD.tournament_id || '_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
@@ -0,0 +1,19 @@
+-- 0008_idempotency_keys.sql - Respuestas guardadas por Idempotency-Key (ver @idempotent en app.py)
+-- scope: '<user_id>:<endpoint>'; request_hash: sha256 del cuerpo de la petición original.
+-- status_code queda NULL mientras la petición original se procesa; al terminar se guarda la respuesta
+-- y los reintentos con la misma clave la reciben tal cual, sin volver a tocar la pirámide.
+-- expires_at (epoch en segundos) permite que ExpiredRowsSweeper borre las caducadas por índice.
+
+CREATE TABLE IF NOT EXISTS IdempotencyKeys (
+    scope TEXT NOT NULL,
+    idempotency_key TEXT NOT NULL,
+    request_hash TEXT NOT NULL,
+    status_code INTEGER DEFAULT NULL,
+    response_body BLOB DEFAULT NULL,
+    content_type TEXT DEFAULT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (scope, idempotency_key)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON IdempotencyKeys (expires_at);
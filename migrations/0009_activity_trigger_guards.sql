@@ -0,0 +1,49 @@
+-- 0009_activity_trigger_guards.sql - Recálculo de actividad solo en las filas cuyos contadores cambian
+-- Los triggers de 0003 son AFTER UPDATE OF <contadores>: saltan con que la sentencia asigne la
+-- columna, aunque el valor no cambie, y un UPDATE masivo recalculaba todas las filas de la tabla.
+-- Se recrean con una condición WHEN que compara OLD y NEW de cada contador.
+
+DROP TRIGGER IF EXISTS trg_players_activity_update;
+CREATE TRIGGER trg_players_activity_update
+AFTER UPDATE OF challenges_emitted_single, challenges_accepted_single, challenges_won_single,
+                defenses_successful_single, ignored_bonus_single,
+                challenges_emitted_doubles, challenges_accepted_doubles, challenges_won_doubles,
+                defenses_successful_doubles, ignored_bonus_doubles,
+                rejections_current_cycle ON Players
+WHEN OLD.challenges_emitted_single IS NOT NEW.challenges_emitted_single
+  OR OLD.challenges_accepted_single IS NOT NEW.challenges_accepted_single
+  OR OLD.challenges_won_single IS NOT NEW.challenges_won_single
+  OR OLD.defenses_successful_single IS NOT NEW.defenses_successful_single
+  OR OLD.ignored_bonus_single IS NOT NEW.ignored_bonus_single
+  OR OLD.challenges_emitted_doubles IS NOT NEW.challenges_emitted_doubles
+  OR OLD.challenges_accepted_doubles IS NOT NEW.challenges_accepted_doubles
+  OR OLD.challenges_won_doubles IS NOT NEW.challenges_won_doubles
+  OR OLD.defenses_successful_doubles IS NOT NEW.defenses_successful_doubles
+  OR OLD.ignored_bonus_doubles IS NOT NEW.ignored_bonus_doubles
+  OR OLD.rejections_current_cycle IS NOT NEW.rejections_current_cycle
+BEGIN
+    UPDATE Players SET
+        activity_index_single = pa.idx_s, activity_status_single = pa.status_s,
+        activity_index_doubles = pa.idx_d, activity_status_doubles = pa.status_d,
+        activity_status = pa.status
+    FROM PlayerActivity AS pa
+    WHERE pa.id = NEW.id AND Players.id = NEW.id;
+END;
+
+DROP TRIGGER IF EXISTS trg_tournament_teams_activity_update;
+CREATE TRIGGER trg_tournament_teams_activity_update
+AFTER UPDATE OF challenges_emitted_team_doubles, challenges_accepted_team_doubles,
+                challenges_won_team_doubles, defenses_successful_team_doubles,
+                ignored_bonus_team_doubles, rejections_team_doubles_current_cycle ON TournamentTeams
+WHEN OLD.challenges_emitted_team_doubles IS NOT NEW.challenges_emitted_team_doubles
+  OR OLD.challenges_accepted_team_doubles IS NOT NEW.challenges_accepted_team_doubles
+  OR OLD.challenges_won_team_doubles IS NOT NEW.challenges_won_team_doubles
+  OR OLD.defenses_successful_team_doubles IS NOT NEW.defenses_successful_team_doubles
+  OR OLD.ignored_bonus_team_doubles IS NOT NEW.ignored_bonus_team_doubles
+  OR OLD.rejections_team_doubles_current_cycle IS NOT NEW.rejections_team_doubles_current_cycle
+BEGIN
+    UPDATE TournamentTeams SET
+        activity_index_team_doubles = ta.idx_t, activity_status_team_doubles = ta.status_t
+    FROM TournamentTeamActivity AS ta
+    WHERE ta.id = NEW.id AND TournamentTeams.id = NEW.id;
+END;
@@ -0,0 +1,143 @@
+-- 0010_data_version_trigger_columns.sql - Versiones de datos solo cuando cambia lo que muestran los listados
+-- Los triggers AFTER UPDATE de 0007 saltaban con cualquier columna y en cada fila tocada: un UPDATE
+-- masivo de N filas hacía N escrituras más en TournamentSettings aunque el listado no cambiara.
+-- Se recrean como AFTER UPDATE OF las columnas que exponen los listados con ETag, y con una
+-- condición WHEN que compara OLD y NEW, así una fila sin cambios visibles no incrementa la versión.
+--   players                     PlayerOut (/api/players; los nombres también en partidos y equipos)
+--   teams                       nombre, jugadores y categoría (/api/doubles_teams, /api/all_doubles_matches)
+--   tournament_teams_<torneo>   columnas de /api/doubles_teams
+--   matches_<torneo>            columnas de /api/all_matches
+--   doubles_matches_<torneo>    columnas de /api/all_doubles_matches
+-- Fuera quedan p. ej. Players.password_hash, los ignored_bonus_* (ya se reflejan en activity_index_*),
+-- Teams.current_position o el status / positions_swapped de los partidos.
+
+-- Players
+DROP TRIGGER IF EXISTS trg_players_data_version_update;
+CREATE TRIGGER trg_players_data_version_update
+AFTER UPDATE OF
+    first_name, last_name, email, phone, gender, birth_date, location, dominant_hand,
+    backhand_type, racquet, photo_url, initial_position, current_position, points,
+    activity_index_single, challenges_emitted_single, challenges_accepted_single,
+    challenges_won_single, defenses_successful_single, activity_status_single,
+    activity_index_doubles, challenges_emitted_doubles, challenges_accepted_doubles,
+    challenges_won_doubles, defenses_successful_doubles, activity_status_doubles,
+    rejections_current_cycle, rejections_total, activity_status, last_activity_update,
+    last_challenge_received_date
+ON Players
+WHEN OLD.first_name IS NOT NEW.first_name
+  OR OLD.last_name IS NOT NEW.last_name
+  OR OLD.email IS NOT NEW.email
+  OR OLD.phone IS NOT NEW.phone
+  OR OLD.gender IS NOT NEW.gender
+  OR OLD.birth_date IS NOT NEW.birth_date
+  OR OLD.location IS NOT NEW.location
+  OR OLD.dominant_hand IS NOT NEW.dominant_hand
+  OR OLD.backhand_type IS NOT NEW.backhand_type
+  OR OLD.racquet IS NOT NEW.racquet
+  OR OLD.photo_url IS NOT NEW.photo_url
+  OR OLD.initial_position IS NOT NEW.initial_position
+  OR OLD.current_position IS NOT NEW.current_position
+  OR OLD.points IS NOT NEW.points
+  OR OLD.activity_index_single IS NOT NEW.activity_index_single
+  OR OLD.challenges_emitted_single IS NOT NEW.challenges_emitted_single
+  OR OLD.challenges_accepted_single IS NOT NEW.challenges_accepted_single
+  OR OLD.challenges_won_single IS NOT NEW.challenges_won_single
+  OR OLD.defenses_successful_single IS NOT NEW.defenses_successful_single
+  OR OLD.activity_status_single IS NOT NEW.activity_status_single
+  OR OLD.activity_index_doubles IS NOT NEW.activity_index_doubles
+  OR OLD.challenges_emitted_doubles IS NOT NEW.challenges_emitted_doubles
+  OR OLD.challenges_accepted_doubles IS NOT NEW.challenges_accepted_doubles
+  OR OLD.challenges_won_doubles IS NOT NEW.challenges_won_doubles
+  OR OLD.defenses_successful_doubles IS NOT NEW.defenses_successful_doubles
+  OR OLD.activity_status_doubles IS NOT NEW.activity_status_doubles
+  OR OLD.rejections_current_cycle IS NOT NEW.rejections_current_cycle
+  OR OLD.rejections_total IS NOT NEW.rejections_total
+  OR OLD.activity_status IS NOT NEW.activity_status
+  OR OLD.last_activity_update IS NOT NEW.last_activity_update
+  OR OLD.last_challenge_received_date IS NOT NEW.last_challenge_received_date
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value) VALUES ('players_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+-- Teams
+DROP TRIGGER IF EXISTS trg_teams_data_version_update;
+CREATE TRIGGER trg_teams_data_version_update
+AFTER UPDATE OF
+    player1_id, player2_id, team_name, gender_category
+ON Teams
+WHEN OLD.player1_id IS NOT NEW.player1_id
+  OR OLD.player2_id IS NOT NEW.player2_id
+  OR OLD.team_name IS NOT NEW.team_name
+  OR OLD.gender_category IS NOT NEW.gender_category
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value) VALUES ('teams_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+-- TournamentTeams, Matches y DoublesMatches: un contador por torneo
+DROP TRIGGER IF EXISTS trg_tournament_teams_data_version_update;
+CREATE TRIGGER trg_tournament_teams_data_version_update
+AFTER UPDATE OF
+    tournament_id, team_id, tournament_current_position, tournament_initial_position,
+    tournament_points, activity_index_team_doubles, challenges_emitted_team_doubles,
+    challenges_accepted_team_doubles, challenges_won_team_doubles,
+    defenses_successful_team_doubles, rejections_team_doubles_current_cycle,
+    rejections_team_doubles_total, activity_status_team_doubles,
+    last_activity_team_doubles_update
+ON TournamentTeams
+WHEN OLD.tournament_id IS NOT NEW.tournament_id
+  OR OLD.team_id IS NOT NEW.team_id
+  OR OLD.tournament_current_position IS NOT NEW.tournament_current_position
+  OR OLD.tournament_initial_position IS NOT NEW.tournament_initial_position
+  OR OLD.tournament_points IS NOT NEW.tournament_points
+  OR OLD.activity_index_team_doubles IS NOT NEW.activity_index_team_doubles
+  OR OLD.challenges_emitted_team_doubles IS NOT NEW.challenges_emitted_team_doubles
+  OR OLD.challenges_accepted_team_doubles IS NOT NEW.challenges_accepted_team_doubles
+  OR OLD.challenges_won_team_doubles IS NOT NEW.challenges_won_team_doubles
+  OR OLD.defenses_successful_team_doubles IS NOT NEW.defenses_successful_team_doubles
+  OR OLD.rejections_team_doubles_current_cycle IS NOT NEW.rejections_team_doubles_current_cycle
+  OR OLD.rejections_team_doubles_total IS NOT NEW.rejections_team_doubles_total
+  OR OLD.activity_status_team_doubles IS NOT NEW.activity_status_team_doubles
+  OR OLD.last_activity_team_doubles_update IS NOT NEW.last_activity_team_doubles_update
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value)
+    VALUES ('tournament_teams_' || NEW.tournament_id || '_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+DROP TRIGGER IF EXISTS trg_matches_data_version_update;
+CREATE TRIGGER trg_matches_data_version_update
+AFTER UPDATE OF
+    tournament_id, date, challenger_id, challenged_id, winner_id, loser_id, score_text
+ON Matches
+WHEN OLD.tournament_id IS NOT NEW.tournament_id
+  OR OLD.date IS NOT NEW.date
+  OR OLD.challenger_id IS NOT NEW.challenger_id
+  OR OLD.challenged_id IS NOT NEW.challenged_id
+  OR OLD.winner_id IS NOT NEW.winner_id
+  OR OLD.loser_id IS NOT NEW.loser_id
+  OR OLD.score_text IS NOT NEW.score_text
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value)
+    VALUES ('matches_' || NEW.tournament_id || '_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
+
+DROP TRIGGER IF EXISTS trg_doubles_matches_data_version_update;
+CREATE TRIGGER trg_doubles_matches_data_version_update
+AFTER UPDATE OF
+    tournament_id, date, team_a_id, team_b_id, winner_team_id, loser_team_id, score_text
+ON DoublesMatches
+WHEN OLD.tournament_id IS NOT NEW.tournament_id
+  OR OLD.date IS NOT NEW.date
+  OR OLD.team_a_id IS NOT NEW.team_a_id
+  OR OLD.team_b_id IS NOT NEW.team_b_id
+  OR OLD.winner_team_id IS NOT NEW.winner_team_id
+  OR OLD.loser_team_id IS NOT NEW.loser_team_id
+  OR OLD.score_text IS NOT NEW.score_text
+BEGIN
+    INSERT INTO TournamentSettings (setting_name, setting_value)
+    VALUES ('doubles_matches_' || NEW.tournament_id || '_version', '1')
+    ON CONFLICT(setting_name) DO UPDATE SET setting_value = CAST(setting_value AS INTEGER) + 1;
+END;
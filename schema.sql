@@ -1,6 +1,10 @@
 -- schema.sql - Versión Reestructurada para Múltiples Torneos y Ranking Híbrido
 
 -- Elimina TODAS las tablas si ya existen para un reinicio limpio
+-- (y las vistas de actividad de migrations/0003, que dependen de Players y TournamentTeams)
+DROP VIEW IF EXISTS PlayerActivity;
+DROP VIEW IF EXISTS TournamentTeamActivity;
+DROP VIEW IF EXISTS ActivityThresholds;
 DROP TABLE IF EXISTS ActivityLog;
 DROP TABLE IF EXISTS DoublesPartnerRequests;
 DROP TABLE IF EXISTS DoublesMatches;
@@ -15,6 +19,10 @@ DROP TABLE IF EXISTS UserPlayersLink; -- Modificada
 DROP TABLE IF EXISTS Users; -- Modificada
 DROP TABLE IF EXISTS Players; -- Modificada
 DROP TABLE IF EXISTS TournamentSettings;
+DROP TABLE IF EXISTS Sessions; -- Creada por migrations/0004_sessions.sql
+DROP TABLE IF EXISTS IdempotencyKeys; -- Creada por migrations/0008_idempotency_keys.sql
+DROP TABLE IF EXISTS Uploads; -- Creada por migrations/0005_uploads.sql (los archivos huérfanos los reclama `flask reclaim-uploads`)
+DROP TABLE IF EXISTS SchemaMigrations; -- Las migraciones se reaplican tras recrear las tablas
 
 
 CREATE TABLE IF NOT EXISTS Tournaments (
@@ -91,8 +99,8 @@ CREATE TABLE IF NOT EXISTS Players (
     activity_status TEXT DEFAULT 'rojo',
     last_activity_update DATETIME DEFAULT CURRENT_TIMESTAMP,
     last_challenge_received_date DATETIME DEFAULT NULL
-    
-    
+    -- ignored_bonus_single / ignored_bonus_doubles y los triggers que mantienen activity_index_* y
+    -- activity_status_* se añaden en migrations/0003_activity_triggers.sql
 );
 
 -- 4. Tabla de Partidos (Individuales) - Modificada
@@ -166,6 +174,7 @@ CREATE TABLE IF NOT EXISTS TournamentTeams (
     rejections_team_doubles_total INTEGER DEFAULT 0,
     activity_status_team_doubles TEXT DEFAULT 'rojo',
     last_activity_team_doubles_update DATETIME DEFAULT CURRENT_TIMESTAMP,
+    -- ignored_bonus_team_doubles y los triggers de actividad: migrations/0003_activity_triggers.sql
 
     FOREIGN KEY (tournament_id) REFERENCES Tournaments(id),
     FOREIGN KEY (team_id) REFERENCES Teams(id),
@@ -235,7 +244,13 @@ CREATE TABLE IF NOT EXISTS TournamentSettings (
 -- Insertar configuración inicial del ciclo (10 días)
 INSERT OR IGNORE INTO TournamentSettings (setting_name, setting_value) VALUES
 ('cycle_duration_days', '10'),
-('cycle_start_date', STRFTIME('%Y-%m-%d %H:%M:%S', 'now', 'start of day'));
+('cycle_start_date', STRFTIME('%Y-%m-%d %H:%M:%S', 'now', 'start of day')),
+-- Umbrales de actividad: verde >= 12, amarillo >= 6; 2 rechazos en el ciclo fuerzan 'rojo'
+('activity_green_threshold', '12'),
+('activity_yellow_threshold', '6'),
+('activity_max_cycle_rejections', '2');
+-- Los contadores '<nombre>_version' (ETag de los listados) y 'database_version' los crean los
+-- triggers y el INSERT de migrations/0007_data_versions.sql
 -- NUEVO: Podríamos añadir un setting para el torneo_id_activo_actual
 
 -- 12. Tabla de Usuarios (se mantiene, pero ahora UserPlayersLink se encarga de la vinculación)
@@ -3,6 +3,22 @@
 let allPlayers = [];
 let allDoublesTeams = []; // Variable global para almacenar los equipos de dobles
 
+// --- IDEMPOTENCY-KEY PARA ENVÍO DE RESULTADOS ---
+// Una clave por contenido del envío: un doble clic o un reintento tras un corte de red repite la
+// misma clave y el servidor devuelve la respuesta original en vez de registrar el partido otra vez.
+// Tras una respuesta del servidor la clave se descarta, así que un partido nuevo obtiene otra.
+const resultSubmissionKeys = new Map();
+
+function idempotencyKeyFor(body) {
+    if (!resultSubmissionKeys.has(body)) {
+        const key = window.crypto && crypto.randomUUID
+            ? crypto.randomUUID()
+            : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+        resultSubmissionKeys.set(body, key);
+    }
+    return resultSubmissionKeys.get(body);
+}
+
 // --- FUNCIONES DE UTILIDAD DE FECHAS (GLOBALES) ---
 // Función para formatear la fecha a la que el input type="datetime-local" espera
 function formatDateTimeLocal(date) {
@@ -403,16 +419,18 @@ async function submitMatchResult() {
 
     try {
         console.log("Intentando llamar a /api/match_result (backend para enviar resultado).");
+        const body = JSON.stringify({
+            challengerId: parseInt(challengerId),
+            challengedId: parseInt(challengedId),
+            sets: sets,
+            challengeId: hiddenChallengeId ? parseInt(hiddenChallengeId) : null
+        });
         const response = await fetch('/api/match_result', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                challengerId: parseInt(challengerId),
-                challengedId: parseInt(challengedId),
-                sets: sets,
-                challengeId: hiddenChallengeId ? parseInt(hiddenChallengeId) : null
-            })
+            headers: { 'Content-Type': 'application/json', 'Idempotency-Key': idempotencyKeyFor(body) },
+            body: body
         });
+        if (response.status !== 409) resultSubmissionKeys.delete(body); // 409: el envío original sigue en curso
         const data = await response.json();
         console.log("Datos recibidos de /api/match_result:", data);
 
@@ -979,16 +997,18 @@ async function submitDoublesMatchResult() {
 
     try {
         console.log("Intentando llamar a /api/doubles_match_result (backend para enviar resultado de dobles).");
+        const body = JSON.stringify({
+            challengerTeamId: parseInt(challengerTeamId),
+            challengedTeamId: parseInt(challengedTeamId),
+            sets: sets,
+            challengeId: hiddenDoublesChallengeId ? parseInt(hiddenDoublesChallengeId) : null
+        });
         const response = await fetch('/api/doubles_match_result', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                challengerTeamId: parseInt(challengerTeamId),
-                challengedTeamId: parseInt(challengedTeamId),
-                sets: sets,
-                challengeId: hiddenDoublesChallengeId ? parseInt(hiddenDoublesChallengeId) : null
-            })
+            headers: { 'Content-Type': 'application/json', 'Idempotency-Key': idempotencyKeyFor(body) },
+            body: body
         });
+        if (response.status !== 409) resultSubmissionKeys.delete(body); // 409: el envío original sigue en curso
         const data = await response.json();
         console.log("Datos recibidos de /api/doubles_match_result:", data);
 
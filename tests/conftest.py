@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    """app.py sobre una tournament.db nueva (schema.sql + migraciones + admin inicial) por test."""
+    flask_app = app_module.app
+    flask_app.config.update(TESTING=True, DATABASE=str(tmp_path / 'tournament.db'))
+    # Cachés por proceso ligadas a la DB anterior
+    app_module._active_tournament_cache.update(version=None, ids={})
+    app_module._ladder_indexes.clear()
+    with flask_app.app_context():
+        app_module.init_db()
+        app_module.create_initial_admin()
+    yield flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def db(app):
+    with app.app_context():
+        yield app_module.get_db()
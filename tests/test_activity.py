@@ -0,0 +1,30 @@
+def _login_admin(client):
+    client.post('/login', data={'username_or_email': 'admin', 'password': 'password'})
+
+
+def test_reset_cycle_clears_rejections_and_recalculates_status(client, db):
+    db.execute("UPDATE Players SET challenges_won_single = 5, rejections_current_cycle = 2 WHERE id = 1")
+    db.commit()
+    assert db.execute('SELECT activity_status FROM Players WHERE id = 1').fetchone()[0] == 'rojo'
+    _login_admin(client)
+
+    response = client.post('/api/reset_cycle_activity')
+
+    assert response.status_code == 200
+    player = db.execute('SELECT rejections_current_cycle, activity_status FROM Players WHERE id = 1').fetchone()
+    assert tuple(player) == (0, 'verde')
+
+
+def test_activity_triggers_skip_rows_whose_counters_do_not_change(db):
+    # Estado alterado a mano: solo se recalcularía si el trigger saltara
+    db.execute("UPDATE Players SET activity_status = 'manual'")
+    db.execute("UPDATE TournamentTeams SET activity_status_team_doubles = 'manual'")
+    db.execute("UPDATE Players SET rejections_current_cycle = rejections_current_cycle")
+    db.execute("UPDATE TournamentTeams SET rejections_team_doubles_current_cycle = rejections_team_doubles_current_cycle")
+    assert db.execute("SELECT COUNT(*) FROM Players WHERE activity_status <> 'manual'").fetchone()[0] == 0
+    assert db.execute(
+        "SELECT COUNT(*) FROM TournamentTeams WHERE activity_status_team_doubles <> 'manual'").fetchone()[0] == 0
+
+    db.execute("UPDATE Players SET challenges_emitted_single = challenges_emitted_single + 1 WHERE id = 1")
+    assert db.execute("SELECT activity_status FROM Players WHERE id = 1").fetchone()[0] != 'manual'
+    db.rollback()
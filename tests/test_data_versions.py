@@ -0,0 +1,28 @@
+import re
+
+import app as app_module
+
+
+def _version(db, name):
+    row = db.execute('SELECT setting_value FROM TournamentSettings WHERE setting_name = ?', (name,)).fetchone()
+    return int(row[0]) if row else 0
+
+
+def test_players_version_ignores_columns_and_rows_the_listing_does_not_show(db):
+    before = _version(db, 'players_version')
+    db.execute("UPDATE Players SET password_hash = 'x'")
+    db.execute("UPDATE Players SET first_name = first_name")
+    assert _version(db, 'players_version') == before
+
+    db.execute("UPDATE Players SET first_name = first_name || '!' WHERE id = 1")
+    assert _version(db, 'players_version') == before + 1
+    db.rollback()
+
+
+def test_players_version_trigger_covers_every_listed_column(db):
+    trigger_sql = db.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_players_data_version_update'"
+    ).fetchone()[0]
+    update_of = re.search(r'UPDATE OF(.*?)\sON Players', trigger_sql, re.S).group(1)
+    watched = {column.strip() for column in update_of.split(',')}
+    assert set(app_module._struct_db_columns(app_module.PlayerOut)) - {'id'} <= watched
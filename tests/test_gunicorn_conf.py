@@ -0,0 +1,18 @@
+import os
+import runpy
+from types import SimpleNamespace
+
+from prometheus_client import multiprocess
+
+GUNICORN_CONF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gunicorn.conf.py')
+
+
+def test_child_exit_marks_the_worker_dead_in_the_master(monkeypatch, tmp_path):
+    dead = []
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+    monkeypatch.setattr(multiprocess, 'mark_process_dead', dead.append)
+    child_exit = runpy.run_path(GUNICORN_CONF)['child_exit']
+
+    child_exit(server=None, worker=SimpleNamespace(pid=4321))
+
+    assert dead == [4321]
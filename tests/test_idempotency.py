@@ -0,0 +1,43 @@
+import app as app_module
+
+RESULT = {'challengerId': 4, 'challengedId': 2, 'sets': [[6, 1], [6, 2]]}
+
+
+def _login_admin(client):
+    client.post('/login', data={'username_or_email': 'admin', 'password': 'password'})
+
+
+def _match_count(db):
+    return db.execute('SELECT COUNT(*) FROM Matches').fetchone()[0]
+
+
+def test_retry_replays_the_response_stored_with_the_result(client, db):
+    matches_before = _match_count(db)
+    _login_admin(client)
+
+    first = client.post('/api/match_result', json=RESULT, headers={'Idempotency-Key': 'k1'})
+    retry = client.post('/api/match_result', json=RESULT, headers={'Idempotency-Key': 'k1'})
+
+    assert first.status_code == 200
+    assert retry.status_code == 200
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_data() == first.get_data()
+    assert _match_count(db) == matches_before + 1
+
+
+def test_view_that_lost_its_claim_rolls_back_its_write(client, db, monkeypatch):
+    begin_immediate = app_module.begin_immediate
+
+    def begin_and_lose_claim(conn, name):
+        begin_immediate(conn, name)
+        # Un reintento tomó la reserva caducada mientras la vista seguía en curso
+        conn.execute('UPDATE IdempotencyKeys SET created_at = created_at + 1')
+
+    monkeypatch.setattr(app_module, 'begin_immediate', begin_and_lose_claim)
+    matches_before = _match_count(db)
+    _login_admin(client)
+
+    response = client.post('/api/match_result', json=RESULT, headers={'Idempotency-Key': 'k2'})
+
+    assert response.status_code == 409
+    assert _match_count(db) == matches_before
@@ -0,0 +1,62 @@
+import app as app_module
+
+
+def _register(client, username, email):
+    response = client.post('/register', data={
+        'username': username, 'email': email, 'password': 'secreto123', 'confirm_password': 'secreto123',
+    })
+    assert response.status_code == 302
+
+
+def _profile_form(email):
+    return {
+        'first_name': 'Ana', 'last_name': 'Pérez', 'email': email, 'gender': 'Femenino',
+        'birth_date': '1990-05-01', 'location': 'Ciudad',
+    }
+
+
+def test_complete_profile_links_existing_unlinked_player(client, db):
+    # Jugador cargado por el organizador, todavía sin cuenta de usuario
+    player_id = db.execute(
+        """INSERT INTO Players (first_name, last_name, email, gender, birth_date, initial_position, current_position)
+           VALUES ('Ana', 'P', 'ana@example.com', 'Femenino', '1990-05-01',
+                   (SELECT MAX(current_position) + 1 FROM Players), (SELECT MAX(current_position) + 1 FROM Players))"""
+    ).lastrowid
+    db.commit()
+    _register(client, 'ana', 'ana@example.com')
+
+    response = client.post('/complete_player_profile', data=_profile_form('ana@example.com'))
+
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['player_id'] == player_id
+    with client.session_transaction() as session:
+        assert session['player_id'] == player_id
+    link = db.execute('SELECT player_id FROM UserPlayersLink WHERE player_id = ?', (player_id,)).fetchone()
+    assert link is not None
+
+
+def test_complete_profile_creates_new_player_at_the_bottom(client, db):
+    last_position = db.execute('SELECT MAX(current_position) FROM Players').fetchone()[0]
+    _register(client, 'bea', 'bea@example.com')
+
+    response = client.post('/complete_player_profile', data=_profile_form('bea@example.com'))
+
+    assert response.status_code == 200, response.get_json()
+    player = db.execute('SELECT email, current_position FROM Players WHERE id = ?',
+                        (response.get_json()['player_id'],)).fetchone()
+    assert tuple(player) == ('bea@example.com', last_position + 1)
+
+
+def test_complete_profile_returns_503_while_the_write_lock_is_busy(client, db, monkeypatch):
+    def busy(conn, name):
+        raise app_module.WriteLockTimeout(f"Base de datos ocupada ({name}).")
+
+    monkeypatch.setattr(app_module, 'begin_immediate', busy)
+    players_before = db.execute('SELECT COUNT(*) FROM Players').fetchone()[0]
+    _register(client, 'carla', 'carla@example.com')
+
+    response = client.post('/complete_player_profile', data=_profile_form('carla@example.com'))
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '2'
+    assert db.execute('SELECT COUNT(*) FROM Players').fetchone()[0] == players_before
@@ -0,0 +1,112 @@
+import re
+
+import pytest
+
+import app as app_module
+
+# Endpoints GET de los caminos calientes (los que sirven las páginas de la pirámide y del jugador)
+HOT_ROUTES = [
+    '/api/players',
+    '/api/doubles_teams?gender=Masculino',
+    '/api/pending_doubles_challenges',
+    '/api/all_matches',
+    '/api/all_doubles_matches?gender=Masculino',
+    '/api/pending_challenges',
+    '/api/players/1/history',
+    '/api/player_data/me',
+    '/api/players/search_partners?tournament_id=2&tournament_gender_type=pyramid_doubles_male&q=a',
+    '/api/global_doubles_teams',
+    '/api/doubles/my_partner_requests',
+    '/api/doubles/my_global_teams?gender_category=Masculino',
+    '/player/1',
+]
+
+# Búsquedas por clave primaria o UNIQUE: una fila como mucho, no necesitan estar registradas
+_UNIQUE_LOOKUP_RE = re.compile(r'^SEARCH \w+(?: AS \w+)? USING (?:INTEGER PRIMARY KEY|(?:COVERING )?INDEX sqlite_autoindex_)')
+
+
+def _is_unique_lookup(db, sql, params):
+    plan = [row[3] for row in db.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+    return all(_UNIQUE_LOOKUP_RE.match(line) for line in plan)
+
+
+@pytest.fixture
+def executed(app, db, monkeypatch):
+    """Sentencias que ejecutan las peticiones del test, con el admin ya logueado y con perfil de jugador."""
+    statements = []
+    record = app_module.SQLRequestStats.record
+
+    def record_and_keep(stats, sql, seconds):
+        statements.append(sql)
+        record(stats, sql, seconds)
+
+    monkeypatch.setattr(app_module.SQLRequestStats, 'record', record_and_keep)
+    # El admin con perfil de jugador, para que las rutas del jugador lleguen a sus consultas
+    db.execute(
+        """INSERT INTO UserPlayersLink (user_id, player_id)
+           SELECT (SELECT id FROM Users WHERE username = 'admin'), MIN(id) FROM Players
+           WHERE gender = 'Masculino' AND id NOT IN (SELECT player_id FROM UserPlayersLink)
+             AND id NOT IN (SELECT player1_id FROM Teams UNION SELECT player2_id FROM Teams)"""
+    )
+    db.commit()
+    return statements
+
+
+def _login_admin(client, executed):
+    client.post('/login', data={'username_or_email': 'admin', 'password': 'password'})
+    executed.clear()
+
+
+def _unregistered(db, executed):
+    registered = {app_module.normalize_sql(sql) for _, sql, _ in app_module.HOT_PATH_QUERIES}
+    missing = []
+    for sql in executed:
+        if not sql.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE')):
+            continue
+        if app_module.normalize_sql(sql) in registered:
+            continue
+        if not _is_unique_lookup(db, sql, (1,) * sql.count('?')):
+            missing.append(' '.join(sql.split()))
+    return missing
+
+
+@pytest.mark.parametrize('route', HOT_ROUTES)
+def test_hot_route_statements_are_in_the_query_registry(client, db, executed, route):
+    _login_admin(client, executed)
+
+    response = client.get(route)
+    response.get_data() # Los listados en streaming ejecutan su consulta al leer el cuerpo
+
+    assert response.status_code < 500
+    assert _unregistered(db, executed) == []
+
+
+def test_partner_request_and_team_statements_are_in_the_query_registry(client, db, executed):
+    admin_player = db.execute(
+        "SELECT player_id FROM UserPlayersLink WHERE user_id = (SELECT id FROM Users WHERE username = 'admin')"
+    ).fetchone()[0]
+    tournament_id = db.execute(
+        "SELECT id FROM Tournaments WHERE type = 'pyramid_doubles_male' AND is_active = 1"
+    ).fetchone()[0]
+    free_players = [row[0] for row in db.execute(
+        """SELECT id FROM Players WHERE gender = 'Masculino' AND id != ?
+             AND id NOT IN (SELECT player1_id FROM Teams UNION SELECT player2_id FROM Teams)
+           ORDER BY id LIMIT 3""", (admin_player,)
+    )]
+    request_id = db.execute(
+        "INSERT INTO DoublesPartnerRequests (tournament_id, requester_player_id, requested_player_id) VALUES (?, ?, ?)",
+        (tournament_id, free_players[0], admin_player)
+    ).lastrowid
+    db.commit()
+    _login_admin(client, executed)
+
+    responses = [
+        client.post('/api/doubles/request_partner_v2',
+                    json={'requested_player_id': free_players[0], 'tournament_id': tournament_id}),
+        client.post(f'/api/doubles/respond_partner_request/{request_id}', json={'action': 'accept'}),
+        client.post('/api/doubles_teams',
+                    json={'player1_id': free_players[1], 'player2_id': free_players[2], 'team_name': 'X/Y'}),
+    ]
+
+    assert [response.status_code for response in responses] == [409, 200, 201]
+    assert _unregistered(db, executed) == []